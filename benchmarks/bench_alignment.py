@@ -0,0 +1,101 @@
+"""Benchmark: tiered page alignment vs the previous ORB brute-force matcher.
+
+Renders a synthetic form, moves it by a small offset and rotation (the usual
+scanner case) or by a large rotation and scale, and times the previous
+full-resolution ORB + cross-check matcher against ``preprocess.align_page``
+(phase correlation / ECC first, ORB + LSH ratio test + RANSAC as fallback).
+The tier used and the worst corner error in pixels are reported::
+
+    python benchmarks/bench_alignment.py --dpi 300 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from core import preprocess  # noqa: E402
+
+
+def legacy_alignment(reference: preprocess.ReferenceFeatures, image: np.ndarray) -> Optional[np.ndarray]:
+    """Previous implementation: full-resolution ORB, cross-check matcher, top 50 matches."""
+    orb = cv2.ORB_create()
+    kp2, des2 = orb.detectAndCompute(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), None)
+    if des2 is None or reference.descriptors is None:
+        return None
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(reference.descriptors, des2)
+    matches = sorted(matches, key=lambda x: x.distance)[:50]
+    if len(matches) < 3:
+        return None
+    src = reference.points[[m.queryIdx for m in matches]].reshape(-1, 1, 2)
+    dst = np.float32([kp2[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+    return cv2.estimateAffinePartial2D(src, dst)[0]
+
+
+def render_form(dpi: int) -> np.ndarray:
+    """A4 form with labelled boxes."""
+    w, h = int(8.27 * dpi), int(11.69 * dpi)
+    form = np.full((h, w, 3), 255, dtype=np.uint8)
+    scale = dpi / 150
+    step = int(80 * scale)
+    for i, y in enumerate(range(step, h - step, step)):
+        cv2.putText(form, f"Item {i} Code {i * 41}", (int(w * 0.06) + 5 * i, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    scale, (0, 0, 0), max(1, int(1.5 * scale)))
+        cv2.rectangle(form, (int(w * 0.05), y + int(10 * scale)), (int(w * 0.9), y + int(40 * scale)), (0, 0, 0), 2)
+    return form
+
+
+def corner_error(M: Optional[np.ndarray], truth: np.ndarray, shape: Tuple[int, int]) -> float:
+    if M is None:
+        return float("inf")
+    h, w = shape
+    corners = np.array([[0, w, 0, w], [0, 0, h, h], [1, 1, 1, 1]], dtype=np.float64)
+    return float(np.abs(M @ corners - truth @ corners).max())
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    times: List[float] = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dpi", type=int, nargs="+", default=[200, 300])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = [("shift", 0.0, 1.0), ("shift+0.7deg", 0.7, 1.0), ("shift+2deg", 2.0, 1.0), ("20deg x1.1", 20.0, 1.1)]
+    print(f"{'dpi':>4} {'case':>14} | {'legacy ms':>9} {'err px':>7} | {'tiered ms':>9} {'err px':>7} {'tier':>9}")
+    for dpi in args.dpi:
+        form = render_form(dpi)
+        h, w = form.shape[:2]
+        reference = preprocess.reference_features(form)
+        for label, angle, scale in cases:
+            truth = cv2.getRotationMatrix2D((w / 2, h / 2), angle, scale)
+            truth[:, 2] += [0.01 * w, -0.008 * h]
+            page = cv2.warpAffine(form, truth, (w, h), borderValue=(255, 255, 255))
+            legacy, M = measure(lambda: legacy_alignment(reference, page), args.repeat)
+            tiered, alignment = measure(lambda: preprocess.align_page(reference, page), args.repeat)
+            method = alignment.method if alignment is not None else "-"
+            tiered_M = alignment.transform if alignment is not None else None
+            print(
+                f"{dpi:>4} {label:>14} | {legacy * 1000:>9.1f} {corner_error(M, truth, (h, w)):>7.1f} | "
+                f"{tiered * 1000:>9.1f} {corner_error(tiered_M, truth, (h, w)):>7.1f} {method:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
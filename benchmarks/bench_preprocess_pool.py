@@ -0,0 +1,99 @@
+"""Benchmark: preprocessing throughput in-process vs a pool of worker processes.
+
+Renders synthetic tilted A4 pages and aligns/crops them for a template with
+``--rois`` fields, first one page at a time in this process (what
+``OcrAgent`` does with ``PREPROCESS_WORKERS=0``) and then through
+:class:`core.preprocess_pool.PreprocessPool` with each ``--workers`` count.
+With ``--from-files`` the pool is given PNG paths and decodes in the workers,
+and with ``--reference`` the template has a reference image, so pages are
+aligned with its ORB features::
+
+    python benchmarks/bench_preprocess_pool.py --docs 32 --workers 2 4 8 --reference
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List, Union
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from core.preprocess_pool import PreprocessPool, prepare_crops  # noqa: E402
+from core.template_manager import TemplateManager  # noqa: E402
+
+
+def render_page(dpi: int, angle: float) -> np.ndarray:
+    """A4 page with lines of text, rotated counter-clockwise by ``angle``."""
+    w, h = int(8.27 * dpi), int(11.69 * dpi)
+    page = np.full((h, w, 3), 255, dtype=np.uint8)
+    scale = dpi / 150
+    for y in range(int(h * 0.06), int(h * 0.94), int(45 * scale)):
+        cv2.putText(page, "Invoice 2024-05-01  Total 12,345 JPY", (int(w * 0.06), y),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), max(1, int(1.5 * scale)))
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(page, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=16)
+    parser.add_argument("--rois", type=int, default=12)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--from-files", action="store_true", help="let the workers decode PNG files")
+    parser.add_argument("--reference", action="store_true", help="align against a template reference image")
+    args = parser.parse_args()
+
+    angles = [0.0, 0.8, -1.5, 2.5]
+    pages = [render_page(args.dpi, angles[i % len(angles)]) for i in range(min(args.docs, len(angles)))]
+    h, w = pages[0].shape[:2]
+    rois = {
+        f"field_{i}": {"box": [int(w * 0.1), int(h * (0.05 + 0.9 * i / args.rois)), int(w * 0.5), int(h * 0.04)]}
+        for i in range(args.rois)
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template_data = {"name": "bench", "rois": rois}
+        if args.reference:
+            template_data["template_image_path"] = os.path.join(tmp, "reference.png")
+            cv2.imwrite(template_data["template_image_path"], render_page(args.dpi, 0.0))
+        template = TemplateManager(template_dir=os.path.join(tmp, "templates")).compile(template_data)
+        sources: List[Union[np.ndarray, str]] = [pages[i % len(pages)] for i in range(args.docs)]
+        if args.from_files:
+            paths = []
+            for i, page in enumerate(pages):
+                paths.append(os.path.join(tmp, f"page_{i}.png"))
+                cv2.imwrite(paths[-1], page)
+            sources = [paths[i % len(paths)] for i in range(args.docs)]
+
+        start = time.perf_counter()
+        for source in sources:
+            image = cv2.imread(source) if isinstance(source, str) else source
+            prepare_crops(image, template.boxes, template.reference)
+        baseline = time.perf_counter() - start
+        print(f"{'mode':>12} | {'seconds':>8} | {'docs/s':>7} | speed-up")
+        print(f"{'in-process':>12} | {baseline:>8.2f} | {args.docs / baseline:>7.1f} |   1.0x")
+
+        for workers in args.workers:
+            with PreprocessPool(workers) as pool:
+
+                async def run_all() -> None:
+                    await asyncio.gather(*(pool.crop(source, template) for source in sources))
+
+                asyncio.run(pool.crop(sources[0], template))  # ワーカーの起動を計測から除く
+                start = time.perf_counter()
+                asyncio.run(run_all())
+                elapsed = time.perf_counter() - start
+            print(f"{f'{workers} workers':>12} | {elapsed:>8.2f} | {args.docs / elapsed:>7.1f} | {baseline / elapsed:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark: per-page skew correction time, full-resolution vs downscaled.
+
+Renders synthetic text pages at the requested DPI, rotates them by a few
+angles and times the previous full-resolution ``correct_skew`` against the
+current one (downscaled estimate, projection-profile refinement and no
+rotation below ``SKEW_TOLERANCE``)::
+
+    python benchmarks/bench_skew.py --dpi 300 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from core import preprocess  # noqa: E402
+
+
+def legacy_correct_skew(image: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Previous implementation: Hough on the full page and an unconditional warp."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=30, minLineLength=30, maxLineGap=10)
+    if lines is None:
+        return image, 0.0
+    angles = []
+    for line in lines:
+        x1, y1, x2, y2 = line[0]
+        angles.append(np.degrees(np.arctan2(y2 - y1, x2 - x1)))
+    median_angle = float(np.median(angles))
+    (h, w) = image.shape[:2]
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), median_angle, 1.0)
+    rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    return rotated, median_angle
+
+
+def render_page(dpi: int, angle: float) -> np.ndarray:
+    """A4 page with lines of text, rotated counter-clockwise by ``angle``."""
+    w, h = int(8.27 * dpi), int(11.69 * dpi)
+    page = np.full((h, w, 3), 255, dtype=np.uint8)
+    scale = dpi / 150
+    for y in range(int(h * 0.06), int(h * 0.94), int(45 * scale)):
+        cv2.putText(
+            page,
+            "Invoice 2024-05-01  Total 12,345 JPY  Tokyo",
+            (int(w * 0.06), y),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            scale,
+            (0, 0, 0),
+            max(1, int(1.5 * scale)),
+        )
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(page, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def measure(fn: Callable[[np.ndarray], Tuple[np.ndarray, float]], page: np.ndarray, repeat: int) -> Tuple[float, float]:
+    times: List[float] = []
+    angle = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, angle = fn(page)
+        times.append(time.perf_counter() - start)
+    return min(times), angle
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dpi", type=int, nargs="+", default=[300, 600])
+    parser.add_argument("--angles", type=float, nargs="+", default=[0.0, 0.5, 2.0, -3.5])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'dpi':>4} {'angle':>6} | {'legacy ms':>9} {'est.':>7} | {'current ms':>10} {'est.':>7} | speed-up")
+    for dpi in args.dpi:
+        for angle in args.angles:
+            page = render_page(dpi, angle)
+            legacy, legacy_angle = measure(legacy_correct_skew, page, args.repeat)
+            current, current_angle = measure(preprocess.deskew, page, args.repeat)
+            print(
+                f"{dpi:>4} {angle:>6.2f} | {legacy * 1000:>9.1f} {legacy_angle:>7.2f} | "
+                f"{current * 1000:>10.1f} {current_angle:>7.2f} | {legacy / current:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
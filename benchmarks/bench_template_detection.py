@@ -0,0 +1,93 @@
+"""Benchmark: visual template detection time and accuracy against the index size.
+
+Saves ``--templates`` synthetic form templates with reference images, then
+fingerprints ``--pages`` filled-in, shifted and noisy copies and detects
+their template with :meth:`TemplateManager.detect_template_image`.  Reports
+the time per page, how many pages were matched correctly and how many were
+left to the OCR keyword path as ambiguous::
+
+    python benchmarks/bench_template_detection.py --templates 10 50 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from core.template_manager import TemplateManager  # noqa: E402
+
+
+def render_form(seed: int) -> np.ndarray:
+    """A4 form at 150 dpi with a random layout of labels, boxes and rules."""
+    rng = np.random.default_rng(seed)
+    page = np.full((1754, 1240, 3), 255, dtype=np.uint8)
+    y = 90
+    while y < 1650:
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.putText(page, f"Label {rng.integers(0, 999)} Field", (int(rng.integers(40, 400)), y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+        elif kind == 1:
+            cv2.rectangle(page, (int(rng.integers(30, 200)), y - 30),
+                          (int(rng.integers(700, 1200)), y + int(rng.integers(20, 120))), (0, 0, 0), 3)
+        else:
+            cv2.line(page, (40, y), (1200, y), (0, 0, 0), 2)
+        y += int(rng.integers(60, 160))
+    return page
+
+
+def fill(form: np.ndarray, seed: int) -> np.ndarray:
+    """Write values into ``form``, then shift, rotate slightly and add noise."""
+    rng = np.random.default_rng(seed)
+    page = form.copy()
+    h, w = page.shape[:2]
+    for _ in range(8):
+        cv2.putText(page, str(rng.integers(0, 99999)), (int(rng.integers(100, w - 300)), int(rng.integers(100, h - 100))),
+                    cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, 1.5, (40, 40, 40), 2)
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), float(rng.uniform(-1.5, 1.5)), 1.0)
+    M[:, 2] += rng.uniform(-30, 30, 2)
+    page = cv2.warpAffine(page, M, (w, h), borderValue=(255, 255, 255))
+    return np.clip(page + rng.normal(0, 8, page.shape), 0, 255).astype(np.uint8)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--templates", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'templates':>9} | {'ms/page':>7} | {'correct':>7} | {'wrong':>5} | ambiguous")
+    for count in args.templates:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = TemplateManager(template_dir=tmp)
+            for i in range(count):
+                image_path = os.path.join(tmp, f"form_{i}.png")
+                cv2.imwrite(image_path, render_form(i))
+                manager.save(f"form_{i}", {"name": f"form_{i}", "rois": {}, "template_image_path": image_path})
+            manager.rank_images(render_form(0), 1)  # 索引の構築を計測から除く
+
+            pages = [(i % count, fill(render_form(i % count), 1000 + i)) for i in range(args.pages)]
+            correct = wrong = ambiguous = 0
+            start = time.perf_counter()
+            for expected, page in pages:
+                match = manager.detect_template_image(page)
+                if match is None:
+                    ambiguous += 1
+                elif match[0] == f"form_{expected}":
+                    correct += 1
+                else:
+                    wrong += 1
+            elapsed = time.perf_counter() - start
+        print(f"{count:>9} | {1000 * elapsed / len(pages):>7.1f} | {correct:>7} | {wrong:>5} | {ambiguous:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark: sequential vs concurrent primary/validator calls per ROI.
+
+Uses a dummy engine with injected latency so the numbers only reflect the
+scheduling of the two model calls::
+
+    python benchmarks/bench_validator_concurrency.py --rois 10 --primary 0.3 --validator 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from core.ocr_bridge import BaseOCR, DummyOCR  # noqa: E402
+from core.ocr_processor import OCRProcessor  # noqa: E402
+
+
+class LatencyOCR(DummyOCR):
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+    async def run(self, image):
+        await asyncio.sleep(self.latency)
+        return await super().run(image)
+
+
+class SequentialProcessor(OCRProcessor):
+    """Previous behaviour: the validator starts after the primary returns."""
+
+    async def _run_engines(self, key, filename, primary_input, validator_input):
+        primary = await self.primary_engine.run(primary_input)
+        secondary = await self.validator_engine.run(validator_input)
+        return self._evaluate(key, filename, primary, secondary)
+
+
+def measure(cls, workspace: str, primary: BaseOCR, validator: BaseOCR) -> float:
+    # 無地の切り出し画像が空欄として省略されないよう空欄判定は切る
+    processor = cls(primary, workspace, validator_engine=validator, blank_detection=False)
+    start = time.perf_counter()
+    asyncio.run(processor.process_all())
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rois", type=int, default=10)
+    parser.add_argument("--primary", type=float, default=0.3)
+    parser.add_argument("--validator", type=float, default=0.2)
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix="aiocr_bench_")
+    crops = os.path.join(workspace, "crops")
+    os.makedirs(crops)
+    for i in range(args.rois):
+        cv2.imwrite(os.path.join(crops, f"P{i + 1}_field_{i}.png"), np.zeros((40, 200, 3), np.uint8))
+
+    primary, validator = LatencyOCR(args.primary), LatencyOCR(args.validator)
+    sequential = measure(SequentialProcessor, workspace, primary, validator)
+    concurrent = measure(OCRProcessor, workspace, primary, validator)
+    print(f"sequential: {sequential * 1000:8.1f} ms  (expected ~{(args.primary + args.validator) * 1000:.0f})")
+    print(f"concurrent: {concurrent * 1000:8.1f} ms  (expected ~{max(args.primary, args.validator) * 1000:.0f})")
+    print(f"speed-up:   {sequential / concurrent:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Load-test harness for the OCR pipeline against the local mock API.
+
+Drives ``N`` synthetic documents through :class:`core.ocr_agent.OcrAgent`
+using the real OpenAI engine classes pointed at
+:class:`core.mock_openai.MockOpenAIServer`, then reports throughput, per-ROI
+latency percentiles and the concurrency that was actually achieved.
+
+Example::
+
+    python benchmarks/load_test.py --docs 20 --rois 8 --latency 0.3 --rate-limit-rate 0.02
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+from core.db_manager import DBManager  # noqa: E402
+from core.mock_openai import MockConfig, MockOpenAIServer  # noqa: E402
+from core.ocr_agent import OcrAgent  # noqa: E402
+from core.ocr_bridge import BaseOCR, GPT4oMiniVisionOCR, GPT4oNanoVisionOCR  # noqa: E402
+from core.rate_limit import AdaptiveRateLimiter  # noqa: E402
+from core.template_manager import TemplateManager  # noqa: E402
+
+
+class TimedOCR(BaseOCR):
+    """Wrapper recording per-call latency and peak in-flight calls."""
+
+    def __init__(self, engine: BaseOCR) -> None:
+        self.engine = engine
+        self.latencies: List[float] = []
+        self.in_flight = 0
+        self.peak = 0
+
+    @property
+    def accepts_payload(self) -> bool:  # type: ignore[override]
+        return self.engine.accepts_payload
+
+    async def _timed(self, call):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        start = time.perf_counter()
+        try:
+            return await call
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+            self.in_flight -= 1
+
+    async def run(self, image):
+        return await self._timed(self.engine.run(image))
+
+    async def run_batch(self, images):
+        # まとめたリクエストはエンジンにそのまま渡し、1回の呼び出しとして計測する
+        return await self._timed(self.engine.run_batch(images))
+
+    async def aclose(self) -> None:
+        await self.engine.aclose()
+
+
+def make_document(index: int, rois: int) -> tuple[np.ndarray, Dict[str, dict]]:
+    """Synthetic page with one printed field per ROI."""
+    page = np.full((200 + 60 * rois, 800, 3), 255, dtype=np.uint8)
+    boxes = {}
+    for i in range(rois):
+        y = 100 + 60 * i
+        cv2.putText(page, f"{index:04d}-{i:02d}", (60, y + 35), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        boxes[f"field_{i}"] = {"box": [40, y, 400, 50]}
+    return page, boxes
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def run(args: argparse.Namespace) -> Dict[str, float]:
+    config = MockConfig(
+        latency=args.latency,
+        distribution=args.distribution,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    workdir = tempfile.mkdtemp(prefix="aiocr_load_")
+    os.chdir(workdir)
+    with MockOpenAIServer(config) as server:
+        limiter = AdaptiveRateLimiter(
+            requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_concurrency=args.concurrency
+        )
+        primary = TimedOCR(GPT4oMiniVisionOCR(limiter=limiter, base_url=server.base_url))
+        validator = TimedOCR(GPT4oNanoVisionOCR(limiter=limiter, base_url=server.base_url))
+
+        db = DBManager(os.path.join(workdir, "load.db"))
+        db.initialize()
+        job_id = db.create_job("load_test", "load_test")
+        documents = [make_document(i, args.rois) for i in range(args.docs)]
+
+        start = time.perf_counter()
+        validator_engine = None if args.no_validator else validator
+        with OcrAgent(db=db, templates=TemplateManager(os.path.join(workdir, "templates"))) as agent:
+            if args.sequential:
+                for i, (page, rois) in enumerate(documents):
+                    agent.process_document(
+                        page,
+                        f"doc_{i}.png",
+                        {"name": "load_test", "rois": rois, "batch_size": args.batch_size},
+                        primary,
+                        validator_engine=validator_engine,
+                        job_id=job_id,
+                    )
+            else:
+                inputs = (
+                    (f"doc_{i}.png", page, {"name": "load_test", "rois": rois, "batch_size": args.batch_size})
+                    for i, (page, rois) in enumerate(documents)
+                )
+                for result in agent.iter_documents(
+                    inputs,
+                    primary,
+                    validator_engine=validator_engine,
+                    job_id=job_id,
+                    max_in_flight_rois=args.max_in_flight_rois,
+                    max_documents=args.max_documents,
+                ):
+                    if result.error is not None:
+                        raise result.error
+        elapsed = time.perf_counter() - start
+        db.close()
+
+        latencies = primary.latencies + validator.latencies
+        report = {
+            "documents": args.docs,
+            "rois_per_document": args.rois,
+            "elapsed_s": elapsed,
+            "docs_per_sec": args.docs / elapsed if elapsed else 0.0,
+            "roi_latency_p50_ms": percentile(latencies, 50),
+            "roi_latency_p95_ms": percentile(latencies, 95),
+            "roi_latency_p99_ms": percentile(latencies, 99),
+            "client_peak_concurrency": max(primary.peak, validator.peak),
+            "server_peak_concurrency": server.stats.peak_in_flight,
+            "server_requests": server.stats.requests,
+            "server_throttled": server.stats.throttled,
+            "server_errors": server.stats.errors,
+            "limiter_retries": limiter.retries,
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--rois", type=int, default=6)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--no-validator", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rpm", type=float, default=10000)
+    parser.add_argument("--tpm", type=float, default=10_000_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sequential", action="store_true", help="process documents one at a time")
+    parser.add_argument("--max-in-flight-rois", type=int, default=None)
+    parser.add_argument("--max-documents", type=int, default=None)
+    report = run(parser.parse_args())
+    for key, value in report.items():
+        print(f"{key:>26}: {value:.2f}" if isinstance(value, float) else f"{key:>26}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import Any, Dict, List
 
 from pathlib import Path
 
@@ -11,6 +11,7 @@ import streamlit as st
 from streamlit_drawable_canvas import st_canvas
 
 from app.cache_utils import get_template_manager, list_templates
+from core.keyword_index import format_keywords, parse_keywords
 
 
 NEW_TEMPLATE = "新規作成"
@@ -45,7 +46,7 @@ def main() -> None:
     template_name = st.text_input("テンプレート名", value="" if selection == NEW_TEMPLATE else selection)
 
     existing_rois: Dict[str, Dict[str, List[int]]] = {}
-    existing_keywords: List[str] = []
+    existing_keywords: List[Any] = []
     if selection != NEW_TEMPLATE:
         try:
             existing = manager.load(selection)
@@ -57,8 +58,8 @@ def main() -> None:
     uploaded = st.file_uploader("基準画像をアップロード", type=["png", "jpg", "jpeg"])
 
     keywords_text = st.text_input(
-        "キーワード (カンマ区切り)",
-        value=", ".join(existing_keywords),
+        "キーワード (カンマ区切り、`請求書^2` のように ^ で重みを指定)",
+        value=format_keywords(existing_keywords),
     )
 
     if uploaded is None:
@@ -111,9 +112,7 @@ def main() -> None:
         elif not roi_definitions:
             st.error("ROIを少なくとも1つ描画してください。")
         else:
-            keywords = [
-                kw.strip() for kw in keywords_text.split(",") if kw.strip()
-            ]
+            keywords = parse_keywords(keywords_text)
 
             # save uploaded reference image
             suffix = Path(uploaded.name).suffix or ".png"
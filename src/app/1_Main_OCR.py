@@ -1,30 +1,48 @@
-import asyncio
 import os
-import tempfile
 import zipfile
-import shutil
-from io import BytesIO
 from datetime import datetime
+from functools import partial
+from typing import Callable
 
-import cv2
-import numpy as np
 import streamlit as st
 
+from core.batch_api import BatchJob, OpenAIBatchClient
 from core.ocr_bridge import DummyOCR, GPT4oMiniVisionOCR, GPT4oNanoVisionOCR
-from app.cache_utils import get_template_manager, get_db_manager, list_templates
+from app.cache_utils import get_template_manager, get_db_manager, get_ocr_cache, list_templates
+from core.circuit_breaker import CircuitBreakerOCR
+from core.ocr_cache import CachedOCR
+from core.config import settings
+from core.glyph_ocr import GlyphClassifierOCR, collect_training_samples, train_classifier
+from core.image_source import FileListSource, FolderImageSource, ImageSource, ZipImageSource
 from core.ocr_agent import OcrAgent
+from core.usage import BudgetExceededError
 
 
-class LocalUploadedFile:
-    """Simple wrapper to mimic Streamlit's UploadedFile for local files."""
+BATCH_DIR = "batches"
 
-    def __init__(self, path: str):
-        self._path = path
-        self.name = os.path.basename(path)
 
-    def read(self) -> bytes:
-        with open(self._path, "rb") as f:
-            return f.read()
+def show_pending_batches() -> None:
+    """List submitted batches and ingest the finished ones."""
+    if not os.path.isdir(BATCH_DIR):
+        return
+    manifests = sorted(f for f in os.listdir(BATCH_DIR) if f.endswith(".manifest.json"))
+    if not manifests:
+        return
+    with st.expander(f"保留中のバッチ ({len(manifests)})"):
+        for name in manifests:
+            path = os.path.join(BATCH_DIR, name)
+            batch = BatchJob.load(path)
+            col1, col2 = st.columns([3, 1])
+            col1.write(f"{batch.batch_id}: {len(batch.documents)} 件")
+            if col2.button("結果を取り込む", key=name):
+                with OcrAgent(db=get_db_manager(), templates=get_template_manager()) as agent:
+                    results = agent.ingest_batch(batch, OpenAIBatchClient())
+                if results is None:
+                    st.info(f"{batch.batch_id} はまだ処理中です")
+                else:
+                    os.rename(path, path + ".done")
+                    st.success(f"{batch.batch_id} の結果を取り込みました")
+                    st.json(results)
 
 
 # テンプレート名と検出キーワードはテンプレートファイル内で管理
@@ -45,8 +63,32 @@ def main() -> None:
         "OCRエンジンを選択",
         ("DummyOCR", "GPT-4.1-mini")
     )
+    use_cache = st.sidebar.checkbox("OCR結果キャッシュを使用", value=True)
+    use_failover = st.sidebar.checkbox(
+        "障害時に自動フェイルオーバー",
+        value=True,
+        help="エラー率や遅延が閾値を超えたエンジンへの呼び出しを止め、GPT-4.1-nanoに切り替えます",
+    )
+    use_local = st.sidebar.checkbox(
+        "数値項目をローカルOCRで先読み",
+        value=os.path.exists(settings.GLYPH_MODEL_PATH),
+        help="数値のみの検証ルールを持つ項目をCPUで読み取り、信頼度が低い場合のみAPIを使用します",
+    )
+    processing_mode = st.sidebar.radio(
+        "処理モード",
+        ("即時", "バッチ (Batch API)"),
+        help="バッチは全ROIのリクエストをBatch APIにまとめて送信し、完了後に結果を取り込みます (最大24時間)",
+    )
+    if st.sidebar.button("ローカルOCRモデルを学習"):
+        samples = collect_training_samples("workspace", get_db_manager())
+        if samples:
+            train_classifier(samples).save(settings.GLYPH_MODEL_PATH)
+            st.sidebar.success(f"{len(samples)} 文字で学習しました")
+        else:
+            st.sidebar.warning("学習に使える確定済みの数値項目がありません")
 
     # --- メイン画面 ---
+    show_pending_batches()
 
     # 1. アップロード形式の選択
     upload_mode = st.radio(
@@ -55,15 +97,16 @@ def main() -> None:
         horizontal=True,
     )
 
-    uploaded_images = []
-    temp_dir: str | None = None
-    cleanup_dir: str | None = None
+    # ソースは実行ボタンが押されたときに開き、処理後に必ず閉じる
+    open_source: Callable[[], ImageSource] | None = None
     if upload_mode == "画像ファイル":
         uploaded_images = st.file_uploader(
             "画像ファイルをアップロードしてください",
-            type=["png", "jpg", "jpeg"],
+            type=["png", "jpg", "jpeg", "tif", "tiff"],
             accept_multiple_files=True,
         ) or []
+        if uploaded_images:
+            open_source = partial(FileListSource, uploaded_images)
     else:
         uploaded_zip = st.file_uploader(
             "ZIPアーカイブをアップロードしてください",
@@ -71,25 +114,21 @@ def main() -> None:
             accept_multiple_files=False,
         )
         folder_path = st.text_input("またはローカルフォルダパスを入力")
-        st.caption("ZIPやフォルダは一時ディレクトリに展開され、含まれる画像が順次処理されます")
+        st.caption("ZIPやフォルダは展開・コピーせず、含まれる画像を1枚ずつ読み込んで順次処理します")
         if uploaded_zip is not None:
-            temp_dir = tempfile.mkdtemp()
-            zip_bytes = BytesIO(uploaded_zip.read())
-            with zipfile.ZipFile(zip_bytes) as zf:
-                zf.extractall(temp_dir)
-            cleanup_dir = temp_dir
+            try:
+                with ZipImageSource(uploaded_zip) as probe:
+                    if len(probe):
+                        open_source = partial(ZipImageSource, uploaded_zip)
+            except zipfile.BadZipFile:
+                st.error("ZIPアーカイブを読み込めません")
         elif folder_path:
             if os.path.isdir(folder_path):
-                temp_dir = tempfile.mkdtemp()
-                shutil.copytree(folder_path, temp_dir, dirs_exist_ok=True)
-                cleanup_dir = temp_dir
+                folder = FolderImageSource(folder_path)
+                if len(folder):
+                    open_source = lambda: folder  # noqa: E731  # 閉じるファイルを持たない
             else:
                 st.error("指定されたフォルダが見つかりません")
-        if temp_dir:
-            for root, _, files in os.walk(temp_dir):
-                for file in files:
-                    if file.lower().endswith((".png", ".jpg", ".jpeg")):
-                        uploaded_images.append(LocalUploadedFile(os.path.join(root, file)))
 
     # テンプレート選択肢を準備
     template_manager = get_template_manager()
@@ -99,11 +138,10 @@ def main() -> None:
         ["自動検出"] + template_names,
     )
 
-    if uploaded_images and template_names:
+    if open_source is not None and template_names:
         if st.button("OCR処理実行"):
             db = get_db_manager()
             job_id = db.create_job(template_option, datetime.now().isoformat())
-            agent = OcrAgent(db=db, templates=template_manager)
 
             # OCRエンジンを選択
             st.write(f"{ocr_engine_choice} でOCR処理を実行しています...")
@@ -112,48 +150,105 @@ def main() -> None:
             else:
                 ocr_engine = DummyOCR()
             nano_engine = GPT4oNanoVisionOCR()
+            if use_cache:
+                cache = get_ocr_cache()
+                ocr_engine = CachedOCR(ocr_engine, cache)
+                nano_engine = CachedOCR(nano_engine, cache)
+            if use_failover:
+                fallback = nano_engine if ocr_engine_choice != "DummyOCR" else None
+                ocr_engine = CircuitBreakerOCR(ocr_engine, fallback=fallback)
+                nano_engine = CircuitBreakerOCR(nano_engine)
+
+            local_engine = None
+            if use_local and os.path.exists(settings.GLYPH_MODEL_PATH):
+                local_engine = GlyphClassifierOCR.from_file(settings.GLYPH_MODEL_PATH)
+
+            batch = None
+            if processing_mode != "即時":
+                if ocr_engine_choice == "DummyOCR":
+                    st.error("バッチモードではGPT-4.1-miniを選択してください")
+                    return
+                batch = BatchJob(os.path.join(BATCH_DIR, f"JOB_{job_id}"))
 
             combined_results = {}
             workspace_dirs = {}
             progress = st.progress(0)
-            total = len(uploaded_images)
+            source = open_source()
+            total = len(source)
 
+            # エージェントを開いたままにし、HTTP接続を全ドキュメントで再利用する
             try:
-                with st.spinner('AI-OCR処理を実行中です (GPT-4.1-nanoでダブルチェック)...'):
+                with OcrAgent(db=db, templates=template_manager) as agent, st.spinner(
+                    'AI-OCR処理を実行中です (GPT-4.1-nanoでダブルチェック)...'
+                ):
                     static_template = None
                     if template_option != "自動検出":
                         static_template = template_manager.load(template_option)
 
-                    for idx, uploaded_image in enumerate(uploaded_images, start=1):
-                        file_bytes = np.asarray(bytearray(uploaded_image.read()), dtype=np.uint8)
-                        image = cv2.imdecode(file_bytes, 1)
-
-                        if template_option == "自動検出":
-                            st.write(f"{uploaded_image.name} のテンプレートを自動検出しています...")
-                            text, _ = asyncio.run(GPT4oNanoVisionOCR().run(image))
-                            detected = template_manager.detect_template(text)
-                            if detected:
-                                _, template_data = detected
-                            else:
-                                st.warning("テンプレートを特定できなかったため、最初のテンプレートを使用します")
-                                template_data = template_manager.load(template_names[0])
-                        else:
-                            template_data = static_template
-
-                        ocr_results, workspace_dir = agent.process_document(
-                            image,
-                            uploaded_image.name,
-                            template_data,
+                    def documents():
+                        # 画像は処理枠が空いた時点で読み込み、全件をメモリに展開しない
+                        for name, image in source:
+                            yield name, image, static_template
+
+                    if batch is not None:
+                        for idx, (name, image, template_data) in enumerate(documents(), start=1):
+                            try:
+                                agent.check_budget()
+                            except BudgetExceededError as exc:
+                                st.warning(f"1日のトークン上限に達したため処理を中断しました: {exc}")
+                                break
+                            if template_data is None:
+                                detected = template_manager.detect_template_image(image)
+                                if detected is None:
+                                    text, _ = agent.recognize(nano_engine, image)
+                                    detected = template_manager.detect_template(text)
+                                template_data = detected[1] if detected else template_manager.load(template_names[0])
+                            workspace_dirs[name] = agent.add_to_batch(
+                                batch,
+                                image,
+                                name,
+                                template_data,
+                                ocr_engine,
+                                validator_engine=nano_engine,
+                                job_id=job_id,
+                            )
+                            progress.progress(min(1.0, idx / total))
+                    else:
+                        # 複数ドキュメントを1つのイベントループで同時処理し、完了順に結果を受け取る
+                        results = agent.iter_documents(
+                            documents(),
                             ocr_engine,
                             validator_engine=nano_engine,
                             job_id=job_id,
+                            local_engine=local_engine,
+                            detect_engine=nano_engine,
+                            default_template=template_manager.load(template_names[0]),
                         )
-                        combined_results[uploaded_image.name] = ocr_results
-                        workspace_dirs[uploaded_image.name] = workspace_dir
-                        progress.progress(idx / total)
+                        for idx, result in enumerate(results, start=1):
+                            if isinstance(result.error, BudgetExceededError):
+                                st.warning(f"1日のトークン上限に達したため {result.image_name} 以降を中断しました")
+                                continue
+                            if result.error is not None:
+                                st.error(f"{result.image_name} の処理に失敗しました: {result.error}")
+                                continue
+                            if not result.template_detected:
+                                st.warning(
+                                    f"{result.image_name}: テンプレートを特定できなかったため、最初のテンプレートを使用しました"
+                                )
+                            combined_results[result.image_name] = result.results
+                            workspace_dirs[result.image_name] = result.workspace_dir
+                            progress.progress(min(1.0, idx / total))
+
+                    if batch is not None:
+                        batch_id = agent.submit_batch(batch, OpenAIBatchClient())
             finally:
-                if cleanup_dir:
-                    shutil.rmtree(cleanup_dir)
+                source.close()
+            for name in source.skipped:
+                st.warning(f"{name} は画像として読み込めなかったためスキップしました")
+
+            if batch is not None:
+                st.success(f"バッチ {batch_id} を送信しました。完了後に「保留中のバッチ」から結果を取り込んでください")
+                return
 
             # 処理完了メッセージと結果を表示
             st.success("処理が完了しました！")
@@ -164,10 +259,49 @@ def main() -> None:
             st.subheader("OCR抽出結果 (extract.json)")
             st.json(combined_results)
 
+            payload = agent.payload_stats.as_dict()
+            if payload["images"]:
+                st.caption(
+                    f"画像ペイロード: 送信 {payload['bytes_sent']:,} bytes "
+                    f"(削減 {payload['bytes_saved']:,} bytes), "
+                    f"推定画像トークン {payload['tokens']:,} (削減 {payload['tokens_saved']:,})"
+                )
+            job_usage = db.usage_summary("job", job_id)
+            if job_usage:
+                totals = job_usage[0]
+                st.caption(
+                    f"API使用量: {totals['calls']} 回, "
+                    f"トークン {totals['prompt_tokens'] + totals['completion_tokens']:,}, "
+                    f"推定コスト ${totals['cost_usd']:.4f}, 平均レイテンシ {totals['avg_latency_ms']:.0f} ms"
+                )
+            if agent.alignment_stats:
+                tiers = ", ".join(f"{method} {count}" for method, count in sorted(agent.alignment_stats.items()))
+                st.caption(f"位置合わせ: {tiers} 件")
+            saved = [row for row in db.calls_saved(job_id) if row["reason"] == "blank"]
+            if saved:
+                st.caption(f"空欄スキップ: {saved[0]['fields']} 項目 (API呼び出し {saved[0]['calls']} 回を省略)")
+            if use_cache:
+                stats = cache.stats()
+                st.caption(
+                    f"キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']} "
+                    f"(ヒット率 {stats['hit_rate']*100:.1f}%)"
+                )
+
+            retryable = sum(
+                1 for results in combined_results.values() for info in results.values() if info.get("retryable")
+            )
+            if retryable:
+                st.warning(f"{retryable} 項目はOCRに失敗したため再実行待ちとして保存しました")
+            if use_failover and ocr_engine.failovers:
+                st.caption(f"フェイルオーバー: {ocr_engine.failovers} 件を GPT-4.1-nano で処理しました")
+
             st.subheader("信頼度とダブルチェック結果")
             for img_name, ocr_result in combined_results.items():
                 st.markdown(f"### {img_name}")
                 for field, info in ocr_result.items():
+                    if info.get("retryable"):
+                        st.write(f"🔁 {field}: 再実行待ち")
+                        continue
                     conf_score = info.get("confidence", 0.0)
                     level = info.get("confidence_level", "")
                     needs_human = info.get("needs_human", False)
@@ -12,6 +12,7 @@ import streamlit as st
 
 from core.template_manager import TemplateManager
 from core.db_manager import DBManager
+from core.ocr_cache import OCRCache
 
 
 @st.cache_resource
@@ -28,6 +29,12 @@ def get_db_manager() -> DBManager:
     return db
 
 
+@st.cache_resource
+def get_ocr_cache() -> OCRCache:
+    """Return the shared :class:`OCRCache` instance."""
+    return OCRCache()
+
+
 @st.cache_data
 def list_templates() -> list[str]:
     """Return available template names with data caching."""
@@ -9,7 +9,7 @@ st.title("レビュー")
 WORKSPACE_DIR = "workspace"
 
 
-def save_correction(item: dict, new_text: str, add_dict: bool) -> None:
+def save_correction(item: dict, new_text: str, add_dict: bool, field_only: bool = False) -> None:
     """Persist corrected text to JSON, DB and optional dictionaries."""
     item["data"][item["key"]]["text"] = new_text
     item["data"][item["key"]].pop("needs_human", None)
@@ -25,6 +25,8 @@ def save_correction(item: dict, new_text: str, add_dict: bool) -> None:
     corrections_path = os.path.join(WORKSPACE_DIR, "corrections.jsonl")
     if add_dict:
         entry = {"wrong": item["text"], "correct": new_text}
+        if field_only:
+            entry["roi"] = item["key"]
         with open(corrections_path, "a", encoding="utf-8") as cf:
             cf.write(json.dumps(entry, ensure_ascii=False) + "\n")
 
@@ -34,7 +36,9 @@ def save_correction(item: dict, new_text: str, add_dict: bool) -> None:
                 tdata = json.load(tf)
             template_name = tdata.get("name")
             tm = get_template_manager()
-            tm.append_correction(template_name, item["text"], new_text)
+            tm.append_correction(
+                template_name, item["text"], new_text, roi=item["key"] if field_only else None
+            )
             st.info("テンプレートを更新しました")
         except Exception:
             st.warning("テンプレートの更新に失敗しました")
@@ -84,6 +88,7 @@ else:
         st.text(f"AI結果: {item['text']}")
         new_text = st.text_input("修正後のテキスト", value=item["text"], key=f"text_{idx}")
         add_dict = st.checkbox("辞書に登録", key=f"dict_{idx}")
+        field_only = st.checkbox("この項目のみに適用", key=f"scope_{idx}", disabled=not add_dict)
         if st.button("修正を保存", key=f"save_{idx}"):
-            save_correction(item, new_text, add_dict)
+            save_correction(item, new_text, add_dict, field_only)
             st.success("保存しました")
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from core.dashboard_utils import compute_metrics
+from app.cache_utils import get_db_manager
+from core.config import settings
+from core.dashboard_utils import compute_metrics, compute_template_costs
 
 
 @st.cache_data
@@ -27,3 +29,31 @@ if not daily_df.empty:
     st.line_chart(daily_df)
 else:
     st.info("データがありません")
+
+st.subheader("APIコストとレイテンシ (テンプレート別)")
+db = get_db_manager()
+today = pd.Timestamp.now().strftime("%Y-%m-%d")
+used = db.daily_tokens(today)
+if settings.DAILY_TOKEN_BUDGET:
+    st.metric("本日のトークン使用量", f"{used:,} / {settings.DAILY_TOKEN_BUDGET:,}")
+    st.progress(min(used / settings.DAILY_TOKEN_BUDGET, 1.0))
+else:
+    st.metric("本日のトークン使用量", f"{used:,}")
+
+saved = list(db.calls_saved())
+if saved:
+    st.metric("空欄スキップで省略したAPI呼び出し", f"{sum(row['calls'] for row in saved):,}")
+
+cost_df = compute_template_costs(db)
+if not cost_df.empty:
+    st.dataframe(
+        cost_df.set_index("template_name"),
+        column_config={
+            "cost_usd": st.column_config.NumberColumn("コスト (USD)", format="$%.4f"),
+            "cost_per_document": st.column_config.NumberColumn("1件あたり (USD)", format="$%.5f"),
+            "avg_latency_ms": st.column_config.NumberColumn("平均レイテンシ (ms)", format="%.0f"),
+        },
+    )
+    st.bar_chart(cost_df.set_index("template_name")["cost_usd"])
+else:
+    st.info("API使用量の記録がありません")
@@ -0,0 +1,366 @@
+"""Deferred OCR through the OpenAI Batch API.
+
+For overnight archive runs interactive latency does not matter, so every ROI
+request of a job is written into a JSONL file in Batch API format, submitted
+once and ingested back when the batch has completed.  The submit/poll
+endpoints sit behind :class:`BatchClient`; :class:`LocalBatchClient` answers
+requests locally so the whole flow can be exercised without the API.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import asyncio
+from dataclasses import asdict, dataclass, field
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .config import settings
+from .http_client import HTTPClientPool, default_pool
+from .mock_openai import mock_answer, mock_usage
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Batch API の料金は通常リクエストの半額
+BATCH_DISCOUNT = 0.5
+# 1ファイルあたりの Batch API の上限 (リクエスト数とサイズ)
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+
+@dataclass
+class BatchStatus:
+    """State of a submitted batch."""
+
+    batch_id: str
+    status: str
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+
+class BatchClient(ABC):
+    """Abstract submit/poll/download interface of a batch endpoint."""
+
+    @abstractmethod
+    async def submit(self, jsonl_path: str) -> str:
+        """Upload ``jsonl_path`` and create a batch.  Returns the batch id."""
+
+    @abstractmethod
+    async def status(self, batch_id: str) -> BatchStatus:
+        """Return the current :class:`BatchStatus`."""
+
+    @abstractmethod
+    async def results(self, status: BatchStatus) -> List[Dict[str, Any]]:
+        """Return the output lines of a completed batch."""
+
+    async def aclose(self) -> None:
+        """Release held resources."""
+
+    async def wait(self, batch_id: str, poll_interval: float = 30.0, timeout: Optional[float] = None) -> BatchStatus:
+        """Poll until the batch reaches a terminal state."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            status = await self.status(batch_id)
+            if status.done:
+                return status
+            if deadline is not None and loop.time() >= deadline:
+                raise TimeoutError(f"batch {batch_id} still {status.status}")
+            await asyncio.sleep(poll_interval)
+
+
+class OpenAIBatchClient(BatchClient):
+    """Client for ``/v1/files`` and ``/v1/batches``.
+
+    Like the OCR engines it uses the shared :data:`~core.http_client.default_pool`
+    unless ``client`` is given, and never closes the pool itself.
+    """
+
+    def __init__(
+        self,
+        client: Optional[HTTPClientPool] = None,
+        base_url: Optional[str] = None,
+        completion_window: str = "24h",
+    ) -> None:
+        self.client = client or default_pool
+        self.base_url = (base_url or settings.OPENAI_BASE_URL).rstrip("/")
+        self.completion_window = completion_window
+
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+
+    async def _json(self, method: str, path: str, **kwargs: Any) -> Dict[str, Any]:
+        session = await self.client.get_session()
+        async with session.request(method, f"{self.base_url}{path}", headers=self._headers, **kwargs) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Batch API request failed ({resp.status}): {await resp.text()}")
+            return await resp.json()
+
+    async def submit(self, jsonl_path: str) -> str:
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        with open(jsonl_path, "rb") as f:
+            form.add_field("file", f.read(), filename=Path(jsonl_path).name)
+        uploaded = await self._json("POST", "/files", data=form)
+        batch = await self._json(
+            "POST",
+            "/batches",
+            json={
+                "input_file_id": uploaded["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": self.completion_window,
+            },
+        )
+        return batch["id"]
+
+    async def status(self, batch_id: str) -> BatchStatus:
+        data = await self._json("GET", f"/batches/{batch_id}")
+        return BatchStatus(batch_id, data["status"], data.get("output_file_id"), data.get("error_file_id"))
+
+    async def results(self, status: BatchStatus) -> List[Dict[str, Any]]:
+        if not status.output_file_id:
+            return []
+        session = await self.client.get_session()
+        url = f"{self.base_url}/files/{status.output_file_id}/content"
+        async with session.get(url, headers=self._headers) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Batch output download failed ({resp.status})")
+            text = await resp.text()
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class LocalBatchClient(BatchClient):
+    """In-process stand-in answering each request with ``responder``.
+
+    Parameters
+    ----------
+    responder:
+        Maps a request body to the assistant message content.  Defaults to the
+        deterministic answers of the mock server.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None) -> None:
+        self.responder = responder or (lambda body: mock_answer(body)[0])
+        self._batches: Dict[str, List[Dict[str, Any]]] = {}
+
+    async def submit(self, jsonl_path: str) -> str:
+        batch_id = f"batch_local_{len(self._batches) + 1}"
+        outputs = []
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                body = request["body"]
+                content = self.responder(body)
+                images = sum(
+                    1
+                    for message in body.get("messages", [])
+                    for part in message.get("content", [])
+                    if isinstance(part, dict) and part.get("type") == "image_url"
+                )
+                outputs.append(
+                    {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {
+                                "model": body.get("model", ""),
+                                "choices": [{"message": {"role": "assistant", "content": content}}],
+                                "usage": mock_usage(body, content, images),
+                            },
+                        },
+                        "error": None,
+                    }
+                )
+        self._batches[batch_id] = outputs
+        return batch_id
+
+    async def status(self, batch_id: str) -> BatchStatus:
+        return BatchStatus(batch_id, "completed", output_file_id=batch_id)
+
+    async def results(self, status: BatchStatus) -> List[Dict[str, Any]]:
+        return self._batches.get(status.batch_id, [])
+
+
+@dataclass
+class BatchDocument:
+    """A document whose crops are waiting for batch results."""
+
+    doc_id: str
+    workspace_dir: str
+    image_name: str
+    template_name: str
+    job_id: Optional[int]
+    rois: Dict[str, Any]
+    corrections: List[Dict[str, str]] = field(default_factory=list)
+    #: ROIs detected as empty (not submitted) and their blank confidence.
+    blank: Dict[str, float] = field(default_factory=dict)
+
+
+class BatchJob:
+    """Collect ROI requests of many documents into Batch API files.
+
+    The requests are split into shards of at most ``max_requests`` lines and
+    ``max_bytes`` bytes, the per-file limits of the Batch API, and each shard
+    is submitted as its own batch.  The job, its batch ids and its documents
+    are described by a JSON manifest next to the JSONL files, so results can
+    be ingested from a later session.
+
+    Parameters
+    ----------
+    path:
+        Base path without extension; ``.jsonl`` (``.partN.jsonl`` when the
+        job is split) and ``.manifest.json`` are appended.
+    max_requests, max_bytes:
+        Shard limits, defaulting to the Batch API limits.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_requests: int = MAX_BATCH_REQUESTS,
+        max_bytes: int = MAX_BATCH_BYTES,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.documents: Dict[str, BatchDocument] = {}
+        self.batch_ids: List[str] = []
+        #: Names of the written shard files, in submission order.
+        self.shard_files: List[str] = []
+        self.has_validator = False
+        self._lines: List[str] = []
+
+    @property
+    def batch_id(self) -> Optional[str]:
+        """The submitted batch ids joined for display, ``None`` before submit."""
+        return ", ".join(self.batch_ids) if self.batch_ids else None
+
+    @property
+    def jsonl_path(self) -> Path:
+        return self.path.with_suffix(".jsonl")
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.path.with_suffix(".manifest.json")
+
+    @staticmethod
+    def custom_id(doc_id: str, roi: str, role: str) -> str:
+        return f"{doc_id}|{role}|{roi}"
+
+    def add_request(self, doc_id: str, roi: str, role: str, body: Dict[str, Any]) -> None:
+        line = {
+            "custom_id": self.custom_id(doc_id, roi, role),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }
+        self._lines.append(json.dumps(line, ensure_ascii=False))
+        if role == "validator":
+            self.has_validator = True
+
+    def add_document(self, document: BatchDocument) -> None:
+        self.documents[document.doc_id] = document
+
+    def shards(self) -> List[List[str]]:
+        """Split the request lines at ``max_requests`` lines / ``max_bytes`` bytes."""
+        shards: List[List[str]] = []
+        current: List[str] = []
+        size = 0
+        for line in self._lines:
+            line_size = len(line.encode("utf-8")) + 1
+            if current and (len(current) >= self.max_requests or size + line_size > self.max_bytes):
+                shards.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += line_size
+        if current or not shards:
+            shards.append(current)
+        return shards
+
+    @property
+    def shard_paths(self) -> List[Path]:
+        return [self.path.with_name(name) for name in self.shard_files]
+
+    def write(self) -> List[Path]:
+        """Write the JSONL request files and the manifest.
+
+        Returns the paths of the shards in order: ``jsonl_path`` when the job
+        fits in one file, ``<path>.part1.jsonl``, ``<path>.part2.jsonl``, ...
+        otherwise.  The file names are recorded in the manifest; once written
+        (including for a job restored with :meth:`load`) the files are not
+        rewritten and their paths are returned as they are.
+        """
+        if self.shard_files:
+            return self.shard_paths
+        shards = self.shards()
+        if len(shards) == 1:
+            paths = [self.jsonl_path]
+        else:
+            paths = [self.path.with_suffix(f".part{i}.jsonl") for i in range(1, len(shards) + 1)]
+        for path, lines in zip(paths, shards):
+            with path.open("w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        self.shard_files = [path.name for path in paths]
+        self.save_manifest()
+        return paths
+
+    def save_manifest(self) -> None:
+        manifest = {
+            "batch_ids": self.batch_ids,
+            "shard_files": self.shard_files,
+            "has_validator": self.has_validator,
+            "documents": [asdict(doc) for doc in self.documents.values()],
+        }
+        with self.manifest_path.open("w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, manifest_path: str) -> "BatchJob":
+        path = Path(manifest_path)
+        job = cls(str(path.with_name(path.name[: -len(".manifest.json")])))
+        with path.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        job.batch_ids = list(manifest.get("batch_ids") or [])
+        if not job.batch_ids and manifest.get("batch_id"):
+            # 分割対応前のマニフェストは単一の batch_id を持つ
+            job.batch_ids = [manifest["batch_id"]]
+        job.shard_files = list(manifest.get("shard_files") or [])
+        if not job.shard_files and job.batch_ids:
+            job.shard_files = [job.jsonl_path.name]
+        job.has_validator = manifest.get("has_validator", False)
+        for doc in manifest.get("documents", []):
+            job.add_document(BatchDocument(**doc))
+        return job
+
+    @staticmethod
+    def split_outputs(
+        outputs: List[Dict[str, Any]],
+        parse: Callable[[Dict[str, Any]], Tuple[str, float]],
+    ) -> Dict[str, Dict[str, Dict[str, Tuple[str, float]]]]:
+        """Group output lines as ``{doc_id: {role: {roi: (text, conf)}}}``.
+
+        Lines with an error or a non-200 status are skipped; the caller treats
+        missing ROIs as failed.
+        """
+        grouped: Dict[str, Dict[str, Dict[str, Tuple[str, float]]]] = {}
+        for line in outputs:
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                continue
+            doc_id, role, roi = line["custom_id"].split("|", 2)
+            try:
+                result = parse(response["body"])
+            except (KeyError, IndexError, TypeError):
+                continue
+            grouped.setdefault(doc_id, {}).setdefault(role, {})[roi] = result
+        return grouped
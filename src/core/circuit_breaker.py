@@ -0,0 +1,275 @@
+"""Circuit breaker and failover wrapper for OCR engines."""
+
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Set, Tuple
+
+from .config import settings
+from .ocr_bridge import BaseOCR, OCRError
+from .payload import ImagePayload
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(OCRError):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+# 代替エンジンで処理した呼び出し (単一画像は None、バッチは項目キー)
+_failovers: ContextVar[Optional[Set[Optional[str]]]] = ContextVar("ocr_failovers", default=None)
+
+
+@contextmanager
+def record_failovers() -> Iterator[Set[Optional[str]]]:
+    """Collect the calls of the current task that were answered by a fallback.
+
+    A single-image call adds ``None`` to the yielded set, a batch call the
+    keys of the images read by the fallback engine.  Tasks started inside the
+    block share the set; tasks started before it (e.g. a validator running
+    concurrently) do not.
+    """
+    failed: Set[Optional[str]] = set()
+    token = _failovers.set(failed)
+    try:
+        yield failed
+    finally:
+        _failovers.reset(token)
+
+
+def _note_failover(*keys: Optional[str]) -> None:
+    failed = _failovers.get()
+    if failed is not None:
+        failed.update(keys)
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker.
+
+    The breaker keeps the outcome of the last ``window`` calls.  Calls slower
+    than ``slow_call_seconds`` count as failures.  Once at least ``min_calls``
+    outcomes are recorded and the failure rate reaches ``failure_rate`` the
+    circuit opens and calls are rejected for ``reset_timeout`` seconds.  It
+    then half-opens and lets ``probe_calls`` calls through: a success closes
+    the circuit again, a failure re-opens it.
+
+    Parameters
+    ----------
+    failure_rate:
+        Failure ratio in the window that opens the circuit.
+    window:
+        Number of recent calls considered.
+    min_calls:
+        Minimum number of outcomes before the circuit may open.
+    slow_call_seconds:
+        Latency above which a successful call is still counted as a failure.
+    reset_timeout:
+        Time the circuit stays open before probing.
+    probe_calls:
+        Concurrent calls admitted while half-open.
+    clock:
+        Monotonic time source, replaceable in tests.
+    """
+
+    def __init__(
+        self,
+        failure_rate: Optional[float] = None,
+        window: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        slow_call_seconds: Optional[float] = None,
+        reset_timeout: Optional[float] = None,
+        probe_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_rate = settings.CIRCUIT_FAILURE_RATE if failure_rate is None else failure_rate
+        self.window = settings.CIRCUIT_WINDOW if window is None else window
+        self.min_calls = settings.CIRCUIT_MIN_CALLS if min_calls is None else min_calls
+        self.slow_call_seconds = (
+            settings.CIRCUIT_SLOW_CALL_SECONDS if slow_call_seconds is None else slow_call_seconds
+        )
+        self.reset_timeout = settings.CIRCUIT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.probe_calls = probe_calls
+        self.clock = clock
+        self.state = CLOSED
+        self.opened = 0
+        self._outcomes: Deque[bool] = deque(maxlen=self.window)
+        self._latencies: Deque[float] = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return ``True`` if a call may proceed."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.probe_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success: bool, latency: float = 0.0) -> None:
+        """Record the outcome of an admitted call."""
+        ok = success and latency <= self.slow_call_seconds
+        with self._lock:
+            self._latencies.append(latency)
+            if self.state == HALF_OPEN:
+                self._release()
+                if ok:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(ok)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._trip()
+
+    def release(self) -> None:
+        """Give back the slot of an admitted call that ended without an outcome.
+
+        Used when a call is cancelled, so a half-open probe that never
+        completed does not keep the circuit half-open forever.
+        """
+        with self._lock:
+            self._release()
+
+    def _release(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self.opened += 1
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            latencies = sorted(self._latencies)
+        return {
+            "state": self.state,
+            "opened": self.opened,
+            "error_rate": outcomes.count(False) / len(outcomes) if outcomes else 0.0,
+            "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+        }
+
+
+class CircuitBreakerOCR(BaseOCR):
+    """Engine wrapper failing fast while its engine is unhealthy.
+
+    Engine failures (:class:`~core.ocr_bridge.OCRError`) and slow calls are
+    recorded in a :class:`CircuitBreaker`.  When a call fails or the circuit
+    is open the request goes to ``fallback`` if one is configured (e.g. mini
+    → nano, or a local engine); otherwise :class:`CircuitOpenError` or the
+    original error is raised so the field can be marked retryable.
+
+    Wrap cached engines individually (``CircuitBreakerOCR(CachedOCR(a),
+    fallback=CachedOCR(b))``) so fallback answers are not cached under the
+    primary engine's identity.
+
+    Parameters
+    ----------
+    engine:
+        The engine to protect.
+    breaker:
+        Breaker instance; a default one is created when omitted.
+    fallback:
+        Optional alternate engine.
+    """
+
+    def __init__(
+        self,
+        engine: BaseOCR,
+        breaker: Optional[CircuitBreaker] = None,
+        fallback: Optional[BaseOCR] = None,
+    ) -> None:
+        self.engine = engine
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback = fallback
+        self.rejected = 0
+        self.failovers = 0
+
+    @property
+    def accepts_payload(self) -> bool:  # type: ignore[override]
+        return self.engine.accepts_payload
+
+    def cache_identity(self) -> str:
+        return self.engine.cache_identity()
+
+    def batch_cache_identity(self) -> str:
+        return self.engine.batch_cache_identity()
+
+    async def _failover(self, image: Any, error: OCRError) -> Tuple[str, float]:
+        if self.fallback is None:
+            raise error
+        self.failovers += 1
+        _note_failover(None)
+        if isinstance(image, ImagePayload) and not self.fallback.accepts_payload:
+            image = image.image
+        return await self.fallback.run(image)
+
+    async def run(self, image: Any) -> Tuple[str, float]:
+        if not self.breaker.allow():
+            self.rejected += 1
+            return await self._failover(image, CircuitOpenError(f"{self.cache_identity()} circuit is open"))
+        start = time.monotonic()
+        try:
+            result = await self.engine.run(image)
+        except OCRError as exc:
+            self.breaker.record(False, time.monotonic() - start)
+            return await self._failover(image, exc)
+        except Exception:
+            self.breaker.record(False, time.monotonic() - start)
+            raise
+        except BaseException:
+            # キャンセルされた呼び出しは結果を記録せず、半開時の試行枠だけ返す
+            self.breaker.release()
+            raise
+        self.breaker.record(True, time.monotonic() - start)
+        return result
+
+    async def run_batch(self, images: Dict[str, Any]) -> Dict[str, Tuple[str, float]]:
+        if not self.breaker.allow():
+            self.rejected += 1
+            return await super().run_batch(images)
+        start = time.monotonic()
+        try:
+            results = await self.engine.run_batch(images)
+        except Exception:
+            self.breaker.record(False, time.monotonic() - start)
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record(len(results) == len(images), time.monotonic() - start)
+        missing = {key: image for key, image in images.items() if key not in results}
+        if missing and self.fallback is not None:
+            # 取りこぼした項目だけ代替エンジンで読み直す
+            self.failovers += len(missing)
+            _note_failover(*missing)
+            if not self.fallback.accepts_payload:
+                missing = {
+                    key: image.image if isinstance(image, ImagePayload) else image
+                    for key, image in missing.items()
+                }
+            results.update(await self.fallback.run_batch(missing))
+        return results
+
+    async def aclose(self) -> None:
+        await self.engine.aclose()
+        if self.fallback is not None:
+            await self.fallback.aclose()
@@ -1,8 +1,81 @@
-
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: str = "YOUR_API_KEY_HERE"
+    # ローカルのモックサーバー等に向ける場合に変更する
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+
+    # HTTPコネクションプール設定
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_DNS_CACHE_TTL: int = 300
+    HTTP_KEEPALIVE_TIMEOUT: float = 30.0
+    HTTP_REQUEST_TIMEOUT: float = 60.0
+
+    # レート制限設定 (アカウントのクォータに合わせて調整、RPM/TPM は 0 で無制限)
+    RATE_LIMIT_RPM: int = 500
+    RATE_LIMIT_TPM: int = 200000
+    RATE_LIMIT_MAX_CONCURRENCY: int = 16
+    RATE_LIMIT_MAX_RETRIES: int = 5
+
+    # サーキットブレーカー設定 (エンジン障害時の早期失敗とフェイルオーバー)
+    CIRCUIT_FAILURE_RATE: float = 0.5
+    CIRCUIT_WINDOW: int = 20
+    CIRCUIT_MIN_CALLS: int = 5
+    CIRCUIT_SLOW_CALL_SECONDS: float = 30.0
+    CIRCUIT_RESET_TIMEOUT: float = 30.0
+
+    # 1日あたりのトークン上限 (0 で無制限)。超過すると新しいドキュメントの処理を停止する
+    DAILY_TOKEN_BUDGET: int = 0
+
+    # OCR応答キャッシュ設定
+    OCR_CACHE_PATH: str = "database/ocr_cache.db"
+    OCR_CACHE_MAX_ENTRIES: int = 100000
+    OCR_CACHE_MAX_AGE_DAYS: float = 30.0
+
+    # 画像ペイロード設定 (送信バイト数・画像トークン削減)
+    # グレースケール化は印影や赤字など色で判別する項目を損なうため既定では行わない
+    PAYLOAD_MAX_DIM: int = 1024
+    PAYLOAD_GRAYSCALE: bool = False
+    PAYLOAD_FORMATS: str = "png,jpeg"
+
+    # 複数ドキュメント同時処理時の上限
+    MAX_IN_FLIGHT_ROIS: int = 32
+    MAX_CONCURRENT_DOCUMENTS: int = 8
+
+    # 切り出し画像をバックグラウンドで保存するスレッド数
+    CROP_WRITER_THREADS: int = 4
+
+    # 数値項目用ローカルOCRモデルの保存先
+    GLYPH_MODEL_PATH: str = "database/glyph_model.npz"
+
+    # 前処理(傾き補正・位置合わせ・切り出し)を行うワーカープロセス数 (0 でプロセスプールを使わない)
+    PREPROCESS_WORKERS: int = 0
+    PREPROCESS_START_METHOD: str = "spawn"
+
+    # 傾き補正: 推定は長辺をこの画素数以下に縮小して行い、許容角度未満なら回転しない
+    SKEW_MAX_DIM: int = 1000
+    SKEW_TOLERANCE: float = 0.1
+
+    # 位置合わせ: 長辺がこの画素数を超えるページとテンプレート画像は縮小して特徴点を照合する (0 で縮小しない)
+    ALIGN_MAX_DIM: int = 2000
+    # 高速な位置合わせ (位相限定相関 + ECC) の縮小サイズと、採用するECC相関係数の下限
+    ALIGN_FAST_DIM: int = 256
+    ALIGN_MIN_SCORE: float = 0.8
+    # 平行移動のみ (位相限定相関) の結果は残った回転を落とすので、より高い相関を求める
+    ALIGN_PHASE_MIN_SCORE: float = 0.95
+
+    # 自動検出: 参照画像の指紋 (知覚ハッシュ + ORB記述子) で判定し、類似度が下限未満か
+    # 2位との差が小さい場合だけOCRのキーワード判定に回す
+    FINGERPRINT_DETECTION: bool = True
+    FINGERPRINT_MIN_SCORE: float = 0.7
+    FINGERPRINT_MIN_MARGIN: float = 0.05
+
+    # 空欄判定: 空欄とみなした項目はAPIを呼ばずに空文字として記録する
+    BLANK_DETECTION: bool = True
+    BLANK_MIN_CONFIDENCE: float = 0.5
+    BLANK_MIN_COMPONENT_AREA: int = 12
+    BLANK_MAX_INK_RATIO: float = 0.002
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,183 @@
+"""Compiled correction dictionaries.
+
+Template corrections (``{"wrong": ..., "correct": ...}`` pairs, optionally
+scoped to one ROI with ``"roi"``) are compiled into an Aho-Corasick automaton
+which rewrites a string in a single pass.  Overlapping patterns are resolved
+with leftmost-longest semantics: among matches starting at the earliest
+position the longest one wins, and replaced text is never matched again.
+
+Compiled sets are cached by content, so a template whose corrections change
+simply compiles to a new entry.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+CorrectionKey = Tuple[Tuple[str, str, Optional[str]], ...]
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher.
+
+    Parameters
+    ----------
+    patterns:
+        Non-empty strings to search for.  The index of a pattern in this
+        sequence identifies it in match results.
+    """
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 各状態で終わるパターン番号 (失敗リンク先の出力も含む)
+        self._out: List[List[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                raise ValueError("patterns must be non-empty")
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(index)
+        self._build_links()
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def iter_matches(self, text: str) -> Iterable[Tuple[int, int]]:
+        """Yield ``(start, pattern_index)`` for every (overlapping) match."""
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                yield pos + 1 - len(patterns[index]), index
+
+    def leftmost_longest(self, text: str) -> List[Tuple[int, int]]:
+        """Return non-overlapping ``(start, pattern_index)`` matches.
+
+        Matches are chosen left to right, preferring the longest pattern at a
+        given start position.
+        """
+        best: Dict[int, int] = {}
+        patterns = self.patterns
+        for start, index in self.iter_matches(text):
+            current = best.get(start)
+            if current is None or len(patterns[index]) > len(patterns[current]):
+                best[start] = index
+        matches: List[Tuple[int, int]] = []
+        end = 0
+        for start in sorted(best):
+            if start >= end:
+                matches.append((start, best[start]))
+                end = start + len(patterns[best[start]])
+        return matches
+
+
+class CorrectionSet:
+    """Deduplicated corrections compiled for single pass rewriting.
+
+    Global corrections apply to every ROI.  Corrections with a ``roi`` apply
+    only to that ROI and take precedence over a global correction of the
+    same ``wrong`` text.  When a ``wrong`` text appears several times the most
+    recently added correction wins; an identity pair (``wrong == correct``)
+    withdraws earlier corrections of that text.
+    """
+
+    def __init__(self, corrections: Iterable[Mapping[str, Any]] = ()) -> None:
+        self._global: Dict[str, str] = {}
+        self._scoped: Dict[str, Dict[str, str]] = {}
+        for item in corrections:
+            wrong = item.get("wrong")
+            correct = item.get("correct")
+            if not wrong or not correct:
+                continue
+            roi = item.get("roi")
+            table = self._scoped.setdefault(roi, {}) if roi else self._global
+            table.pop(wrong, None)
+            if wrong != correct:
+                table[wrong] = correct
+        self._compiled: Dict[Optional[str], Tuple[AhoCorasick, List[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._global) + sum(len(t) for t in self._scoped.values())
+
+    def _automaton(self, roi: Optional[str]) -> Tuple[AhoCorasick, List[str]]:
+        key = roi if roi in self._scoped else None
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            table = dict(self._global)
+            if key is not None:
+                table.update(self._scoped[key])
+            compiled = (AhoCorasick(list(table)), list(table.values()))
+            self._compiled[key] = compiled
+        return compiled
+
+    def apply(self, text: str, roi: Optional[str] = None) -> str:
+        """Return ``text`` with the corrections for ``roi`` applied."""
+        if not text:
+            return text
+        automaton, replacements = self._automaton(roi)
+        if not len(automaton):
+            return text
+        parts: List[str] = []
+        pos = 0
+        for start, index in automaton.leftmost_longest(text):
+            parts.append(text[pos:start])
+            parts.append(replacements[index])
+            pos = start + len(automaton.patterns[index])
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
+
+
+def _key(corrections: Iterable[Mapping[str, Any]]) -> CorrectionKey:
+    return tuple(
+        (str(item.get("wrong") or ""), str(item.get("correct") or ""), item.get("roi") or None)
+        for item in corrections
+        if isinstance(item, Mapping)
+    )
+
+
+@lru_cache(maxsize=128)
+def _compile(key: CorrectionKey) -> CorrectionSet:
+    return CorrectionSet({"wrong": w, "correct": c, "roi": r} for w, c, r in key)
+
+
+def compile_corrections(
+    corrections: Union[None, CorrectionSet, Iterable[Mapping[str, Any]]],
+) -> CorrectionSet:
+    """Return the compiled :class:`CorrectionSet` for a template's corrections.
+
+    Identical correction lists share one compiled instance; any change to the
+    list yields a freshly compiled set.
+    """
+    if isinstance(corrections, CorrectionSet):
+        return corrections
+    return _compile(_key(corrections or ()))
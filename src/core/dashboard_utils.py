@@ -4,6 +4,8 @@ import re
 from typing import Tuple
 import pandas as pd
 
+from .db_manager import DBManager
+
 
 def compute_metrics(workspace_dir: str) -> Tuple[int, int, float, pd.DataFrame]:
     """Compute dashboard metrics from all extract.json files."""
@@ -24,7 +26,7 @@ def compute_metrics(workspace_dir: str) -> Tuple[int, int, float, pd.DataFrame]:
             data = json.load(f)
         total_fields += len(data)
         for info in data.values():
-            if not info.get("needs_human"):
+            if not info.get("needs_human") and not info.get("retryable"):
                 auto_confirmed += 1
         m = re.match(r"DOC_(\d{8})", doc)
         if m:
@@ -39,3 +41,24 @@ def compute_metrics(workspace_dir: str) -> Tuple[int, int, float, pd.DataFrame]:
         }
     )
     return total_docs, total_fields, auto_rate, daily_df
+
+
+def compute_template_costs(db: DBManager) -> pd.DataFrame:
+    """Per-template API usage: documents, tokens, latency and cost."""
+    columns = [
+        "template_name",
+        "documents",
+        "calls",
+        "prompt_tokens",
+        "completion_tokens",
+        "retries",
+        "avg_latency_ms",
+        "cost_usd",
+        "cost_per_document",
+    ]
+    rows = db.usage_summary("template")
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(rows)
+    df["cost_per_document"] = df["cost_usd"] / df["documents"].clip(lower=1)
+    return df[columns]
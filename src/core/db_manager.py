@@ -42,6 +42,54 @@ class DBManager:
             )
             """
         )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS api_usage (
+                usage_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                image_name TEXT NOT NULL,
+                roi_name TEXT,
+                template_name TEXT,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                image_tokens INTEGER NOT NULL,
+                latency_ms REAL NOT NULL,
+                retries INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(job_id) REFERENCES ocr_jobs(job_id)
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                day TEXT PRIMARY KEY,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                cost_usd REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS skipped_calls (
+                skip_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                image_name TEXT NOT NULL,
+                roi_name TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(job_id) REFERENCES ocr_jobs(job_id)
+            )
+            """
+        )
+        # 既存のデータベースには文書ごとのテンプレート名の列がないので追加する
+        columns = {row["name"] for row in cur.execute("PRAGMA table_info(api_usage)")}
+        if "template_name" not in columns:
+            cur.execute("ALTER TABLE api_usage ADD COLUMN template_name TEXT")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_api_usage_job ON api_usage(job_id)")
         self.conn.commit()
 
     def create_job(self, template_name: str, created_at: str) -> int:
@@ -94,6 +142,18 @@ class DBManager:
         rows = cur.fetchall()
         return [dict(r) for r in rows]
 
+    def fetch_result(self, result_id: int) -> Dict[str, Any] | None:
+        row = self.conn.execute(
+            "SELECT * FROM ocr_results WHERE result_id = ?", (result_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def fetch_corrected_results(self) -> Iterable[Dict[str, Any]]:
+        """Return all results whose text was confirmed by a human reviewer."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM ocr_results WHERE corrected_by_user = 1")
+        return [dict(r) for r in cur.fetchall()]
+
     def update_result(self, result_id: int, new_text: str, status: str = "confirmed") -> None:
         """Update the text of a result and mark it as corrected.
 
@@ -118,5 +178,173 @@ class DBManager:
         )
         self.conn.commit()
 
+    def update_ocr_result(
+        self,
+        result_id: int,
+        text_mini: str | None = None,
+        text_nano: str | None = None,
+        final_text: str | None = None,
+        confidence_score: float | None = None,
+        status: str | None = None,
+    ) -> None:
+        """Replace the engine outputs of a result, e.g. after a retry."""
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            UPDATE ocr_results
+            SET text_mini = ?, text_nano = ?, final_text = ?, confidence_score = ?, status = ?
+            WHERE result_id = ?
+            """,
+            (text_mini, text_nano, final_text, confidence_score, status, result_id),
+        )
+        self.conn.commit()
+
+    def fetch_retryable_results(self) -> Iterable[Dict[str, Any]]:
+        """Return results whose OCR failed and should be run again."""
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM ocr_results WHERE status = 'retry'")
+        return [dict(r) for r in cur.fetchall()]
+
+    def add_usage(
+        self,
+        job_id: int,
+        image_name: str,
+        records: Iterable[Dict[str, Any]],
+        created_at: str,
+        template_name: str | None = None,
+    ) -> None:
+        """Store per-call usage records and add them to the daily totals.
+
+        Each record needs ``roi``, ``model``, ``prompt_tokens``,
+        ``completion_tokens``, ``image_tokens``, ``latency`` (seconds),
+        ``retries`` and ``cost``.  ``template_name`` is the template the
+        document was actually processed with, which differs from the job's
+        template in auto-detect mode.
+        """
+        rows = [
+            (
+                job_id,
+                image_name,
+                r.get("roi"),
+                template_name,
+                r["model"],
+                r["prompt_tokens"],
+                r["completion_tokens"],
+                r["image_tokens"],
+                r["latency"] * 1000,
+                r["retries"],
+                r["cost"],
+                created_at,
+            )
+            for r in records
+        ]
+        if not rows:
+            return
+        cur = self.conn.cursor()
+        cur.executemany(
+            """
+            INSERT INTO api_usage (
+                job_id, image_name, roi_name, template_name, model, prompt_tokens,
+                completion_tokens, image_tokens, latency_ms, retries, cost_usd, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        cur.execute(
+            """
+            INSERT INTO daily_usage (day, tokens, cost_usd) VALUES (?, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET
+                tokens = tokens + excluded.tokens,
+                cost_usd = cost_usd + excluded.cost_usd
+            """,
+            (
+                created_at[:10],
+                sum(row[5] + row[6] for row in rows),
+                sum(row[10] for row in rows),
+            ),
+        )
+        self.conn.commit()
+
+    def add_skipped_calls(
+        self,
+        job_id: int,
+        image_name: str,
+        skipped: Dict[str, int],
+        created_at: str,
+        reason: str = "blank",
+    ) -> None:
+        """Record engine calls that were not made, as ``{roi_name: calls}``."""
+        if not skipped:
+            return
+        self.conn.executemany(
+            """
+            INSERT INTO skipped_calls (job_id, image_name, roi_name, reason, calls, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(job_id, image_name, roi, reason, calls, created_at) for roi, calls in skipped.items()],
+        )
+        self.conn.commit()
+
+    def calls_saved(self, job_id: int | None = None) -> Iterable[Dict[str, Any]]:
+        """Per-job count of skipped fields and engine calls, by reason."""
+        where = "WHERE s.job_id = ?" if job_id is not None else ""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+            SELECT s.job_id, j.template_name, s.reason,
+                   COUNT(*) AS fields, SUM(s.calls) AS calls
+            FROM skipped_calls s JOIN ocr_jobs j ON j.job_id = s.job_id
+            {where}
+            GROUP BY s.job_id, s.reason
+            ORDER BY s.job_id
+            """,
+            (job_id,) if job_id is not None else (),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+    def daily_tokens(self, day: str) -> int:
+        """Return the tokens used on ``day`` (``YYYY-MM-DD``)."""
+        row = self.conn.execute("SELECT tokens FROM daily_usage WHERE day = ?", (day,)).fetchone()
+        return int(row["tokens"]) if row else 0
+
+    def usage_summary(self, group_by: str = "job", job_id: int | None = None) -> Iterable[Dict[str, Any]]:
+        """Aggregate ``api_usage`` per ``roi``, ``document``, ``job`` or ``template``.
+
+        ``template`` groups by the template each document was processed
+        with (falling back to the job's template for rows recorded without
+        one), so auto-detected documents are attributed to their template.
+        """
+        columns, group = {
+            "roi": ("u.job_id, u.image_name, u.roi_name",) * 2,
+            "document": ("u.job_id, u.image_name",) * 2,
+            "job": ("u.job_id, j.template_name",) * 2,
+            "template": (
+                "COALESCE(u.template_name, j.template_name) AS template_name",
+                "COALESCE(u.template_name, j.template_name)",
+            ),
+        }[group_by]
+        where = "WHERE u.job_id = ?" if job_id is not None else ""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+            SELECT {columns},
+                COUNT(*) AS calls,
+                COUNT(DISTINCT u.job_id || '/' || u.image_name) AS documents,
+                SUM(u.prompt_tokens) AS prompt_tokens,
+                SUM(u.completion_tokens) AS completion_tokens,
+                SUM(u.image_tokens) AS image_tokens,
+                SUM(u.retries) AS retries,
+                AVG(u.latency_ms) AS avg_latency_ms,
+                MAX(u.latency_ms) AS max_latency_ms,
+                SUM(u.cost_usd) AS cost_usd
+            FROM api_usage u JOIN ocr_jobs j ON u.job_id = j.job_id
+            {where}
+            GROUP BY {group}
+            ORDER BY cost_usd DESC
+            """,
+            () if job_id is None else (job_id,),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
     def close(self) -> None:
         self.conn.close()
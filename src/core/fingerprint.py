@@ -0,0 +1,145 @@
+"""Visual fingerprints used to recognise a template without OCR.
+
+A :class:`Fingerprint` summarises the layout of a page in a few hundred
+bytes:
+
+* ``layout_hash`` -- a perceptual hash: the sign of the low frequency DCT
+  coefficients of the page shrunk to ``HASH_SIZE * 4`` pixels square,
+  relative to their median.  It captures where the text blocks, boxes and
+  rules are and tolerates scanning noise, small shifts and filled-in
+  values.
+* ``pooled`` -- the ORB descriptors of the page pooled per cell of a
+  ``POOL_GRID`` x ``POOL_GRID`` grid (the mean of each descriptor bit as
+  ±1), L2 normalised.  It describes what the local structure looks like in
+  each part of the page.
+
+Both are computed on reduced copies, so fingerprinting a full page takes a
+few tens of milliseconds and comparing it against an index of templates is
+a couple of vector operations.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# 知覚ハッシュに使う低周波DCT係数の一辺 (HASH_SIZE**2 - 1 ビット)
+HASH_SIZE = 16
+# ORB記述子をプールする格子の分割数と、特徴点を検出する縮小サイズ
+POOL_GRID = 2
+POOL_MAX_DIM = 512
+# 類似度に占める知覚ハッシュの重み (残りはプールしたORB記述子)
+HASH_WEIGHT = 0.7
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """Compact description of a page layout.
+
+    ``layout_hash`` is the packed bit array of the perceptual hash and
+    ``pooled`` the normalised float32 vector of pooled ORB descriptors.
+    """
+
+    layout_hash: np.ndarray
+    pooled: np.ndarray
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def layout_hash(gray: np.ndarray) -> np.ndarray:
+    """Perceptual (DCT) hash of a grayscale page as packed bits."""
+    side = HASH_SIZE * 4
+    small = cv2.resize(gray, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    # 直流成分はページ全体の明るさなので除く
+    coefficients = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].reshape(-1)[1:]
+    return np.packbits(coefficients > np.median(coefficients))
+
+
+def pooled_descriptors(gray: np.ndarray) -> np.ndarray:
+    """ORB descriptors of ``gray`` averaged per grid cell, L2 normalised."""
+    longest = max(gray.shape[:2])
+    if longest > POOL_MAX_DIM:
+        scale = POOL_MAX_DIM / longest
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    pooled = np.zeros((POOL_GRID * POOL_GRID, 256), dtype=np.float32)
+    keypoints, descriptors = cv2.ORB_create().detectAndCompute(gray, None)
+    if descriptors is not None and len(keypoints):
+        h, w = gray.shape[:2]
+        points = np.float32([kp.pt for kp in keypoints])
+        cols = np.minimum((points[:, 0] * POOL_GRID / w).astype(int), POOL_GRID - 1)
+        rows = np.minimum((points[:, 1] * POOL_GRID / h).astype(int), POOL_GRID - 1)
+        bits = np.unpackbits(descriptors, axis=1).astype(np.float32) * 2 - 1
+        np.add.at(pooled, rows * POOL_GRID + cols, bits)
+    pooled = pooled.reshape(-1)
+    norm = float(np.linalg.norm(pooled))
+    return pooled / norm if norm else pooled
+
+
+def image_fingerprint(image: np.ndarray) -> Fingerprint:
+    """Compute the :class:`Fingerprint` of a BGR or grayscale page."""
+    gray = _gray(image)
+    return Fingerprint(layout_hash(gray), pooled_descriptors(gray))
+
+
+class FingerprintIndex:
+    """In-memory index of template fingerprints.
+
+    The fingerprints are kept stacked in two matrices so a page is compared
+    with every template at once; the matrices are rebuilt lazily on the next
+    query after a change.
+    """
+
+    def __init__(self) -> None:
+        self._templates: Dict[str, Fingerprint] = {}
+        self._names: List[str] = []
+        self._hashes: Optional[np.ndarray] = None
+        self._pooled: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def update(self, name: str, fingerprint: Fingerprint) -> None:
+        """Add or replace the fingerprint of template ``name``."""
+        self._templates[name] = fingerprint
+        self._hashes = None
+
+    def remove(self, name: str) -> None:
+        if self._templates.pop(name, None) is not None:
+            self._hashes = None
+
+    def _compile(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._hashes is None:
+            self._names = sorted(self._templates)
+            fingerprints = [self._templates[name] for name in self._names]
+            self._hashes = np.array([fp.layout_hash for fp in fingerprints], dtype=np.uint8).reshape(
+                len(fingerprints), (HASH_SIZE * HASH_SIZE + 7) // 8
+            )
+            self._pooled = np.array([fp.pooled for fp in fingerprints], dtype=np.float32).reshape(
+                len(fingerprints), POOL_GRID * POOL_GRID * 256
+            )
+        return self._hashes, self._pooled
+
+    def scores(self, fingerprint: Fingerprint) -> Dict[str, float]:
+        """Similarity of ``fingerprint`` to every indexed template."""
+        hashes, pooled = self._compile()
+        if not len(self._names):
+            return {}
+        bits = HASH_SIZE * HASH_SIZE - 1
+        distances = np.unpackbits(hashes ^ fingerprint.layout_hash, axis=1)[:, :bits].sum(axis=1)
+        hash_scores = 1.0 - distances / bits
+        pooled_scores = (pooled @ fingerprint.pooled).clip(min=0.0)
+        combined = HASH_WEIGHT * hash_scores + (1.0 - HASH_WEIGHT) * pooled_scores
+        return {name: float(score) for name, score in zip(self._names, combined)}
+
+    def rank(self, fingerprint: Fingerprint, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(template, similarity)`` pairs, best first."""
+        ranked = sorted(self.scores(fingerprint).items(), key=lambda item: (-item[1], item[0]))
+        return ranked if k is None else ranked[:k]
@@ -0,0 +1,283 @@
+"""Offline glyph classifier for numeric fields.
+
+Numeric ROIs such as zip codes and prices consist of a handful of glyph
+classes.  :class:`GlyphClassifierOCR` segments a crop into connected
+components and classifies each one with a small k-NN model over HOG-style
+features computed in NumPy, so such fields can be read on the CPU without an
+API round-trip.  The model is trained from crops whose text has been
+confirmed, either automatically (both engines agreed) or by a human reviewer
+(``corrected_by_user = 1``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from .db_manager import DBManager
+from .ocr_bridge import BaseOCR
+
+GLYPH_SIZE = 20
+NUMERIC_CHARSET = "0123456789,-."
+
+
+@dataclass
+class Glyph:
+    """A segmented glyph and its geometry relative to the text line."""
+
+    image: np.ndarray
+    box: Tuple[int, int, int, int]
+    line_top: int
+    line_height: int
+
+
+def segment_glyphs(image: np.ndarray, min_area: int = 6) -> List[Glyph]:
+    """Split a single-line crop into glyphs ordered from left to right.
+
+    Components overlapping horizontally by more than half of the narrower one
+    are merged so that broken strokes form a single glyph.
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+
+    boxes = [list(stats[i][:4]) for i in range(1, n) if stats[i][4] >= min_area]
+    if not boxes:
+        return []
+    boxes.sort(key=lambda b: b[0])
+
+    merged: List[List[int]] = [boxes[0]]
+    for x, y, w, h in boxes[1:]:
+        px, py, pw, ph = merged[-1]
+        overlap = min(px + pw, x + w) - max(px, x)
+        if overlap > 0.5 * min(pw, w):
+            nx, ny = min(px, x), min(py, y)
+            merged[-1] = [nx, ny, max(px + pw, x + w) - nx, max(py + ph, y + h) - ny]
+        else:
+            merged.append([x, y, w, h])
+
+    top = min(b[1] for b in merged)
+    line_height = max(b[1] + b[3] for b in merged) - top
+    return [
+        Glyph(ink[y : y + h, x : x + w], (x, y, w, h), top, max(line_height, 1))
+        for x, y, w, h in merged
+    ]
+
+
+def _normalise(glyph: np.ndarray) -> np.ndarray:
+    """Pad to a square keeping the aspect ratio and resize to ``GLYPH_SIZE``."""
+    h, w = glyph.shape[:2]
+    side = max(h, w)
+    canvas = np.zeros((side, side), dtype=np.uint8)
+    y0, x0 = (side - h) // 2, (side - w) // 2
+    canvas[y0 : y0 + h, x0 : x0 + w] = glyph
+    resized = cv2.resize(canvas, (GLYPH_SIZE, GLYPH_SIZE), interpolation=cv2.INTER_AREA)
+    return resized.astype(np.float32) / 255.0
+
+
+def glyph_features(glyph: Glyph, cells: int = 4, bins: int = 9) -> np.ndarray:
+    """HOG-style descriptor plus coarse pixels and line-relative geometry."""
+    img = _normalise(glyph.image)
+    gy, gx = np.gradient(img)
+    magnitude = np.hypot(gx, gy)
+    angle = np.mod(np.arctan2(gy, gx), np.pi)
+    bin_idx = np.minimum((angle / np.pi * bins).astype(int), bins - 1)
+    cell = GLYPH_SIZE // cells
+    rows, cols = np.indices(img.shape) // cell
+    cell_idx = np.minimum(rows, cells - 1) * cells + np.minimum(cols, cells - 1)
+    hog = np.bincount(
+        (cell_idx * bins + bin_idx).ravel(), weights=magnitude.ravel(), minlength=cells * cells * bins
+    )
+    hog /= np.linalg.norm(hog) + 1e-6
+
+    coarse = cv2.resize(img, (GLYPH_SIZE // 2, GLYPH_SIZE // 2), interpolation=cv2.INTER_AREA).ravel()
+    coarse /= np.linalg.norm(coarse) + 1e-6
+
+    x, y, w, h = glyph.box
+    geometry = np.array(
+        [
+            w / max(h, 1),
+            h / glyph.line_height,
+            (y + h / 2 - glyph.line_top) / glyph.line_height,
+        ],
+        dtype=np.float64,
+    )
+    # 「1」「-」「,」は形状より位置と縦横比で区別されるため幾何特徴を強めに重み付けする
+    return np.concatenate([hog, coarse, 2.0 * geometry])
+
+
+class GlyphClassifier:
+    """Distance weighted k-nearest-neighbour classifier."""
+
+    def __init__(self, k: int = 3) -> None:
+        self.k = k
+        self.features = np.empty((0, 0))
+        self.labels = np.empty((0,), dtype="<U1")
+        self.scale = 1.0
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def fit(self, features: np.ndarray, labels: Sequence[str]) -> "GlyphClassifier":
+        self.features = np.asarray(features, dtype=np.float64)
+        self.labels = np.asarray(list(labels), dtype="<U1")
+        if len(self.labels) > 1:
+            d = self._distances(self.features)
+            np.fill_diagonal(d, np.inf)
+            self.scale = float(np.median(d.min(axis=1))) or 1.0
+        return self
+
+    def _distances(self, queries: np.ndarray) -> np.ndarray:
+        q2 = (queries ** 2).sum(axis=1)[:, None]
+        f2 = (self.features ** 2).sum(axis=1)[None, :]
+        return np.sqrt(np.maximum(q2 + f2 - 2 * queries @ self.features.T, 0))
+
+    def predict(self, features: np.ndarray) -> List[Tuple[str, float]]:
+        """Return ``(label, confidence)`` for every feature row."""
+        if not len(self) or not len(features):
+            return [("", 0.0)] * len(features)
+        d = self._distances(np.asarray(features, dtype=np.float64))
+        k = min(self.k, len(self))
+        nearest = np.argsort(d, axis=1)[:, :k]
+        out: List[Tuple[str, float]] = []
+        for row, idx in zip(d, nearest):
+            weights = 1.0 / (row[idx] + 1e-6)
+            votes: dict[str, float] = {}
+            for label, weight in zip(self.labels[idx], weights):
+                votes[label] = votes.get(label, 0.0) + weight
+            label, score = max(votes.items(), key=lambda item: item[1])
+            confidence = score / weights.sum()
+            # 学習データから大きく離れたグリフは信頼度を下げる
+            limit = 2.0 * self.scale
+            if row[idx[0]] > limit:
+                confidence *= limit / row[idx[0]]
+            out.append((str(label), float(confidence)))
+        return out
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, features=self.features, labels=self.labels, scale=self.scale, k=self.k)
+
+    @classmethod
+    def load(cls, path: str) -> "GlyphClassifier":
+        with np.load(path) as data:
+            model = cls(k=int(data["k"]))
+            model.features = data["features"]
+            model.labels = data["labels"]
+            model.scale = float(data["scale"])
+        return model
+
+
+def samples_from_crop(image: np.ndarray, text: str) -> List[Tuple[np.ndarray, str]]:
+    """Pair glyphs with characters when the segmentation matches ``text``."""
+    glyphs = segment_glyphs(image)
+    if not text or len(glyphs) != len(text):
+        return []
+    return [(glyph_features(g), ch) for g, ch in zip(glyphs, text)]
+
+
+# 学習に使わない読み取り元 (ローカルエンジン自身の推定、空欄判定、フェイルオーバー先の回答)
+UNTRUSTED_SOURCES = frozenset({"local", "blank", "fallback"})
+
+
+def _engines_agreed(info: Dict[str, Any]) -> bool:
+    """``True`` if the primary and validator engines read the same text."""
+    return (
+        info.get("confidence_level") == "high"
+        and not info.get("needs_human")
+        and info.get("source_engine") not in UNTRUSTED_SOURCES
+        and info.get("text_nano") is not None
+        and info.get("text_nano") == info.get("text")
+    )
+
+
+def collect_training_samples(
+    workspace_dir: str,
+    db: DBManager,
+    charset: str = NUMERIC_CHARSET,
+) -> List[Tuple[np.ndarray, str]]:
+    """Gather labelled glyphs from confirmed crops in the workspace.
+
+    A crop is used when its database row was corrected by a reviewer, or when
+    two independent engines read the same text (``high`` confidence with a
+    matching validator reading).  Fields read by the local engine itself,
+    blank fields and answers from a failover engine are never used, so the
+    classifier is not trained on its own predictions.  Only texts made
+    entirely of ``charset`` characters are used.
+    """
+    corrected = {row["result_id"]: row["final_text"] for row in db.fetch_corrected_results()}
+    samples: List[Tuple[np.ndarray, str]] = []
+    if not os.path.isdir(workspace_dir):
+        return samples
+    for doc in sorted(os.listdir(workspace_dir)):
+        extract_path = os.path.join(workspace_dir, doc, "extract.json")
+        if not os.path.isfile(extract_path):
+            continue
+        try:
+            with open(extract_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for info in data.values():
+            if not isinstance(info, dict) or not info.get("source_image"):
+                continue
+            text = corrected.get(info.get("result_id"))
+            if text is None and _engines_agreed(info):
+                text = info.get("text")
+            if not text or any(ch not in charset for ch in text):
+                continue
+            crop = cv2.imread(os.path.join(workspace_dir, doc, "crops", info["source_image"]))
+            if crop is not None:
+                samples.extend(samples_from_crop(crop, text))
+    return samples
+
+
+def train_classifier(samples: Iterable[Tuple[np.ndarray, str]], k: int = 3) -> GlyphClassifier:
+    samples = list(samples)
+    if not samples:
+        return GlyphClassifier(k=k)
+    features = np.stack([f for f, _ in samples])
+    return GlyphClassifier(k=k).fit(features, [label for _, label in samples])
+
+
+class GlyphClassifierOCR(BaseOCR):
+    """CPU-only OCR engine for numeric fields.
+
+    The text confidence is the lowest confidence of its glyphs, so a single
+    unfamiliar glyph sends the field to the API engines.  :meth:`run`
+    classifies in a worker thread so the event loop keeps serving the API
+    calls of other fields; :meth:`recognize` is the synchronous version.
+
+    Parameters
+    ----------
+    model:
+        A trained :class:`GlyphClassifier`.
+    """
+
+    def __init__(self, model: Optional[GlyphClassifier] = None) -> None:
+        self.model = model or GlyphClassifier()
+
+    @classmethod
+    def from_file(cls, path: str) -> "GlyphClassifierOCR":
+        return cls(GlyphClassifier.load(path))
+
+    def cache_identity(self) -> str:
+        return f"{type(self).__qualname__}|{len(self.model)}"
+
+    async def run(self, image: np.ndarray) -> Tuple[str, float]:
+        return await asyncio.to_thread(self.recognize, image)
+
+    def recognize(self, image: np.ndarray) -> Tuple[str, float]:
+        glyphs = segment_glyphs(image)
+        if not glyphs or not len(self.model):
+            return "", 0.0
+        predictions = self.model.predict(np.stack([glyph_features(g) for g in glyphs]))
+        text = "".join(label for label, _ in predictions)
+        return text, min(conf for _, conf in predictions)
@@ -0,0 +1,121 @@
+"""Pooled HTTP client shared by the network based OCR engines."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+import aiohttp
+
+from .config import settings
+
+
+class HTTPClientPool:
+    """Long-lived :class:`aiohttp.ClientSession` with connection pooling.
+
+    Opening a new session for every crop means every ROI pays a fresh TCP/TLS
+    handshake and DNS lookup.  The pool keeps a single session with
+    keep-alive connections and a DNS cache so consecutive requests reuse an
+    established connection.
+
+    ``aiohttp`` sessions are bound to the event loop that created them.  When
+    the pool is used from a different loop (for example a subsequent
+    ``asyncio.run``) the stale session is discarded and a fresh one is created
+    transparently.
+
+    Parameters
+    ----------
+    limit:
+        Maximum number of simultaneous connections.
+    limit_per_host:
+        Maximum number of simultaneous connections to a single host.
+    dns_cache_ttl:
+        Seconds resolved DNS entries are cached.
+    keepalive_timeout:
+        Seconds an idle connection is kept open for reuse.
+    timeout:
+        Total timeout in seconds for a single request.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        dns_cache_ttl: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.limit = settings.HTTP_MAX_CONNECTIONS if limit is None else limit
+        self.limit_per_host = (
+            settings.HTTP_MAX_CONNECTIONS_PER_HOST if limit_per_host is None else limit_per_host
+        )
+        self.dns_cache_ttl = settings.HTTP_DNS_CACHE_TTL if dns_cache_ttl is None else dns_cache_ttl
+        self.keepalive_timeout = (
+            settings.HTTP_KEEPALIVE_TIMEOUT if keepalive_timeout is None else keepalive_timeout
+        )
+        self.timeout = settings.HTTP_REQUEST_TIMEOUT if timeout is None else timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and (self._session.closed or self._loop is not loop):
+            self._discard()
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    def _discard(self) -> None:
+        """Drop a session that belongs to another (usually finished) loop."""
+        session = self._session
+        self._session = None
+        self._loop = None
+        if session is not None and not session.closed:
+            # 別ループのコネクションはそのループ上でしか閉じられないため切り離すだけにする
+            session.detach()
+
+    async def close(self) -> None:
+        """Close the pooled session.  A new one is created on next use."""
+        if self._session is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # pragma: no cover - called outside a loop
+            loop = None
+        if self._loop is loop and not self._session.closed:
+            session = self._session
+            self._session = None
+            self._loop = None
+            await session.close()
+        else:
+            self._discard()
+
+    async def close_loop_session(self) -> None:
+        """Close the session if it belongs to the running loop.
+
+        Unlike :meth:`close` a session of another loop is left untouched, so
+        an event loop that is about to finish can release its connections
+        without affecting a session in use elsewhere.
+        """
+        if self._session is not None and self._loop is asyncio.get_running_loop():
+            await self.close()
+
+    @property
+    def is_open(self) -> bool:
+        """``True`` when a live session is currently held by the pool."""
+        return self._session is not None and not self._session.closed
+
+
+# 全エンジンで共有するデフォルトのコネクションプール
+default_pool = HTTPClientPool()
@@ -0,0 +1,197 @@
+"""Lazy sources of document images.
+
+An :class:`ImageSource` lists its images up front (cheap: a ZIP central
+directory or a directory walk) and decodes them one at a time while being
+iterated, so only the image currently handed out is held in memory.  ZIP
+members are read straight from the archive and decoded with
+:func:`cv2.imdecode`; nothing is extracted to disk.  Every page of a
+multi-page TIFF becomes a document of its own, named ``<file>#<page>``.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import IO, Any, Dict, Generator, Iterator, List, Optional, Sequence, Tuple, Union
+import zipfile
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+
+def decode_image(data: Union[bytes, bytearray, memoryview]) -> Optional[np.ndarray]:
+    """Decode encoded image bytes to a BGR array, ``None`` if undecodable."""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def iter_pages(data: Union[bytes, bytearray, memoryview]) -> Iterator[np.ndarray]:
+    """Decode the pages of a multi-page image (TIFF) one at a time."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not buf.size:
+        return
+    page = 0
+    while True:
+        try:
+            ok, mats = cv2.imdecodemulti(buf, cv2.IMREAD_COLOR, range=(page, page + 1))
+        except TypeError:
+            # range 引数のない OpenCV では全ページをまとめて読み込む
+            ok, mats = cv2.imdecodemulti(buf, cv2.IMREAD_COLOR)
+            if ok:
+                yield from mats
+            return
+        if not ok or not mats:
+            return
+        yield mats[0]
+        page += 1
+
+
+def is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class ImageSource:
+    """Base class: ``len()`` gives the number of image files, iteration
+    yields ``(name, image)`` pairs decoded on demand.
+
+    A multi-page TIFF counts as one file but yields one pair per page.
+    Entries that cannot be decoded are skipped and their names collected in
+    :attr:`skipped`.
+    """
+
+    def __init__(self) -> None:
+        self.skipped: List[str] = []
+
+    def names(self) -> Sequence[str]:
+        raise NotImplementedError
+
+    def read(self, name: str) -> bytes:
+        """Return the encoded bytes of image ``name``."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release the underlying archive or files."""
+
+    def __enter__(self) -> "ImageSource":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    def __iter__(self) -> Iterator[Tuple[str, np.ndarray]]:
+        for name in self.names():
+            if name.lower().endswith(TIFF_EXTENSIONS):
+                yielded = yield from self._tiff_pages(name, self.read(name))
+                if not yielded:
+                    self.skipped.append(name)
+                continue
+            image = decode_image(self.read(name))
+            if image is None:
+                self.skipped.append(name)
+                continue
+            yield name, image
+
+    @staticmethod
+    def _tiff_pages(name: str, data: bytes) -> Generator[Tuple[str, np.ndarray], None, bool]:
+        """Yield the pages of a TIFF, keeping the plain name for a single page."""
+        pages = iter_pages(data)
+        first = next(pages, None)
+        if first is None:
+            return False
+        second = next(pages, None)
+        if second is None:
+            yield name, first
+            return True
+        yield f"{name}#1", first
+        del first
+        yield f"{name}#2", second
+        del second
+        for number, page in enumerate(pages, start=3):
+            yield f"{name}#{number}", page
+        return True
+
+
+class ZipImageSource(ImageSource):
+    """Images stored in a ZIP archive, read member by member.
+
+    Parameters
+    ----------
+    archive:
+        Path of the archive or a seekable binary file object (such as a
+        Streamlit ``UploadedFile``).  The archive is not copied.
+    """
+
+    def __init__(self, archive: Union[str, "os.PathLike[str]", IO[bytes]]) -> None:
+        super().__init__()
+        self._zip = zipfile.ZipFile(archive)
+        self._names = [
+            info.filename
+            for info in self._zip.infolist()
+            if not info.is_dir()
+            and is_image_name(info.filename)
+            # macOS が付け加えるリソースフォークは画像ではない
+            and not info.filename.startswith("__MACOSX/")
+        ]
+
+    def names(self) -> Sequence[str]:
+        return self._names
+
+    def read(self, name: str) -> bytes:
+        return self._zip.read(name)
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+class FolderImageSource(ImageSource):
+    """Images below a local folder, read in place in sorted order."""
+
+    def __init__(self, folder: Union[str, "os.PathLike[str]"]) -> None:
+        super().__init__()
+        self.folder = Path(folder)
+        if not self.folder.is_dir():
+            raise NotADirectoryError(str(folder))
+        self._names = sorted(
+            path.relative_to(self.folder).as_posix()
+            for path in self.folder.rglob("*")
+            if path.is_file() and is_image_name(path.name)
+        )
+
+    def names(self) -> Sequence[str]:
+        return self._names
+
+    def read(self, name: str) -> bytes:
+        return (self.folder / name).read_bytes()
+
+
+class FileListSource(ImageSource):
+    """Uploaded files, i.e. objects with a ``name`` and a ``read()`` method.
+
+    Every file is kept.  When several uploads share a name, the later ones
+    are renamed ``<stem> (2)<ext>``, ``<stem> (3)<ext>``, ... in upload
+    order.
+    """
+
+    def __init__(self, files: Sequence[Any]) -> None:
+        super().__init__()
+        self._files: Dict[str, Any] = {}
+        for f in files:
+            name, number = f.name, 1
+            while name in self._files:
+                number += 1
+                stem, ext = os.path.splitext(f.name)
+                name = f"{stem} ({number}){ext}"
+            self._files[name] = f
+
+    def names(self) -> Sequence[str]:
+        return list(self._files)
+
+    def read(self, name: str) -> bytes:
+        return self._files[name].read()
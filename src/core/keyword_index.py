@@ -0,0 +1,129 @@
+"""Weighted keyword index used for template detection.
+
+Every template contributes its detection keywords, optionally weighted
+(``{"keyword": "請求書", "weight": 2}``; a plain string has weight 1).  All
+keywords of all templates are compiled into one
+:class:`~core.corrections.AhoCorasick` automaton, so a page's OCR text is
+scanned once to score every template.  A template scores the sum of the
+weights of its distinct keywords found in the text.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .corrections import AhoCorasick
+
+
+def keyword_weights(keywords: Iterable[Any]) -> Dict[str, float]:
+    """Normalise a template's ``keywords`` list into ``{keyword: weight}``.
+
+    Entries are strings or ``{"keyword": ..., "weight": ...}`` mappings;
+    empty keywords and non-positive weights are ignored.  A keyword listed
+    twice keeps its larger weight.
+    """
+    weights: Dict[str, float] = {}
+    for item in keywords or ():
+        if isinstance(item, str):
+            keyword, weight = item, 1.0
+        elif isinstance(item, Mapping):
+            keyword = item.get("keyword") or ""
+            try:
+                weight = float(item.get("weight", 1.0))
+            except (TypeError, ValueError):
+                continue
+        else:
+            continue
+        if keyword and weight > 0:
+            weights[keyword] = max(weight, weights.get(keyword, 0.0))
+    return weights
+
+
+def parse_keywords(text: str) -> List[Any]:
+    """Parse the editor's comma separated keywords.
+
+    ``請求書^2`` gives ``{"keyword": "請求書", "weight": 2.0}``; other
+    entries stay plain strings.
+    """
+    keywords: List[Any] = []
+    for part in text.split(","):
+        part = part.strip()
+        keyword, sep, weight = part.rpartition("^")
+        if sep and keyword.strip():
+            try:
+                keywords.append({"keyword": keyword.strip(), "weight": float(weight)})
+                continue
+            except ValueError:
+                pass
+        if part:
+            keywords.append(part)
+    return keywords
+
+
+def format_keywords(keywords: Iterable[Any]) -> str:
+    """Inverse of :func:`parse_keywords` (weight 1 is written without ``^``)."""
+    parts = []
+    for keyword, weight in keyword_weights(keywords).items():
+        parts.append(keyword if weight == 1.0 else f"{keyword}^{weight:g}")
+    return ", ".join(parts)
+
+
+class KeywordIndex:
+    """Inverted index from keywords to the templates that use them.
+
+    Templates are added, replaced and removed one at a time; the automaton
+    is rebuilt lazily on the next query after a change.
+    """
+
+    def __init__(self) -> None:
+        self._templates: Dict[str, Dict[str, float]] = {}
+        # 各キーワードを使うテンプレートと重み (オートマトンのパターン順)
+        self._postings: List[List[Tuple[str, float]]] = []
+        self._automaton: Optional[AhoCorasick] = None
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def update(self, name: str, keywords: Iterable[Any]) -> None:
+        """Add or replace the keywords of template ``name``."""
+        weights = keyword_weights(keywords)
+        if self._templates.get(name) != weights:
+            self._templates[name] = weights
+            self._automaton = None
+
+    def remove(self, name: str) -> None:
+        if self._templates.pop(name, None) is not None:
+            self._automaton = None
+
+    def _compile(self) -> AhoCorasick:
+        if self._automaton is None:
+            postings: Dict[str, List[Tuple[str, float]]] = {}
+            for name, weights in self._templates.items():
+                for keyword, weight in weights.items():
+                    postings.setdefault(keyword, []).append((name, weight))
+            self._postings = list(postings.values())
+            self._automaton = AhoCorasick(list(postings))
+        return self._automaton
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Score every template with at least one keyword in ``text``."""
+        automaton = self._compile()
+        if not text or not len(automaton):
+            return {}
+        found = {index for _, index in automaton.iter_matches(text)}
+        scores: Dict[str, float] = {}
+        for index in found:
+            for name, weight in self._postings[index]:
+                scores[name] = scores.get(name, 0.0) + weight
+        return scores
+
+    def rank(self, text: str, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(template, score)`` pairs, best first.
+
+        Ties are broken by template name so the order is stable.
+        """
+        ranked = sorted(self.scores(text).items(), key=lambda item: (-item[1], item[0]))
+        return ranked if k is None else ranked[:k]
@@ -0,0 +1,269 @@
+"""Local stand-in for the OpenAI chat-completions endpoint.
+
+The server answers ``POST /v1/chat/completions`` with deterministic OCR
+texts after a configurable latency, and can inject server errors and ``429``
+responses.  It is used by the load-test harness and the unit tests so that
+throughput can be measured without touching the real API.
+
+Run standalone with::
+
+    python -m core.mock_openai --port 8089 --latency 0.3 --rate-limit-rate 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import hashlib
+import json
+import random
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the mock server.
+
+    Attributes
+    ----------
+    latency:
+        Mean response latency in seconds.
+    distribution:
+        ``fixed``, ``uniform`` (0..2x mean), ``exponential`` or ``lognormal``.
+    error_rate:
+        Probability of answering ``500``.
+    rate_limit_rate:
+        Probability of answering ``429`` with ``Retry-After``.
+    retry_after:
+        Value advertised in ``Retry-After`` (seconds).
+    seed:
+        Seed for the random generator, for reproducible runs.
+    """
+
+    latency: float = 0.0
+    distribution: str = "fixed"
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: Optional[int] = None
+
+
+def mock_text(image_url: str) -> str:
+    """Deterministic text derived from an image payload."""
+    return f"MOCK{hashlib.sha1(image_url.encode()).hexdigest()[:8]}"
+
+
+def mock_usage(body: Dict[str, Any], text: str, images: int) -> Dict[str, int]:
+    """Plausible ``usage`` block: a flat 85 tokens per image plus the prompt."""
+    prompt = sum(
+        len(part.get("text", ""))
+        for message in body.get("messages", [])
+        for part in (message.get("content") if isinstance(message.get("content"), list) else [])
+    )
+    prompt_tokens = 85 * images + prompt
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(text),
+        "total_tokens": prompt_tokens + len(text),
+    }
+
+
+def mock_answer(body: Dict[str, Any]) -> Tuple[str, int]:
+    """Return the deterministic answer for a request body and its image count.
+
+    Batched requests (``response_format: json_object``) are answered with a
+    JSON object keyed by the ``field: <name>`` labels preceding each image.
+    """
+    content = body.get("messages", [{}])[-1].get("content", [])
+    if isinstance(content, str):
+        return "MOCK", 0
+    label = None
+    fields: Dict[str, str] = {}
+    images: List[str] = []
+    for part in content:
+        if part.get("type") == "text" and part.get("text", "").startswith("field: "):
+            label = part["text"][len("field: "):]
+        elif part.get("type") == "image_url":
+            url = part.get("image_url", {}).get("url", "")
+            images.append(url)
+            if label is not None:
+                fields[label] = mock_text(url)
+                label = None
+    if body.get("response_format", {}).get("type") == "json_object":
+        return json.dumps(fields, ensure_ascii=False), len(images)
+    return (mock_text(images[0]) if images else "MOCK"), len(images)
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    errors: int = 0
+    throttled: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    images: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+
+class MockOpenAIServer:
+    """aiohttp application emulating ``/v1/chat/completions``.
+
+    Parameters
+    ----------
+    config:
+        Latency and fault injection settings.
+    host, port:
+        Bind address.  ``port=0`` picks a free port.
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.stats = MockStats()
+        self._random = random.Random(self.config.seed)
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _latency(self) -> float:
+        cfg = self.config
+        if cfg.latency <= 0:
+            return 0.0
+        if cfg.distribution == "uniform":
+            return self._random.uniform(0, 2 * cfg.latency)
+        if cfg.distribution == "exponential":
+            return self._random.expovariate(1 / cfg.latency)
+        if cfg.distribution == "lognormal":
+            # 平均がlatencyになるよう sigma=0.5 の対数正規分布
+            return self._random.lognormvariate(0, 0.5) * cfg.latency / 1.1331
+        return cfg.latency
+
+    def _answer(self, body: Dict[str, Any]) -> Tuple[str, int]:
+        text, images = mock_answer(body)
+        self.stats.images += images
+        return text, images
+
+    async def handle_completions(self, request: web.Request) -> web.Response:
+        stats = self.stats
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            body = await request.json()
+            latency = self._latency()
+            await asyncio.sleep(latency)
+            stats.latencies.append(latency)
+            roll = self._random.random()
+            if roll < self.config.rate_limit_rate:
+                stats.throttled += 1
+                return web.json_response(
+                    {"error": {"message": "Rate limit reached", "type": "requests"}},
+                    status=429,
+                    headers={"Retry-After": str(self.config.retry_after)},
+                )
+            if roll < self.config.rate_limit_rate + self.config.error_rate:
+                stats.errors += 1
+                return web.json_response({"error": {"message": "mock server error"}}, status=500)
+            text, images = self._answer(body)
+            return web.json_response(
+                {
+                    "id": f"chatcmpl-mock-{stats.requests}",
+                    "object": "chat.completion",
+                    "model": body.get("model", "mock"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": mock_usage(body, text, images),
+                }
+            )
+        finally:
+            stats.in_flight -= 1
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.handle_completions)
+        return app
+
+    async def start(self) -> None:
+        """Start serving on the current event loop."""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self) -> "MockOpenAIServer":
+        """Serve from a background thread with its own event loop."""
+        started = threading.Event()
+
+        def serve() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self) -> None:
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+            self._loop = None
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start_in_thread()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop_thread()
+
+
+def main() -> None:  # pragma: no cover - manual use
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        distribution=args.distribution,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = MockOpenAIServer(config, args.host, args.port)
+    web.run_app(server.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
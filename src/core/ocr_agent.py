@@ -1,21 +1,57 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 import json
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
 
 import cv2
 import numpy as np
 
-from . import preprocess
-from .ocr_bridge import BaseOCR
+from . import usage
+from .batch_api import BATCH_DISCOUNT, BatchClient, BatchDocument, BatchJob
+from .config import settings
+from .http_client import default_pool
+from .ocr_bridge import BaseOCR, OpenAIVisionOCR
 from .ocr_processor import OCRProcessor
+from .payload import PayloadStats
+from .preprocess import Alignment
+from .preprocess_pool import PreprocessPool, prepare_crops
 
 from .db_manager import DBManager
-from .template_manager import TemplateManager
+from .template_manager import CompiledTemplate, TemplateManager
+
+T = TypeVar("T")
+TemplateData = Union[Dict[str, Any], CompiledTemplate]
+
+
+@dataclass
+class DocumentResult:
+    """Outcome of one document processed by :meth:`OcrAgent.process_documents`."""
+
+    image_name: str
+    results: Optional[Dict[str, dict]] = None
+    workspace_dir: Optional[str] = None
+    template_name: str = ""
+    template_detected: bool = True
+    error: Optional[BaseException] = None
 
 
 @dataclass
@@ -24,19 +60,106 @@ class OcrAgent:
 
     The agent ties together template handling, preprocessing, OCR execution
     and database persistence into a single entry point.
+
+    By default every call runs on a fresh event loop and the session the
+    shared :data:`~core.http_client.default_pool` opened on it is closed
+    afterwards.  Calling :meth:`open` (or using the agent as a context
+    manager) keeps a single event loop alive until :meth:`close`, so pooled
+    connections are reused across documents and jobs.  Engines never close
+    the shared pool themselves.
+
+    ``payload_stats`` accumulates the bytes and image tokens saved by the
+    payload encoding stage over every document processed by the agent, and
+    ``alignment_stats`` counts the documents per alignment tier
+    (:class:`~core.preprocess.Alignment`); each document's tier is also
+    written to its ``stats.json``.
+
+    The tokens, latency, retries and cost of every engine call are stored per
+    ROI in the database.  Once the day's tokens reach ``daily_token_budget``
+    (``settings.DAILY_TOKEN_BUDGET`` by default, ``0`` disables the check)
+    new documents are refused with :class:`~core.usage.BudgetExceededError`.
+
+    With ``preprocess_workers`` (``settings.PREPROCESS_WORKERS`` by default)
+    above ``0``, alignment and cropping run in a :class:`PreprocessPool` of
+    that many processes instead of a thread of this process.  The pool is
+    started on first use and stopped by :meth:`close`.
     """
 
     db: DBManager
     templates: TemplateManager
+    daily_token_budget: Optional[int] = None
+    preprocess_workers: Optional[int] = None
+    payload_stats: PayloadStats = field(default_factory=PayloadStats, init=False)
+    alignment_stats: Dict[str, int] = field(default_factory=dict, init=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(default=None, init=False, repr=False)
+    _engines: Set[BaseOCR] = field(default_factory=set, init=False, repr=False)
+    _pool: Optional[PreprocessPool] = field(default=None, init=False, repr=False)
+    _pool_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def open(self) -> "OcrAgent":
+        """Start a persistent event loop for subsequent OCR calls."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self
+
+    def close(self) -> None:
+        """Release pooled engine resources and stop the persistent loop."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+        if self._loop is None:
+            return
+        loop, self._loop = self._loop, None
+        try:
+            loop.run_until_complete(self._close_engines(self._engines))
+            loop.run_until_complete(default_pool.close_loop_session())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            self._engines.clear()
+            loop.close()
+
+    def __enter__(self) -> "OcrAgent":
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @staticmethod
+    async def _close_engines(engines: Iterable[BaseOCR]) -> None:
+        for engine in engines:
+            await engine.aclose()
+
+    def _run(self, coro: Awaitable[T], engines: Iterable[Optional[BaseOCR]]) -> T:
+        """Run ``coro`` on the persistent loop or a one-off loop."""
+        used = {e for e in engines if e is not None}
+        if self._loop is not None:
+            self._engines.update(used)
+            return self._loop.run_until_complete(coro)
+
+        async def run_once() -> T:
+            try:
+                return await coro
+            finally:
+                await self._close_engines(used)
+                # この一時ループで開いた共有プールのセッションだけを閉じる
+                await default_pool.close_loop_session()
+
+        return asyncio.run(run_once())
+
+    def recognize(self, engine: BaseOCR, image: np.ndarray) -> Tuple[str, float]:
+        """Run a single OCR call, e.g. for template auto-detection."""
+        return self._run(engine.run(image), [engine])
 
     def process_document(
         self,
         image: np.ndarray,
         image_name: str,
-        template_data: Dict[str, any],
+        template_data: TemplateData,
         ocr_engine: BaseOCR,
         validator_engine: BaseOCR | None = None,
         job_id: int | None = None,
+        local_engine: BaseOCR | None = None,
     ) -> Tuple[Dict[str, dict], str]:
         """Process a single document and persist results.
 
@@ -47,7 +170,8 @@ class OcrAgent:
         image_name:
             Original filename of the uploaded image.
         template_data:
-            Loaded template definition containing ROI information.
+            Loaded template definition containing ROI information, either as
+            raw data or as a :class:`CompiledTemplate`.
         ocr_engine:
             OCR engine implementation used for primary text extraction.
         validator_engine:
@@ -56,6 +180,10 @@ class OcrAgent:
             Existing database job identifier. If ``None``, a new job is created
             per document. When provided, all results are associated with the
             supplied job, enabling multiple images under a single job.
+        local_engine:
+            Optional CPU engine (e.g. :class:`GlyphClassifierOCR`) tried first
+            on ROIs with a numeric ``validation_rule``.  The API engines are
+            only called when its confidence is below the threshold.
 
         Returns
         -------
@@ -65,65 +193,561 @@ class OcrAgent:
             Path to the workspace directory used for intermediate files.
         """
 
+        return self._run(
+            self.aprocess_document(
+                image,
+                image_name,
+                template_data,
+                ocr_engine,
+                validator_engine=validator_engine,
+                job_id=job_id,
+                local_engine=local_engine,
+            ),
+            [ocr_engine, validator_engine, local_engine],
+        )
+
+    async def aprocess_document(
+        self,
+        image: np.ndarray,
+        image_name: str,
+        template_data: TemplateData,
+        ocr_engine: BaseOCR,
+        validator_engine: BaseOCR | None = None,
+        job_id: int | None = None,
+        local_engine: BaseOCR | None = None,
+        roi_limit: Optional[asyncio.Semaphore] = None,
+    ) -> Tuple[Dict[str, dict], str]:
+        """Asynchronous counterpart of :meth:`process_document`.
+
+        Preprocessing runs in a worker thread so other documents on the same
+        loop keep their API calls going.  ``roi_limit`` caps the number of
+        ROIs in flight across every document sharing the semaphore.
+        """
         now = datetime.now()
-        doc_id = f"DOC_{now.strftime('%Y%m%d_%H%M%S')}"
-        workspace_dir = Path("workspace") / doc_id
+        self.check_budget(now)
+        template = self.templates.compile(template_data)
+        pool = self.preprocess_pool()
+        prepared = await pool.crop(image, template) if pool is not None else None
+        workspace_dir, aligned_rois, crops, writes, alignment = await asyncio.to_thread(
+            self._prepare_workspace, image, template, now, prepared
+        )
+        self._count_alignment(alignment)
+
+        # Execute OCR
+        processor = OCRProcessor(
+            ocr_engine,
+            str(workspace_dir),
+            validator_engine=validator_engine,
+            rois=aligned_rois,
+            local_engine=local_engine,
+            crops=crops,
+            roi_limit=roi_limit,
+            template=template,
+        )
+        collector = usage.UsageCollector()
+        with usage.collect(collector):
+            results = await processor.process_all()
+        await asyncio.gather(*(asyncio.wrap_future(w) for w in writes))
+        _wait_writes(writes)
+        self.payload_stats.add(processor.payload_stats)
+        with (workspace_dir / "stats.json").open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "payload": processor.payload_stats.as_dict(),
+                    "usage": collector.summary(),
+                    "blank": processor.blank_stats(),
+                    "alignment": alignment.as_dict(),
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+        if job_id is None:
+            job_id = self.db.create_job(template.name, now.isoformat())
+        self._persist(processor, results, job_id, image_name)
+        self.db.add_usage(job_id, image_name, collector.as_list(), now.isoformat(), template.name)
+        self.db.add_skipped_calls(job_id, image_name, processor.skipped_calls, now.isoformat())
+        return results, str(workspace_dir)
+
+    async def _process_one(
+        self,
+        image_name: str,
+        image: np.ndarray,
+        template_data: Optional[TemplateData],
+        ocr_engine: BaseOCR,
+        detect_engine: Optional[BaseOCR],
+        default_template: Optional[TemplateData],
+        roi_limit: asyncio.Semaphore,
+        **kwargs: Any,
+    ) -> DocumentResult:
+        detected = True
+        try:
+            if template_data is None:
+                # 参照画像の指紋で判定できればページ全体のOCRは行わない
+                match = await asyncio.to_thread(self.templates.detect_template_image, image)
+                if match is None:
+                    if detect_engine is None:
+                        raise ValueError("template_data is None and no detect_engine was given")
+                    async with roi_limit:
+                        text, _ = await detect_engine.run(image)
+                    match = self.templates.detect_template(text)
+                detected = match is not None
+                template_data = self.templates.load_compiled(match[0]) if match else default_template
+                if template_data is None:
+                    raise ValueError(f"no template detected for {image_name}")
+            template = self.templates.compile(template_data)
+            results, workspace_dir = await self.aprocess_document(
+                image, image_name, template, ocr_engine, roi_limit=roi_limit, **kwargs
+            )
+        except Exception as exc:
+            return DocumentResult(image_name, error=exc)
+        return DocumentResult(
+            image_name,
+            results=results,
+            workspace_dir=workspace_dir,
+            template_name=template.name,
+            template_detected=detected,
+        )
+
+    async def process_documents(
+        self,
+        documents: Iterable[Tuple[str, np.ndarray, Optional[Dict[str, Any]]]],
+        ocr_engine: BaseOCR,
+        validator_engine: BaseOCR | None = None,
+        job_id: int | None = None,
+        local_engine: BaseOCR | None = None,
+        detect_engine: BaseOCR | None = None,
+        default_template: Optional[Dict[str, Any]] = None,
+        max_in_flight_rois: Optional[int] = None,
+        max_documents: Optional[int] = None,
+    ) -> AsyncIterator[DocumentResult]:
+        """Process many documents concurrently, yielding results as they complete.
+
+        ``documents`` yields ``(image_name, image, template_data)`` and is
+        consumed lazily, so at most ``max_documents`` images are held in
+        memory.  A ``template_data`` of ``None`` is detected from the page
+        image (:meth:`TemplateManager.detect_template_image`) or, when that
+        is ambiguous, from the text read by ``detect_engine``, falling back
+        to ``default_template``.  All documents
+        share one limit of ``max_in_flight_rois`` concurrent ROIs.  Failures
+        are reported in :attr:`DocumentResult.error`; once the daily token
+        budget is exceeded no further documents are started.
+        """
+        roi_limit = asyncio.Semaphore(max_in_flight_rois or settings.MAX_IN_FLIGHT_ROIS)
+        max_documents = max_documents or settings.MAX_CONCURRENT_DOCUMENTS
+        iterator = iter(documents)
+        pending: Set[asyncio.Task] = set()
+        exhausted = False
+
+        def start_next() -> None:
+            nonlocal exhausted
+            while not exhausted and len(pending) < max_documents:
+                try:
+                    image_name, image, template_data = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    return
+                coro = self._process_one(
+                    image_name,
+                    image,
+                    template_data,
+                    ocr_engine,
+                    detect_engine,
+                    default_template,
+                    roi_limit,
+                    validator_engine=validator_engine,
+                    job_id=job_id,
+                    local_engine=local_engine,
+                )
+                pending.add(asyncio.ensure_future(coro))
+
+        start_next()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    result = task.result()
+                    if isinstance(result.error, usage.BudgetExceededError):
+                        exhausted = True
+                    yield result
+                start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def iter_documents(
+        self,
+        documents: Iterable[Tuple[str, np.ndarray, Optional[Dict[str, Any]]]],
+        ocr_engine: BaseOCR,
+        **kwargs: Any,
+    ) -> Iterator[DocumentResult]:
+        """Synchronous iterator over :meth:`process_documents`.
+
+        Runs on the persistent loop (opening one for the duration if needed),
+        so callers such as the Streamlit page can update progress per
+        document while the others keep running.
+        """
+        opened_here = self._loop is None
+        loop = self.open()._loop
+        assert loop is not None
+        self._engines.update(
+            e
+            for e in (ocr_engine, kwargs.get("validator_engine"), kwargs.get("local_engine"), kwargs.get("detect_engine"))
+            if e is not None
+        )
+        agen = self.process_documents(documents, ocr_engine, **kwargs)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(agen.aclose())
+            if opened_here:
+                self.close()
+
+    def _count_alignment(self, alignment: Alignment) -> None:
+        self.alignment_stats[alignment.method] = self.alignment_stats.get(alignment.method, 0) + 1
+
+    def preprocess_pool(self) -> Optional[PreprocessPool]:
+        """Return the shared preprocessing pool, or ``None`` when disabled."""
+        workers = settings.PREPROCESS_WORKERS if self.preprocess_workers is None else self.preprocess_workers
+        if workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = PreprocessPool(workers)
+            return self._pool
+
+    def check_budget(self, now: Optional[datetime] = None) -> None:
+        """Raise :class:`BudgetExceededError` if today's token budget is used up."""
+        budget = settings.DAILY_TOKEN_BUDGET if self.daily_token_budget is None else self.daily_token_budget
+        if not budget:
+            return
+        day = (now or datetime.now()).date().isoformat()
+        used = self.db.daily_tokens(day)
+        if used >= budget:
+            raise usage.BudgetExceededError(f"daily token budget exhausted ({used:,} / {budget:,} tokens)")
+
+    @staticmethod
+    def _new_workspace(now: datetime) -> Path:
+        """Create a unique ``workspace/DOC_<timestamp>`` directory."""
+        base = Path("workspace") / f"DOC_{now.strftime('%Y%m%d_%H%M%S')}"
+        workspace_dir, n = base, 1
+        # 同一秒内に複数ドキュメントを処理してもディレクトリが衝突しないようにする
+        while True:
+            try:
+                workspace_dir.mkdir(parents=True)
+                return workspace_dir
+            except FileExistsError:
+                n += 1
+                workspace_dir = base.with_name(f"{base.name}_{n}")
+
+    def _prepare_workspace(
+        self,
+        image: np.ndarray,
+        template: CompiledTemplate,
+        now: datetime,
+        prepared: Optional[Tuple[np.ndarray, Dict[str, np.ndarray], Alignment]] = None,
+    ) -> Tuple[Path, Dict[str, Any], Dict[str, np.ndarray], List[Future], Alignment]:
+        """Align and crop ``image`` into a new workspace.
+
+        Skew and template alignment are combined into one affine transform
+        (:func:`preprocess.page_transform`) and only the pixels of each ROI
+        are resampled, so the page itself is never warped.  Returns the
+        workspace path, the aligned ROI definitions, the crops keyed by ROI
+        name, the pending background writes of the crop files and the
+        alignment used.  ``prepared`` holds boxes, crops and alignment already
+        computed by the :class:`PreprocessPool`.
+        """
+        workspace_dir = self._new_workspace(now)
         crops_dir = workspace_dir / "crops"
-        workspace_dir.mkdir(parents=True, exist_ok=True)
         crops_dir.mkdir(parents=True, exist_ok=True)
 
         # Save template for traceability
         with (workspace_dir / "template.json").open("w", encoding="utf-8") as f:
-            json.dump(template_data, f, ensure_ascii=False, indent=2)
+            json.dump(template.to_dict(), f, ensure_ascii=False, indent=2)
 
-        rois = template_data.get("rois", {})
+        # 傾き補正と位置合わせを1つの変換にまとめ、ROIごとに切り出す
+        if prepared is None:
+            boxes, cropped, alignment = prepare_crops(image, template.boxes, template.reference)
+            prepared = (boxes, dict(zip(template.roi_names, cropped)), alignment)
+        boxes, crops, alignment = prepared
+        aligned_rois = template.aligned_rois(boxes)
+        # 切り出し画像の保存はOCRの裏でバックグラウンドスレッドに任せる
+        writer = _crop_writer()
+        writes = [
+            writer.submit(cv2.imwrite, str(crops_dir / OCRProcessor.crop_filename(i, key)), cropped)
+            for i, (key, cropped) in enumerate(crops.items(), start=1)
+        ]
+        return workspace_dir, aligned_rois, crops, writes, alignment
 
-        # Preprocess image and align ROIs
-        corrected_image = preprocess.correct_skew(image)
+    def _persist(
+        self, processor: OCRProcessor, results: Dict[str, dict], job_id: int, image_name: str
+    ) -> None:
+        """Store ``results`` in the database and rewrite ``extract.json`` with result IDs.
 
-        template_path = template_data.get("template_image_path")
-        if template_path and Path(template_path).exists():
-            template_img = cv2.imread(str(template_path))
-            aligned_rois = preprocess.align_rois(template_img, corrected_image, rois)
-        else:
-            aligned_rois = rois
+        Retryable entries are stored with status ``"retry"`` and no final text.
+        """
+        for roi_name, info in results.items():
+            result_id = self.db.add_result(job_id, image_name, roi_name, **self._result_columns(info))
+            info["result_id"] = result_id
+        processor.write_extract(results)
 
-        for i, (key, roi_info) in enumerate(aligned_rois.items()):
-            box = roi_info["box"]
-            cropped = preprocess.crop_roi(corrected_image, box)
-            filename = f"P{i+1}_{key}.png"
-            cv2.imwrite(str(crops_dir / filename), cropped)
+    @staticmethod
+    def _result_columns(info: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "text_mini": info.get("text_mini"),
+            "text_nano": info.get("text_nano"),
+            "final_text": None if info.get("retryable") else info["text"],
+            "confidence_score": info["confidence"],
+            "status": info.get("confidence_level"),
+        }
 
-        # Execute OCR
-        corrections = template_data.get("corrections", [])
+    def retry_failed(
+        self,
+        workspace_dir: str,
+        ocr_engine: BaseOCR,
+        validator_engine: BaseOCR | None = None,
+        local_engine: BaseOCR | None = None,
+    ) -> Dict[str, dict]:
+        """Run OCR again for the retryable fields of a processed document.
+
+        The stored crops are reused, and the database rows and
+        ``extract.json`` are updated in place.  Returns the merged results.
+        """
+        workspace = Path(workspace_dir)
+        with (workspace / "template.json").open("r", encoding="utf-8") as f:
+            template = self.templates.compile(json.load(f))
+        with (workspace / "extract.json").open("r", encoding="utf-8") as f:
+            results = json.load(f)
+        pending = [info["source_image"] for info in results.values() if info.get("retryable")]
+        processor = OCRProcessor(
+            ocr_engine,
+            str(workspace),
+            validator_engine=validator_engine,
+            local_engine=local_engine,
+            template=template,
+        )
+        if not pending:
+            return results
+        now = datetime.now()
+        self.check_budget(now)
+        collector = usage.UsageCollector()
+        with usage.collect(collector):
+            retried = self._run(processor.process_files(pending), [ocr_engine, validator_engine])
+        self.payload_stats.add(processor.payload_stats)
+        row = None
+        for key, info in retried.items():
+            result_id = results.get(key, {}).get("result_id")
+            if result_id is not None:
+                self.db.update_ocr_result(result_id, **self._result_columns(info))
+                info["result_id"] = result_id
+                row = row or self.db.fetch_result(result_id)
+            results[key] = info
+        processor.write_extract(results)
+        if row is not None:
+            self.db.add_usage(
+                row["job_id"], row["image_name"], collector.as_list(), now.isoformat(), template.name
+            )
+        return results
+
+    def add_to_batch(
+        self,
+        batch: BatchJob,
+        image: np.ndarray,
+        image_name: str,
+        template_data: TemplateData,
+        ocr_engine: BaseOCR,
+        validator_engine: BaseOCR | None = None,
+        job_id: int | None = None,
+    ) -> str:
+        """Crop a document and queue its ROI requests in ``batch``.
+
+        The engines must build chat-completions requests
+        (:class:`~core.ocr_bridge.OpenAIVisionOCR`, optionally wrapped in
+        :class:`~core.ocr_cache.CachedOCR`).  Returns the workspace directory;
+        results are written by :meth:`ingest_batch`.
+        """
+        now = datetime.now()
+        self.check_budget(now)
+        template = self.templates.compile(template_data)
+        workspace_dir, aligned_rois, crops, writes, alignment = self._prepare_workspace(image, template, now)
+        self._count_alignment(alignment)
+        doc_id = workspace_dir.name
         processor = OCRProcessor(
             ocr_engine,
             str(workspace_dir),
             validator_engine=validator_engine,
             rois=aligned_rois,
-            corrections=corrections,
+            template=template,
         )
-        results = asyncio.run(processor.process_all())
+        roles = [("primary", _request_engine(ocr_engine))]
+        if validator_engine is not None:
+            roles.append(("validator", _request_engine(validator_engine)))
+        blank: Dict[str, float] = {}
+        for key, crop in crops.items():
+            confidence = processor.check_blank(key, crop)
+            if confidence is not None:
+                # 空欄はバッチに含めず、取り込み時に空文字として記録する
+                blank[key] = confidence
+                continue
+            inputs = processor.engine_inputs(key, crop)
+            for (role, engine), engine_input in zip(roles, inputs):
+                batch.add_request(doc_id, key, role, engine.build_request(engine_input))
+        self.payload_stats.add(processor.payload_stats)
+        _wait_writes(writes)
 
-        # Persist to database
-        if job_id is None:
-            job_id = self.db.create_job(template_data.get("name", ""), now.isoformat())
-        for roi_name, info in results.items():
-            result_id = self.db.add_result(
-                job_id,
-                image_name,
-                roi_name,
-                text_mini=info.get("text_mini"),
-                text_nano=info.get("text_nano"),
-                final_text=info["text"],
-                confidence_score=info["confidence"],
-                status=info.get("confidence_level"),
+        batch.add_document(
+            BatchDocument(
+                doc_id=doc_id,
+                workspace_dir=str(workspace_dir),
+                image_name=image_name,
+                template_name=template.name,
+                job_id=job_id,
+                rois=aligned_rois,
+                corrections=template.get("corrections", []),
+                blank=blank,
             )
-            info["result_id"] = result_id
+        )
+        return str(workspace_dir)
 
-        # Overwrite extract.json with result IDs included
-        extract_path = workspace_dir / "extract.json"
-        with extract_path.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+    def submit_batch(self, batch: BatchJob, client: BatchClient) -> str:
+        """Write and submit ``batch``; the batch ids are stored in its manifest.
 
-        return results, str(workspace_dir)
+        Each shard file (see :meth:`BatchJob.write`) is submitted as its own
+        batch.  The manifest is saved after every submission, so calling this
+        again after a failure, also on a job restored with
+        :meth:`BatchJob.load`, submits only the remaining shard files as they
+        were written.
+        """
+        paths = batch.write()
+        for path in paths[len(batch.batch_ids):]:
+            batch.batch_ids.append(self._run(client.submit(str(path)), []))
+            batch.save_manifest()
+        return str(batch.batch_id)
+
+    def ingest_batch(
+        self,
+        batch: BatchJob,
+        client: BatchClient,
+        wait: bool = False,
+        poll_interval: float = 30.0,
+    ) -> Optional[Dict[str, Dict[str, dict]]]:
+        """Collect the results of a submitted batch.
+
+        Returns ``None`` while any of its batches is still running (unless
+        ``wait``), otherwise the results keyed by image name.  Requests that
+        failed in the batch are recorded like failed engine calls: they are
+        stored with status ``retry`` and :meth:`retry_failed` runs them
+        again.
+        """
+        if not batch.batch_ids:
+            raise ValueError("batch has not been submitted")
+
+        async def fetch() -> Optional[List[Dict[str, Any]]]:
+            if wait:
+                statuses = await asyncio.gather(
+                    *(client.wait(batch_id, poll_interval) for batch_id in batch.batch_ids)
+                )
+            else:
+                statuses = await asyncio.gather(*(client.status(batch_id) for batch_id in batch.batch_ids))
+                if not all(status.done for status in statuses):
+                    return None
+            outputs: List[Dict[str, Any]] = []
+            for lines in await asyncio.gather(*(client.results(status) for status in statuses)):
+                outputs.extend(lines)
+            return outputs
+
+        outputs = self._run(fetch(), [])
+        if outputs is None:
+            return None
+        grouped = BatchJob.split_outputs(outputs, OpenAIVisionOCR.parse_response)
+
+        combined: Dict[str, Dict[str, dict]] = {}
+        for doc in batch.documents.values():
+            processor = OCRProcessor(
+                None,  # type: ignore[arg-type]  # エンジン出力は取得済み
+                doc.workspace_dir,
+                rois=doc.rois,
+                corrections=doc.corrections,
+            )
+            outputs_for_doc = grouped.get(doc.doc_id, {})
+            results = processor.ingest(
+                outputs_for_doc.get("primary", {}),
+                outputs_for_doc.get("validator", {}) if batch.has_validator else None,
+                blank=doc.blank,
+            )
+            job_id = doc.job_id
+            now = datetime.now()
+            if job_id is None:
+                job_id = self.db.create_job(doc.template_name, now.isoformat())
+            self._persist(processor, results, job_id, doc.image_name)
+            self.db.add_usage(
+                job_id, doc.image_name, _batch_usage(outputs, doc.doc_id), now.isoformat(), doc.template_name
+            )
+            self.db.add_skipped_calls(
+                job_id, doc.image_name, {key: 1 + batch.has_validator for key in doc.blank}, now.isoformat()
+            )
+            combined[doc.image_name] = results
+        return combined
+
+
+_writer: Optional[ThreadPoolExecutor] = None
+_writer_lock = threading.Lock()
+
+
+def _crop_writer() -> ThreadPoolExecutor:
+    """Shared thread pool persisting crop files off the OCR critical path."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(
+                max_workers=settings.CROP_WRITER_THREADS, thread_name_prefix="crop-writer"
+            )
+        return _writer
+
+
+def _wait_writes(writes: Iterable[Future]) -> None:
+    """Block until the crop files are on disk, re-raising write errors."""
+    for future in writes:
+        if not future.result():
+            raise OSError("failed to write crop image")
+
+
+def _batch_usage(outputs: List[Dict[str, Any]], doc_id: str) -> List[Dict[str, Any]]:
+    """Usage records of a document's Batch API output lines."""
+    collector = usage.UsageCollector()
+    for line in outputs:
+        doc, _, roi = line["custom_id"].split("|", 2)
+        if doc != doc_id:
+            continue
+        body = (line.get("response") or {}).get("body") or {}
+        reported = body.get("usage") or {}
+        collector.add(
+            usage.UsageRecord(
+                model=body.get("model", ""),
+                prompt_tokens=int(reported.get("prompt_tokens") or 0),
+                completion_tokens=int(reported.get("completion_tokens") or 0),
+                image_tokens=0,
+                latency=0.0,
+                roi=roi,
+                discount=BATCH_DISCOUNT,
+            )
+        )
+    return collector.as_list()
+
+
+def _request_engine(engine: BaseOCR) -> OpenAIVisionOCR:
+    """Return the engine able to build Batch API request bodies."""
+    inner = engine
+    while not isinstance(inner, OpenAIVisionOCR) and hasattr(inner, "engine"):
+        inner = inner.engine
+    if not isinstance(inner, OpenAIVisionOCR):
+        raise TypeError(f"{type(engine).__name__} cannot be used in batch mode")
+    return inner
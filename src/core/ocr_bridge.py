@@ -3,23 +3,102 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-import base64
-from typing import Tuple
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional, Tuple, Union
 
 import aiohttp
-import cv2
 import numpy as np
 
+from . import usage
 from .config import settings
+from .http_client import HTTPClientPool, default_pool
+from .payload import ImageEncoder, ImagePayload, default_encoder
+from .rate_limit import (
+    AdaptiveRateLimiter,
+    RateLimitError,
+    RetryableError,
+    default_limiter,
+    parse_retry_after,
+)
+
+
+OCR_PROMPT = "この画像に書かれている日本語のテキストを、改行やスペースは無視して、全ての文字を繋げて書き出してください。"
+BATCH_OCR_PROMPT = (
+    "以下の各画像の直前にフィールド名を示します。各画像に書かれている日本語のテキストを、"
+    "改行やスペースは無視して全ての文字を繋げて書き出し、フィールド名をキー、読み取ったテキストを値とする"
+    "JSONオブジェクトのみを返してください。"
+)
+
+
+def _prompt_chars(body: Dict[str, Any]) -> int:
+    """Number of characters in the text parts of a chat-completions request."""
+    return sum(
+        len(part.get("text", ""))
+        for message in body.get("messages", [])
+        if isinstance(message.get("content"), list)
+        for part in message["content"]
+        if isinstance(part, dict) and part.get("type") == "text"
+    )
+
+
+class OCRError(Exception):
+    """Raised by an engine that could not produce a result for a crop.
+
+    Fields whose engine raised this error are marked retryable instead of
+    being stored as finished OCR results.
+    """
 
 
 class BaseOCR(ABC):
     """すべてのOCRエンジンのための抽象基底クラス"""
 
+    #: ``True`` if :meth:`run` also accepts a pre-encoded :class:`ImagePayload`.
+    accepts_payload: bool = False
+
     @abstractmethod
     async def run(self, image: np.ndarray) -> Tuple[str, float]:
         """画像を受け取り、(テキスト, 信頼度) のタプルを返す"""
 
+    async def run_batch(self, images: Dict[str, np.ndarray]) -> Dict[str, Tuple[str, float]]:
+        """Recognise several crops keyed by ROI name.
+
+        The default implementation simply runs :meth:`run` for every crop
+        concurrently.  Engines able to pack multiple images into a single
+        request override this.  Crops whose call raised :class:`OCRError`
+        are left out of the result.
+        """
+        keys = list(images)
+        outputs = await asyncio.gather(
+            *(self.run(images[key]) for key in keys), return_exceptions=True
+        )
+        results: Dict[str, Tuple[str, float]] = {}
+        for key, output in zip(keys, outputs):
+            if isinstance(output, OCRError):
+                continue
+            if isinstance(output, BaseException):
+                raise output
+            results[key] = output
+        return results
+
+    def cache_identity(self) -> str:
+        """Return a string identifying everything besides the image that
+        influences the engine's answer (used as part of cache keys)."""
+        return type(self).__qualname__
+
+    def batch_cache_identity(self) -> str:
+        """Like :meth:`cache_identity` for answers obtained by :meth:`run_batch`.
+
+        Engines whose batch requests use a different prompt return a
+        different identity, so batch answers are never served to
+        :meth:`run`.  The default :meth:`run_batch` calls :meth:`run`.
+        """
+        return self.cache_identity()
+
+    async def aclose(self) -> None:
+        """Release resources such as pooled connections held by the engine."""
+
 
 class DummyOCR(BaseOCR):
     """ダミーのOCRエンジン。常に固定のテキストと信頼度を返す。"""
@@ -30,106 +109,218 @@ class DummyOCR(BaseOCR):
         return dummy_text, 0.95
 
 
-class GPT4oMiniVisionOCR(BaseOCR):
-    """GPT-4o mini を利用したOCRエンジン"""
+class OpenAIVisionOCR(BaseOCR):
+    """Chat-completions based OCR engine using an OpenAI vision model.
 
-    async def run(self, image: np.ndarray) -> Tuple[str, float]:
-        _, buffer = cv2.imencode(".png", image)
-        base64_image = base64.b64encode(buffer).decode("utf-8")
+    Requests are sent through a shared :class:`HTTPClientPool` so that the
+    underlying connections are kept alive across crops, documents and jobs,
+    and are throttled by a shared :class:`AdaptiveRateLimiter` which retries
+    ``429`` and transient server errors.
+
+    Parameters
+    ----------
+    client:
+        Connection pool to use.  Defaults to the process wide pool shared by
+        all engines.  The engine does not own the pool and never closes it;
+        :class:`~core.ocr_agent.OcrAgent` closes the shared pool's session
+        when its event loop ends, a pool passed in is closed by its creator.
+    limiter:
+        Rate limiter to use.  Defaults to the process wide limiter so that all
+        engine instances draw from the same account quota.
+    encoder:
+        Encoder used when :meth:`run` receives a raw array instead of an
+        :class:`ImagePayload`.
+    base_url:
+        API root, e.g. a local mock server.  Defaults to
+        ``settings.OPENAI_BASE_URL``.
+    """
 
+    accepts_payload = True
+
+    model: str = "gpt-4.1-mini"
+    max_tokens: int = 300
+
+    def __init__(
+        self,
+        client: Optional[HTTPClientPool] = None,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+        encoder: Optional[ImageEncoder] = None,
+        base_url: Optional[str] = None,
+    ) -> None:
+        self.client = client or default_pool
+        self.limiter = limiter or default_limiter
+        self.encoder = encoder or default_encoder
+        self.base_url = (base_url or settings.OPENAI_BASE_URL).rstrip("/")
+        self.api_url = f"{self.base_url}/chat/completions"
+
+    def cache_identity(self) -> str:
+        return f"{self.model}|{self.max_tokens}|{OCR_PROMPT}"
+
+    def batch_cache_identity(self) -> str:
+        return f"{self.model}|{self.max_tokens}|{BATCH_OCR_PROMPT}"
+
+    def _payload(self, image: Union[np.ndarray, ImagePayload]) -> ImagePayload:
+        if isinstance(image, ImagePayload):
+            return image
+        return self.encoder.encode(image)
+
+    def estimate_tokens(self, payload: ImagePayload) -> int:
+        """Rough upper bound of tokens one request consumes (for TPM limits)."""
+        return payload.tokens + len(OCR_PROMPT) + self.max_tokens
+
+    async def _post(self, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one request, mapping throttling and transient errors."""
+        try:
+            session = await self.client.get_session()
+            async with session.post(self.api_url, headers=headers, json=payload) as resp:
+                if resp.status == 429:
+                    raise RateLimitError(await resp.text(), parse_retry_after(resp.headers))
+                if resp.status >= 500:
+                    raise RetryableError(f"OpenAI API server error ({resp.status})")
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise RuntimeError(
+                        f"OpenAI API request failed ({resp.status}): {error_text}"
+                    )
+                return await resp.json()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise RetryableError(str(e)) from e
+
+    @staticmethod
+    def _image_part(payload: ImagePayload) -> Dict[str, Any]:
+        return {
+            "type": "image_url",
+            "image_url": {"url": payload.data_url, "detail": payload.detail},
+        }
+
+    async def _complete(self, payload: Dict[str, Any], tokens: int, image_tokens: int = 0) -> Dict[str, Any]:
+        """Send a chat-completions request and return the decoded response.
+
+        The call's token usage, HTTP latency of the successful attempt and
+        number of retries are reported to :mod:`core.usage`.
+        """
         headers = {
             "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
             "Content-Type": "application/json",
         }
-        payload = {
-            "model": "gpt-4.1-mini",
+        attempts = 0
+        latency = 0.0
+
+        async def send() -> Dict[str, Any]:
+            nonlocal attempts, latency
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                return await self._post(headers, payload)
+            finally:
+                latency = time.perf_counter() - start
+
+        data = await self.limiter.call(send, tokens=tokens)
+        reported = data.get("usage") or {}
+        prompt_tokens = int(reported.get("prompt_tokens") or 0)
+        completion_tokens = int(reported.get("completion_tokens") or 0)
+        if not prompt_tokens:
+            # usage を返さない互換サーバーでは、実際に送ったプロンプトの長さと画像トークンから推定する
+            prompt_tokens = image_tokens + _prompt_chars(payload)
+        usage.record(
+            usage.UsageRecord(
+                model=self.model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                image_tokens=image_tokens,
+                latency=latency,
+                retries=attempts - 1,
+            )
+        )
+        return data
+
+    def build_request(self, image: Union[np.ndarray, ImagePayload]) -> Dict[str, Any]:
+        """Return the chat-completions request body for a single crop.
+
+        Used both for interactive calls and for Batch API submission files.
+        """
+        return {
+            "model": self.model,
             "messages": [
                 {
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": "この画像に書かれている日本語のテキストを、改行やスペースは無視して、全ての文字を繋げて書き出してください。",
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{base64_image}"},
+                            "text": OCR_PROMPT,
                         },
+                        self._image_part(self._payload(image)),
                     ],
                 }
             ],
-            "max_tokens": 300,
+            "max_tokens": self.max_tokens,
         }
 
+    @staticmethod
+    def parse_response(data: Dict[str, Any]) -> Tuple[str, float]:
+        """Extract ``(text, confidence)`` from a chat-completions response."""
+        return data["choices"][0]["message"]["content"].strip(), 0.99
+
+    async def run(self, image: Union[np.ndarray, ImagePayload]) -> Tuple[str, float]:
+        image = self._payload(image)
+        payload = self.build_request(image)
+
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=payload,
-                ) as resp:
-                    if resp.status != 200:
-                        error_text = await resp.text()
-                        raise RuntimeError(
-                            f"OpenAI API request failed ({resp.status}): {error_text}"
-                        )
-                    data = await resp.json()
-            text = data["choices"][0]["message"]["content"].strip()
-            confidence = 0.99
-            return text, confidence
-        except Exception as e:  # pragma: no cover - network errors
+            data = await self._complete(payload, self.estimate_tokens(image), image.tokens)
+            return self.parse_response(data)
+        except Exception as e:
             print(f"OpenAI API呼び出し中にエラーが発生しました: {e}")
-            return "エラー", 0.0
+            raise OCRError(str(e)) from e
 
+    async def run_batch(self, images: Dict[str, np.ndarray]) -> Dict[str, Tuple[str, float]]:
+        """Recognise several crops with a single request returning JSON.
 
-class GPT4oNanoVisionOCR(BaseOCR):
-    """GPT-4o nano を利用したOCRエンジン"""
-
-    async def run(self, image: np.ndarray) -> Tuple[str, float]:
-        _, buffer = cv2.imencode(".png", image)
-        base64_image = base64.b64encode(buffer).decode("utf-8")
+        Each crop is sent as its own ``image_url`` part preceded by a text part
+        carrying the field label, and the model is asked for a JSON object
+        keyed by field name.  Fields missing from the answer, or all of them
+        when the answer cannot be parsed, fall back to per-crop :meth:`run`.
+        """
+        if len(images) <= 1:
+            return await super().run_batch(images)
+        images = {key: self._payload(image) for key, image in images.items()}
 
-        headers = {
-            "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-            "Content-Type": "application/json",
-        }
+        content: list[Dict[str, Any]] = [{"type": "text", "text": BATCH_OCR_PROMPT}]
+        for key, image in images.items():
+            content.append({"type": "text", "text": f"field: {key}"})
+            content.append(self._image_part(image))
         payload = {
-            "model": "gpt-4.1-nano",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "この画像に書かれている日本語のテキストを、改行やスペースは無視して、全ての文字を繋げて書き出してください。",
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{base64_image}"},
-                        },
-                    ],
-                }
-            ],
-            "max_tokens": 300,
+            "model": self.model,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": self.max_tokens * len(images),
+            "response_format": {"type": "json_object"},
         }
+        tokens = sum(self.estimate_tokens(image) for image in images.values())
 
+        results: Dict[str, Tuple[str, float]] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=payload,
-                ) as resp:
-                    if resp.status != 200:
-                        error_text = await resp.text()
-                        raise RuntimeError(
-                            f"OpenAI API request failed ({resp.status}): {error_text}"
-                        )
-                    data = await resp.json()
-            text = data["choices"][0]["message"]["content"].strip()
-            confidence = 0.99
-            return text, confidence
+            data = await self._complete(payload, tokens, sum(image.tokens for image in images.values()))
+            answer = json.loads(data["choices"][0]["message"]["content"])
+            if isinstance(answer, dict):
+                for key in images:
+                    value = answer.get(key)
+                    if isinstance(value, (str, int, float)):
+                        results[key] = (str(value).strip(), 0.99)
         except Exception as e:  # pragma: no cover - network errors
-            print(f"OpenAI API呼び出し中にエラーが発生しました: {e}")
-            return "エラー", 0.0
+            print(f"バッチOCRに失敗したため個別処理に切り替えます: {e}")
+
+        missing = {key: image for key, image in images.items() if key not in results}
+        if missing:
+            results.update(await super().run_batch(missing))
+        return results
+
+
+class GPT4oMiniVisionOCR(OpenAIVisionOCR):
+    """GPT-4o mini を利用したOCRエンジン"""
+
+    model = "gpt-4.1-mini"
+
+
+class GPT4oNanoVisionOCR(OpenAIVisionOCR):
+    """GPT-4o nano を利用したOCRエンジン"""
 
+    model = "gpt-4.1-nano"
@@ -0,0 +1,269 @@
+"""Persistent content-addressed cache for OCR engine responses."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from .config import settings
+from .ocr_bridge import BaseOCR
+from .payload import ImagePayload, image_digest
+
+
+class OCRCache:
+    """SQLite backed ``key -> (text, confidence)`` store with LRU eviction.
+
+    The database runs in WAL mode so several worker processes can share one
+    cache file.  Entries older than ``max_age`` seconds (by last access) are
+    dropped, and when more than ``max_entries`` remain the least recently
+    used ones are evicted.
+
+    Parameters
+    ----------
+    db_path:
+        Location of the SQLite file.
+    max_entries:
+        Upper bound on the number of cached responses.
+    max_age:
+        Maximum idle time of an entry in seconds.
+    evict_every:
+        Number of insertions between eviction passes.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        max_age: Optional[float] = None,
+        evict_every: int = 100,
+    ) -> None:
+        self.db_path = Path(db_path or settings.OCR_CACHE_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = settings.OCR_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_age = (
+            settings.OCR_CACHE_MAX_AGE_DAYS * 86400 if max_age is None else max_age
+        )
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                cache_key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ocr_cache_access ON ocr_cache(last_access)"
+        )
+        self.conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return the cached result for ``key`` and refresh its LRU position."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT text, confidence, last_access FROM ocr_cache WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or now - row[2] > self.max_age:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE ocr_cache SET last_access = ? WHERE cache_key = ?", (now, key)
+            )
+            self.conn.commit()
+            self.hits += 1
+            return row[0], float(row[1])
+
+    def put(self, key: str, text: str, confidence: float) -> None:
+        """Store a result, evicting old entries periodically."""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO ocr_cache
+                    (cache_key, text, confidence, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, text, confidence, now, now),
+            )
+            self.conn.commit()
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove expired and least recently used entries.  Returns the count."""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "DELETE FROM ocr_cache WHERE last_access < ?", (time.time() - self.max_age,)
+            )
+            removed = cur.rowcount
+            (count,) = cur.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()
+            if count > self.max_entries:
+                cur.execute(
+                    """
+                    DELETE FROM ocr_cache WHERE cache_key IN (
+                        SELECT cache_key FROM ocr_cache ORDER BY last_access ASC LIMIT ?
+                    )
+                    """,
+                    (count - self.max_entries,),
+                )
+                removed += cur.rowcount
+            self.conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()
+        return int(count)
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current hit rate."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CachedOCR(BaseOCR):
+    """Engine wrapper answering repeated crops from an :class:`OCRCache`.
+
+    The cache key combines the crop pixels with the wrapped engine's
+    :meth:`~BaseOCR.cache_identity` (model, prompt, ``max_tokens``); answers
+    from :meth:`run_batch` use :meth:`~BaseOCR.batch_cache_identity`, so an
+    answer to the multi-crop prompt is never returned for a single crop.
+    Identical crops requested concurrently are coalesced so only one call
+    reaches the wrapped engine.  Failed results (confidence ``0``) are never
+    cached.  The SQLite reads and writes run in a worker thread so they do
+    not block the event loop.
+
+    Parameters
+    ----------
+    engine:
+        The OCR engine to wrap.
+    cache:
+        Shared cache instance.
+    """
+
+    def __init__(self, engine: BaseOCR, cache: OCRCache) -> None:
+        self.engine = engine
+        self.cache = cache
+        # キャッシュキー -> 取得中の結果 (バッチで答えが得られなかった項目は None)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def accepts_payload(self) -> bool:  # type: ignore[override]
+        return self.engine.accepts_payload
+
+    def cache_identity(self) -> str:
+        return self.engine.cache_identity()
+
+    def batch_cache_identity(self) -> str:
+        return self.engine.batch_cache_identity()
+
+    @staticmethod
+    def _key(identity: str, image: Union[np.ndarray, ImagePayload]) -> str:
+        identity = hashlib.sha256(identity.encode()).hexdigest()
+        digest = image.key if isinstance(image, ImagePayload) else image_digest(image)
+        return f"{identity[:16]}:{digest}"
+
+    def _store(self, key: str, result: Tuple[str, float]) -> None:
+        text, confidence = result
+        if confidence > 0:
+            self.cache.put(key, text, confidence)
+
+    def _claim(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def _settle(self, key: str, future: asyncio.Future, result: Optional[Tuple[str, float]]) -> None:
+        if not future.done():
+            future.set_result(result)
+        self._inflight.pop(key, None)
+
+    def _fail(self, key: str, future: asyncio.Future, exc: BaseException) -> None:
+        if not future.done():
+            future.set_exception(exc)
+            future.exception()  # 待機者がいなくても警告を出さない
+        self._inflight.pop(key, None)
+
+    async def run(self, image: np.ndarray) -> Tuple[str, float]:
+        key = self._key(self.engine.cache_identity(), image)
+        # 同じ画像を取得中なら結果を待つ (バッチで答えが得られなかった場合は自分で呼ぶ)
+        while key in self._inflight:
+            result = await asyncio.shield(self._inflight[key])
+            if result is not None:
+                return result
+        # キャッシュ読み込みの待ち時間中に同じ画像が来ても二重に呼ばないよう、先に取得中として登録する
+        future = self._claim(key)
+        try:
+            result = await asyncio.to_thread(self.cache.get, key)
+            if result is None:
+                result = await self.engine.run(image)
+                await asyncio.to_thread(self._store, key, result)
+        except BaseException as exc:
+            self._fail(key, future, exc)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def run_batch(self, images: Dict[str, np.ndarray]) -> Dict[str, Tuple[str, float]]:
+        identity = self.engine.batch_cache_identity()
+        keys = {name: self._key(identity, image) for name, image in images.items()}
+        waiting = {name: self._inflight[key] for name, key in keys.items() if key in self._inflight}
+        owned = {key: self._claim(key) for key in dict.fromkeys(keys[n] for n in images if n not in waiting)}
+        results: Dict[str, Tuple[str, float]] = {}
+        try:
+            cached = await asyncio.to_thread(lambda: {key: self.cache.get(key) for key in owned})
+            missing = {
+                name: image
+                for name, image in images.items()
+                if name not in waiting and cached[keys[name]] is None
+            }
+            fresh = await self.engine.run_batch(missing) if missing else {}
+            await asyncio.to_thread(lambda: [self._store(keys[name], r) for name, r in fresh.items()])
+        except BaseException as exc:
+            for key, future in owned.items():
+                self._fail(key, future, exc)
+            raise
+        for name, key in keys.items():
+            if key in owned:
+                result = cached[key] if cached[key] is not None else fresh.get(name)
+                self._settle(key, owned[key], result)
+                if result is not None:
+                    results[name] = result
+        for name, pending in waiting.items():
+            result = await asyncio.shield(pending)
+            if result is not None:
+                results[name] = result
+        return {name: results[name] for name in images if name in results}
+
+    async def aclose(self) -> None:
+        await self.engine.aclose()
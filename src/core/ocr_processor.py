@@ -3,13 +3,31 @@ import os
 import cv2
 import json
 import asyncio
-from typing import Optional, Dict, Any, Tuple, List
+import contextlib
+from typing import AsyncIterator, Optional, Dict, Any, Set, Tuple, List, Union
 
-from .ocr_bridge import BaseOCR
-from . import postprocess
+from .circuit_breaker import record_failovers
+from .config import settings
+from .ocr_bridge import BaseOCR, OCRError
+from .payload import ImageEncoder, ImagePayload, PayloadStats, default_encoder
+from . import postprocess, preprocess, usage
+from .corrections import CorrectionSet, compile_corrections
+from .template_manager import CompiledTemplate
 
 class OCRProcessor:
-    """OCR処理全体を管理するクラス"""
+    """OCR処理全体を管理するクラス
+
+    ``crops`` を渡すとROI名をキーとするメモリ上の切り出し画像
+    (``numpy.ndarray`` またはエンコード済みの :class:`ImagePayload`) を直接処理し、
+    ``crops`` ディレクトリからの読み込みを行わない。
+
+    ``template`` に :class:`CompiledTemplate` を渡すと、コンパイル済みの検証ルールと
+    修正辞書をそのまま使い、``rois`` / ``corrections`` / ``batch_size`` の既定値も
+    テンプレートから取る。
+
+    ``blank_detection`` が有効な場合、インク量と連結成分から空欄と判定した項目は
+    APIを呼ばずに空文字として記録する (テンプレート画像があれば印刷済みの罫線等は除外)。
+    """
 
     def __init__(
         self,
@@ -17,45 +35,257 @@ class OCRProcessor:
         workspace_dir: str,
         validator_engine: Optional[BaseOCR] = None,
         rois: Optional[Dict[str, Any]] = None,
-        corrections: Optional[List[Dict[str, str]]] = None,
+        corrections: Union[None, CorrectionSet, List[Dict[str, str]]] = None,
+        batch_size: Optional[int] = None,
+        encoder: Optional[ImageEncoder] = None,
+        local_engine: Optional[BaseOCR] = None,
+        local_threshold: float = postprocess.CONF_THRESHOLD,
+        crops: Optional[Dict[str, Any]] = None,
+        roi_limit: Optional[asyncio.Semaphore] = None,
+        template: Optional[CompiledTemplate] = None,
+        blank_detection: Optional[bool] = None,
     ):
+        if template is not None:
+            rois = template.aligned_rois() if rois is None else rois
+            corrections = template.corrections if corrections is None else corrections
+            batch_size = template.batch_size if batch_size is None else batch_size
         self.primary_engine = primary_engine
         self.validator_engine = validator_engine
         self.workspace_dir = workspace_dir
         self.crops_dir = os.path.join(self.workspace_dir, "crops")
         self.rois = rois or {}
-        self.corrections = corrections or []
-
-    def _apply_corrections(self, text: str) -> str:
-        """Apply known text corrections to a normalized string."""
-        for item in self.corrections:
-            wrong = item.get("wrong")
-            correct = item.get("correct")
-            if wrong and correct:
-                text = text.replace(wrong, correct)
-        return text
-
-    async def _process_file(self, filename: str) -> Tuple[str, Dict[str, Any]]:
-        key = "_".join(filename.split("_")[1:]).replace(".png", "")
-        image_path = os.path.join(self.crops_dir, filename)
-        image = cv2.imread(image_path)
-
-        primary_text, primary_conf = await self.primary_engine.run(image)
+        self.validators = {
+            key: postprocess.compile_validation(info.get("validation_rule"))
+            for key, info in self.rois.items()
+        }
+        if template is not None:
+            self.validators.update(template.validators)
+        # 修正辞書はテンプレートごとに一度だけオートマトンへコンパイルする
+        self.corrections = compile_corrections(corrections)
+        # 1リクエストにまとめるROI数。1の場合はROIごとに個別リクエスト
+        self.batch_size = max(1, int(batch_size or 1))
+        # 各切り出し画像は一度だけエンコードし、両エンジンで共有する
+        self.encoder = encoder or default_encoder
+        self.payload_stats = PayloadStats()
+        # 数値のみの検証ルールを持つROIはまずローカルエンジンで読み取る
+        self.local_engine = local_engine
+        self.local_threshold = local_threshold
+        self.local_hits = 0
+        self.crops = crops
+        # 複数ドキュメントで共有する同時処理ROI数の上限 (バッチ時は1リクエストで1枠)
+        self.roi_limit = roi_limit
+        self.blank_detection = settings.BLANK_DETECTION if blank_detection is None else blank_detection
+        self.blank_masks = template.blank_masks if template is not None else {}
+        # 空欄と判定したROI名 -> 省略したAPI呼び出し数
+        self.skipped_calls: Dict[str, int] = {}
+
+    def _apply_corrections(self, text: str, key: Optional[str] = None) -> str:
+        """Apply known text corrections for ROI ``key`` to a normalized string."""
+        return self.corrections.apply(text, key)
+
+    @staticmethod
+    def _key_from_filename(filename: str) -> str:
+        return "_".join(filename.split("_")[1:]).replace(".png", "")
+
+    @staticmethod
+    def crop_filename(index: int, key: str) -> str:
+        """Name of the ``index``-th (1-based) crop file for ROI ``key``."""
+        return f"P{index}_{key}.png"
+
+    def _crop_items(self) -> List[Tuple[str, str, Any]]:
+        """``(key, filename, image)`` for every crop; ``image`` is ``None`` when on disk."""
+        if self.crops is not None:
+            return [
+                (key, self.crop_filename(i, key), image)
+                for i, (key, image) in enumerate(self.crops.items(), start=1)
+            ]
+        return [(self._key_from_filename(f), f, None) for f in self.crop_files()]
+
+    def _load(self, filename: str, image: Any) -> Any:
+        if image is None:
+            image = cv2.imread(os.path.join(self.crops_dir, filename))
+        return image
+
+    @contextlib.asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        if self.roi_limit is None:
+            yield
+            return
+        async with self.roi_limit:
+            yield
+
+    @staticmethod
+    def _pixels(image: Any) -> Any:
+        return image.image if isinstance(image, ImagePayload) else image
+
+    def engine_inputs(self, key: str, image: Any) -> Tuple[Any, Any]:
+        """Return the inputs for the primary and validator engines.
+
+        Engines accepting pre-encoded payloads receive the same
+        :class:`ImagePayload`, encoded once with the ROI's ``max_dim`` and
+        ``grayscale`` overrides; other engines get the raw crop.
+        """
+        engines = [self.primary_engine, self.validator_engine]
+        pixels = self._pixels(image)
+        if not any(e is not None and e.accepts_payload for e in engines):
+            return pixels, pixels
+        if isinstance(image, ImagePayload):
+            payload = image
+        else:
+            roi = self.rois.get(key, {})
+            payload = self.encoder.encode(
+                image,
+                max_dim=roi.get("max_dim"),
+                grayscale=roi.get("grayscale"),
+                stats=self.payload_stats,
+            )
+        return tuple(  # type: ignore[return-value]
+            payload if e is not None and e.accepts_payload else pixels for e in engines
+        )
+
+    async def _run_local(self, key: str, image: Any) -> Optional[Tuple[str, float]]:
+        """Read a numeric ROI locally; ``None`` means the API engines are needed.
+
+        A result below ``local_threshold`` or failing the ROI's validation
+        rule is dropped, so the field is read by the API engines instead of
+        going to review.
+        """
+        if self.local_engine is None:
+            return None
+        validator = self.validators.get(key)
+        if validator is None or not validator.numeric:
+            return None
+        result = await self.local_engine.run(self._pixels(image))
+        if result[1] < self.local_threshold:
+            return None
+        if not postprocess.check_validation(postprocess.normalize_text(result[0]), validator):
+            return None
+        self.local_hits += 1
+        return result
+
+    def check_blank(self, key: str, image: Any) -> Optional[float]:
+        """Return the blank confidence if crop ``image`` of ``key`` is empty, else ``None``."""
+        if not self.blank_detection:
+            return None
+        check = preprocess.detect_blank(
+            self._pixels(image),
+            self.blank_masks.get(key),
+            min_component_area=settings.BLANK_MIN_COMPONENT_AREA,
+            max_ink_ratio=settings.BLANK_MAX_INK_RATIO,
+            min_confidence=settings.BLANK_MIN_CONFIDENCE,
+        )
+        return check.confidence if check.blank else None
+
+    def _engine_count(self) -> int:
+        return 1 + (self.validator_engine is not None)
+
+    def blank_entry(self, key: str, filename: str, confidence: float) -> Dict[str, Any]:
+        """Entry for a field detected as empty; no engine was called."""
+        self.skipped_calls[key] = self._engine_count()
+        entry = {
+            "text": "",
+            "confidence": confidence,
+            "source_image": filename,
+            "text_mini": "",
+            "confidence_level": "blank",
+            "source_engine": "blank",
+        }
+        if not postprocess.check_validation("", self.validators.get(key)):
+            entry["needs_human"] = True
+        return entry
+
+    def blank_stats(self) -> Dict[str, int]:
+        return {"fields": len(self.skipped_calls), "calls_saved": sum(self.skipped_calls.values())}
+
+    def _evaluate_local(self, key: str, filename: str, result: Tuple[str, float]) -> Dict[str, Any]:
+        entry = self._evaluate(key, filename, result, None)
+        entry["source_engine"] = "local"
+        return entry
+
+    async def _process_crop(self, key: str, filename: str, image: Any) -> Tuple[str, Dict[str, Any]]:
+        usage.set_roi(key)
+        image = self._load(filename, image)
+        blank = self.check_blank(key, image)
+        if blank is not None:
+            return key, self.blank_entry(key, filename, blank)
+        local = await self._run_local(key, image)
+        if local is not None:
+            return key, self._evaluate_local(key, filename, local)
+        primary_input, validator_input = self.engine_inputs(key, image)
+        async with self._slot():
+            return key, await self._run_engines(key, filename, primary_input, validator_input)
+
+    async def _run_engines(
+        self, key: str, filename: str, primary_input: Any, validator_input: Any
+    ) -> Dict[str, Any]:
+        if self.validator_engine is None:
+            try:
+                with record_failovers() as failovers:
+                    primary = await self.primary_engine.run(primary_input)
+            except OCRError as exc:
+                return self._retry_entry(filename, exc)
+            return self._evaluate(key, filename, primary, None, fallback=bool(failovers))
+
+        # 主エンジンと検証エンジンを同時に実行し、ROI当たりの待ち時間を max(主, 検証) にする
+        validator_task = asyncio.ensure_future(self.validator_engine.run(validator_input))
+        try:
+            # 検証タスクの開始後に記録を始め、主エンジン側の切り替えだけを数える
+            with record_failovers() as failovers:
+                primary = await self.primary_engine.run(primary_input)
+        except BaseException as exc:
+            validator_task.cancel()
+            await asyncio.gather(validator_task, return_exceptions=True)
+            if isinstance(exc, OCRError):
+                return self._retry_entry(filename, exc)
+            raise
+        try:
+            secondary: Optional[Tuple[str, float]] = await validator_task
+        except OCRError:
+            # 検証エンジンが失敗した場合は主エンジンのみで判定する
+            secondary = None
+        return self._evaluate(key, filename, primary, secondary, fallback=bool(failovers))
+
+    @staticmethod
+    def _retry_entry(filename: str, error: Any = None) -> Dict[str, Any]:
+        """Entry for a field whose engine failed; it is retried later, not reviewed."""
+        return {
+            "text": "",
+            "confidence": 0.0,
+            "source_image": filename,
+            "confidence_level": "retry",
+            "retryable": True,
+            "error": str(error) if error else "no result",
+        }
+
+    def _evaluate(
+        self,
+        key: str,
+        filename: str,
+        primary: Tuple[str, float],
+        secondary: Optional[Tuple[str, float]],
+        fallback: bool = False,
+    ) -> Dict[str, Any]:
+        """Normalise engine outputs and build the ``extract.json`` entry.
+
+        ``fallback`` means the primary engine was bypassed by its circuit
+        breaker.  The fallback model may be the validator's own model, so an
+        agreement proves nothing: the entry is tagged
+        ``source_engine="fallback"`` and always sent to review.
+        """
+        primary_text, primary_conf = primary
         norm_primary = self._apply_corrections(
-            postprocess.normalize_text(primary_text)
+            postprocess.normalize_text(primary_text), key
         )
 
-        rule = None
-        if key in self.rois:
-            rule = self.rois[key].get("validation_rule")
+        rule = self.validators.get(key)
 
         norm_secondary = None
         needs_human = False
 
-        if self.validator_engine is not None:
-            secondary_text, _ = await self.validator_engine.run(image)
+        if secondary is not None:
+            secondary_text, _ = secondary
             norm_secondary = self._apply_corrections(
-                postprocess.normalize_text(secondary_text)
+                postprocess.normalize_text(secondary_text), key
             )
 
             if norm_primary == norm_secondary:
@@ -74,7 +304,7 @@ class OCRProcessor:
             norm_primary, needs_human = postprocess.postprocess_result(
                 primary_text, primary_conf, rule
             )
-            norm_primary = self._apply_corrections(norm_primary)
+            norm_primary = self._apply_corrections(norm_primary, key)
             confidence = primary_conf
             confidence_level = "high" if not needs_human else "low"
 
@@ -87,21 +317,133 @@ class OCRProcessor:
         }
         if norm_secondary is not None:
             entry["text_nano"] = norm_secondary
+        if fallback:
+            entry["source_engine"] = "fallback"
+            if confidence_level == "high":
+                entry["confidence"] = min(confidence, 0.5)
+                entry["confidence_level"] = "medium"
+            needs_human = True
         if needs_human:
             entry["needs_human"] = True
 
-        return key, entry
+        return entry
 
-    async def process_all(self) -> dict:
-        """cropsディレクトリ内の画像を並行処理し、結果をJSONにまとめる"""
+    async def _run_batches(
+        self, engine: BaseOCR, images: Dict[str, Any]
+    ) -> Dict[str, Tuple[str, float]]:
+        """Send ``images`` to ``engine`` in chunks of ``batch_size`` crops."""
+        keys = list(images)
+        chunks = [keys[i : i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+
+        async def run_chunk(chunk: List[str]) -> Dict[str, Tuple[str, float]]:
+            usage.set_roi(",".join(chunk))
+            async with self._slot():
+                return await engine.run_batch({k: images[k] for k in chunk})
+
+        outputs = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+        merged: Dict[str, Tuple[str, float]] = {}
+        for out in outputs:
+            merged.update(out)
+        return merged
+
+    async def _run_primary_batches(
+        self, images: Dict[str, Any], failovers: Set[Optional[str]]
+    ) -> Dict[str, Tuple[str, float]]:
+        """:meth:`_run_batches` on the primary engine, adding the keys read by
+        its fallback engine to ``failovers``."""
+        with record_failovers() as failed:
+            results = await self._run_batches(self.primary_engine, images)
+        # 単一画像の呼び出しで切り替わった場合 (None) はどの項目か分からないので全件とみなす
+        failovers.update(images if None in failed else failed)
+        return results
+
+    async def _process_batched(self, items: List[Tuple[str, str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        filenames = {key: filename for key, filename, _ in items}
+        images = {key: self._load(filename, image) for key, filename, image in items}
+        processed: List[Tuple[str, Dict[str, Any]]] = []
+        for key in list(images):
+            blank = self.check_blank(key, images[key])
+            if blank is not None:
+                processed.append((key, self.blank_entry(key, filenames.pop(key), blank)))
+                del images[key]
+                continue
+            local = await self._run_local(key, images[key])
+            if local is not None:
+                processed.append((key, self._evaluate_local(key, filenames.pop(key), local)))
+                del images[key]
+        if not images:
+            return processed
 
-        crop_files = sorted(f for f in os.listdir(self.crops_dir) if f.endswith(".png"))
-        tasks = [self._process_file(filename) for filename in crop_files]
-        processed = await asyncio.gather(*tasks)
-        results = {key: entry for key, entry in processed}
+        inputs = {key: self.engine_inputs(key, image) for key, image in images.items()}
+        failovers: Set[Optional[str]] = set()
+        primary_images = {key: pair[0] for key, pair in inputs.items()}
+        if self.validator_engine is not None:
+            validator_images = {key: pair[1] for key, pair in inputs.items()}
+            primary, secondary = await asyncio.gather(
+                self._run_primary_batches(primary_images, failovers),
+                self._run_batches(self.validator_engine, validator_images),
+            )
+        else:
+            primary, secondary = await self._run_primary_batches(primary_images, failovers), {}
+        for key, filename in filenames.items():
+            if key not in primary:
+                processed.append((key, self._retry_entry(filename)))
+            else:
+                processed.append((
+                    key,
+                    self._evaluate(key, filename, primary[key], secondary.get(key), fallback=key in failovers),
+                ))
+        return processed
 
+    def crop_files(self) -> List[str]:
+        return sorted(f for f in os.listdir(self.crops_dir) if f.endswith(".png"))
+
+    def write_extract(self, results: Dict[str, Any]) -> None:
         output_path = os.path.join(self.workspace_dir, "extract.json")
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(results, f, ensure_ascii=False, indent=4)
 
+    async def _process_items(self, items: List[Tuple[str, str, Any]]) -> dict:
+        if self.batch_size > 1:
+            processed = await self._process_batched(items)
+        else:
+            tasks = [self._process_crop(key, filename, image) for key, filename, image in items]
+            processed = await asyncio.gather(*tasks)
+        return {key: entry for key, entry in processed}
+
+    async def process_files(self, crop_files: List[str]) -> dict:
+        """Recognise the given crop files and return their entries."""
+        return await self._process_items([(self._key_from_filename(f), f, None) for f in crop_files])
+
+    async def process_all(self) -> dict:
+        """切り出し画像を並行処理し、結果をJSONにまとめる"""
+
+        results = await self._process_items(self._crop_items())
+        self.write_extract(results)
+        return results
+
+    def ingest(
+        self,
+        primary: Dict[str, Tuple[str, float]],
+        secondary: Optional[Dict[str, Tuple[str, float]]] = None,
+        blank: Optional[Dict[str, float]] = None,
+    ) -> dict:
+        """Build results from engine outputs obtained elsewhere (e.g. a Batch API run).
+
+        ``blank`` maps ROIs detected as empty (and never sent) to their blank
+        confidence.  Other ROIs without a primary output are marked retryable.
+        """
+        blank = blank or {}
+        results = {}
+        for key, filename, _ in self._crop_items():
+            if key in blank:
+                results[key] = self.blank_entry(key, filename, blank[key])
+                continue
+            if key not in primary:
+                results[key] = self._retry_entry(filename)
+                continue
+            results[key] = self._evaluate(
+                key, filename, primary[key], None if secondary is None else secondary.get(key)
+            )
+        self.write_extract(results)
         return results
@@ -0,0 +1,245 @@
+"""Shared image payload encoding for the vision OCR engines."""
+
+from __future__ import annotations
+
+import base64
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import math
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from .config import settings
+
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def image_digest(image: np.ndarray) -> str:
+    """Return a content hash of the image pixels including shape and dtype."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.shape}|{image.dtype}".encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """Estimate vision input tokens following OpenAI's tiling rules.
+
+    ``low`` detail images cost a flat 85 tokens.  ``high`` detail images are
+    scaled to fit 2048x2048, then so that the short side is at most 768px,
+    and cost 85 tokens plus 170 per 512px tile.
+    """
+    if detail == "low":
+        return 85
+    if width <= 0 or height <= 0:
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+@dataclass(frozen=True)
+class ImagePayload:
+    """A crop encoded once and ready to be embedded in a vision request.
+
+    Attributes
+    ----------
+    image:
+        The original crop the payload was produced from.
+    data:
+        Encoded image bytes.
+    mime:
+        MIME type of ``data``.
+    width, height:
+        Dimensions of the encoded image.
+    detail:
+        Vision ``detail`` level to request (``"low"`` for small crops).
+    key:
+        Hash of the original pixels plus the encoding options.
+    """
+
+    image: np.ndarray = field(repr=False, compare=False)
+    data: bytes = field(repr=False)
+    mime: str
+    width: int
+    height: int
+    detail: str
+    key: str
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.image.shape
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+    @property
+    def tokens(self) -> int:
+        return estimate_image_tokens(self.width, self.height, self.detail)
+
+
+@dataclass
+class PayloadStats:
+    """Counters describing what the payload stage saved."""
+
+    images: int = 0
+    reused: int = 0
+    bytes_sent: int = 0
+    baseline_bytes: int = 0
+    tokens: int = 0
+    baseline_tokens: int = 0
+
+    def add(self, other: "PayloadStats") -> None:
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "images": self.images,
+            "reused": self.reused,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.baseline_bytes - self.bytes_sent,
+            "tokens": self.tokens,
+            "tokens_saved": self.baseline_tokens - self.tokens,
+        }
+
+
+class ImageEncoder:
+    """Encode crops once, shrinking them to minimise bytes and vision tokens.
+
+    Each crop is optionally converted to grayscale, downsampled so its longest
+    side is at most ``max_dim`` and encoded in every candidate format, keeping
+    the smallest.  Crops small enough to be covered by a single low-detail
+    tile are sent with ``detail: low``.  Results are memoised by pixel hash
+    and options so the primary and validator engines share one encoding.
+
+    Parameters
+    ----------
+    max_dim:
+        Longest side after downsampling; ``None`` or ``0`` keeps the size.
+    grayscale:
+        Convert colour crops to a single channel.
+    formats:
+        Candidate formats among ``png``, ``jpeg`` and ``webp``.
+    jpeg_quality:
+        Quality used for the lossy formats.
+    low_detail_max:
+        Crops whose longest side does not exceed this use ``detail: low``.
+    memo_size:
+        Number of encoded payloads kept for reuse.
+    """
+
+    def __init__(
+        self,
+        max_dim: Optional[int] = None,
+        grayscale: Optional[bool] = None,
+        formats: Optional[Sequence[str]] = None,
+        jpeg_quality: int = 90,
+        low_detail_max: int = 512,
+        memo_size: int = 1024,
+    ) -> None:
+        self.max_dim = settings.PAYLOAD_MAX_DIM if max_dim is None else max_dim
+        self.grayscale = settings.PAYLOAD_GRAYSCALE if grayscale is None else grayscale
+        if formats is None:
+            formats = [f.strip() for f in settings.PAYLOAD_FORMATS.split(",") if f.strip()]
+        self.formats = tuple(f for f in formats if f in MIME_TYPES) or ("png",)
+        self.jpeg_quality = jpeg_quality
+        self.low_detail_max = low_detail_max
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, ImagePayload]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _encode_bytes(self, image: np.ndarray, fmt: str) -> bytes:
+        params: list[int] = []
+        if fmt == "jpeg":
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        elif fmt == "webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, self.jpeg_quality]
+        ok, buffer = cv2.imencode(f".{fmt}", image, params)
+        if not ok:  # pragma: no cover - codec unavailable
+            raise ValueError(f"failed to encode image as {fmt}")
+        return buffer.tobytes()
+
+    def encode(
+        self,
+        image: np.ndarray,
+        max_dim: Optional[int] = None,
+        grayscale: Optional[bool] = None,
+        stats: Optional[PayloadStats] = None,
+    ) -> ImagePayload:
+        """Return the payload for ``image``, encoding it only on first use.
+
+        ``max_dim`` and ``grayscale`` override the encoder defaults for a
+        single field.  When ``stats`` is given, savings versus a full-size
+        colour PNG are accumulated into it.  That baseline is estimated from
+        the encoded size and the pixel counts rather than by encoding the
+        original crop a second time.
+        """
+        max_dim = self.max_dim if max_dim is None else max_dim
+        grayscale = self.grayscale if grayscale is None else grayscale
+        key = f"{image_digest(image)}:{max_dim}:{int(grayscale)}:{','.join(self.formats)}"
+
+        with self._lock:
+            payload = self._memo.get(key)
+            if payload is not None:
+                self._memo.move_to_end(key)
+        if payload is not None:
+            if stats is not None:
+                stats.reused += 1
+            return payload
+
+        processed = image
+        if grayscale and processed.ndim == 3:
+            processed = cv2.cvtColor(processed, cv2.COLOR_BGR2GRAY)
+        h, w = processed.shape[:2]
+        if max_dim and max(h, w) > max_dim:
+            scale = max_dim / max(h, w)
+            processed = cv2.resize(
+                processed,
+                (max(1, round(w * scale)), max(1, round(h * scale))),
+                interpolation=cv2.INTER_AREA,
+            )
+            h, w = processed.shape[:2]
+
+        candidates = {fmt: self._encode_bytes(processed, fmt) for fmt in self.formats}
+        fmt, data = min(candidates.items(), key=lambda item: len(item[1]))
+        detail = "low" if max(h, w) <= self.low_detail_max else "high"
+        payload = ImagePayload(
+            image=image,
+            data=data,
+            mime=MIME_TYPES[fmt],
+            width=w,
+            height=h,
+            detail=detail,
+            key=key,
+        )
+
+        with self._lock:
+            self._memo[key] = payload
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+        if stats is not None:
+            # 元画像をPNGで再エンコードせず、送信した画像のPNGサイズを画素数(チャンネル込み)の比で拡大して見積もる
+            baseline = len(candidates.get("png", data))
+            if processed is not image:
+                baseline = round(baseline * image.size / max(1, processed.size))
+            oh, ow = image.shape[:2]
+            stats.images += 1
+            stats.bytes_sent += len(data)
+            stats.baseline_bytes += baseline
+            stats.tokens += payload.tokens
+            stats.baseline_tokens += estimate_image_tokens(ow, oh)
+        return payload
+
+
+# 全エンジンで共有するデフォルトのエンコーダ
+default_encoder = ImageEncoder()
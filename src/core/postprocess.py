@@ -1,5 +1,7 @@
 import re
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Pattern, Tuple, Union
 
 CONF_THRESHOLD = 0.9
 
@@ -19,17 +21,48 @@ def normalize_text(text: str) -> str:
     return text
 
 
-def check_validation(text: str, rule: Optional[str]) -> bool:
-    if not rule:
-        return True
-    if rule.startswith("regex:"):
-        pattern = rule[len("regex:") :]
-        return re.fullmatch(pattern, text) is not None
-    return True
+@dataclass(frozen=True)
+class Validator:
+    """Compiled form of a ROI ``validation_rule``.
+
+    Rules other than ``regex:<pattern>`` accept any text.
+    """
+
+    rule: Optional[str] = None
+    pattern: Optional[Pattern[str]] = None
+    numeric: bool = False
+
+    def __call__(self, text: str) -> bool:
+        return self.pattern is None or self.pattern.fullmatch(text) is not None
+
+
+@lru_cache(maxsize=1024)
+def compile_validation(rule: Optional[str]) -> Validator:
+    """Return the (cached) :class:`Validator` for ``rule``."""
+    if not rule or not rule.startswith("regex:"):
+        return Validator(rule)
+    pattern = re.compile(rule[len("regex:") :])
+    return Validator(rule, pattern, is_numeric_rule(rule))
+
+
+def check_validation(text: str, rule: Union[None, str, Validator]) -> bool:
+    validator = rule if isinstance(rule, Validator) else compile_validation(rule)
+    return validator(text)
+
+
+_NUMERIC_PATTERN = re.compile(r"(?:\\d|\[[0-9,.\-]+\]|\{\d+(?:,\d*)?\}|[+*?,\-]|\\[,.\-])+")
+
+
+def is_numeric_rule(rule: Optional[str]) -> bool:
+    """Return ``True`` if ``rule`` only accepts digits and separators."""
+    if not rule or not rule.startswith("regex:"):
+        return False
+    pattern = rule[len("regex:") :].lstrip("^").rstrip("$")
+    return bool(pattern) and _NUMERIC_PATTERN.fullmatch(pattern) is not None
 
 
 def postprocess_result(
-    text: str, confidence: float, rule: Optional[str]
+    text: str, confidence: float, rule: Union[None, str, Validator]
 ) -> Tuple[str, bool]:
     norm_text = normalize_text(text)
     valid = check_validation(norm_text, rule)
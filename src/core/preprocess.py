@@ -1,44 +1,132 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
 
-def correct_skew(image: np.ndarray) -> np.ndarray:
+from .config import settings
+
+def _hough_angles(gray: np.ndarray) -> np.ndarray:
+    """Angles (degrees, folded into ``[-45, 45)``) of the line segments in ``gray``."""
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=30, minLineLength=30, maxLineGap=10)
+    if lines is None:
+        return np.empty(0)
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T.astype(np.float64)
+    angles = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+    # 縦線も傾きの手掛かりとして使えるよう、±90度付近を水平側へ折り返す
+    return (angles + 45.0) % 90.0 - 45.0
+
+
+# 投影プロファイルによる傾き推定に使うインク画素数の上限
+SKEW_REFINE_POINTS = 20_000
+
+
+def _refine_skew(gray: np.ndarray, coarse: float, span: float = 1.0, step: float = 0.1) -> float:
+    """Refine ``coarse`` by maximising the sharpness of the row projection profile.
+
+    Ink pixel coordinates are rotated for every candidate angle at once and
+    binned into rows; the angle whose profile has the strongest row-to-row
+    changes (text lines aligned with rows) wins.
     """
-    Hough変換を用いて画像の傾きを検出し、水平に補正します。
+    ys, xs = np.nonzero(binarize(gray) == 0)
+    if ys.size == 0:
+        return coarse
+    if ys.size > SKEW_REFINE_POINTS:
+        # 計算量を抑えるため等間隔に間引く (0.1度の分解能には数万点で足りる)
+        stride = ys.size // SKEW_REFINE_POINTS + 1
+        ys, xs = ys[::stride], xs[::stride]
+    h, w = gray.shape[:2]
+    ys = ys - h / 2.0
+    xs = xs - w / 2.0
+    angles = np.arange(coarse - span, coarse + span + step / 2, step)
+    theta = np.radians(angles)[:, None]
+    # cv2.getRotationMatrix2D と同じ向きで回転した後の行番号
+    rows = np.rint(ys[None, :] * np.cos(theta) - xs[None, :] * np.sin(theta)).astype(np.int64)
+    offset = int(np.hypot(h, w) / 2) + 1
+    bins = 2 * offset + 1
+    index = rows + offset + (np.arange(len(angles)) * bins)[:, None]
+    profiles = np.bincount(index.ravel(), minlength=bins * len(angles)).reshape(len(angles), bins)
+    scores = np.square(np.diff(profiles.astype(np.float64), axis=1)).sum(axis=1)
+    # 小さな画像では複数の角度が同点になるため、粗い推定に最も近い角度を選ぶ
+    best = angles[scores >= scores.max()]
+    return round(float(best[np.argmin(np.abs(best - coarse))]), 3)
+
+
+def estimate_skew(image: np.ndarray, max_dim: Optional[int] = None) -> float:
+    """Estimate the page skew in degrees.
+
+    The page is downsampled so its longer side is at most ``max_dim``
+    (``settings.SKEW_MAX_DIM`` by default).  A coarse angle is taken from
+    Hough line segments (doubling the resolution while no lines survive the
+    downsampling) and refined to 0.1 degrees with a projection profile
+    search around it.
     """
-    # グレースケールに変換し、エッジを検出
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    gray = _gray(image)
+    max_dim = max_dim or settings.SKEW_MAX_DIM
+    longest = max(gray.shape[:2])
+    scale = min(1.0, max_dim / longest) if longest else 1.0
+    while True:
+        if scale < 1.0:
+            small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = gray
+        angles = _hough_angles(small)
+        if angles.size or scale >= 1.0:
+            break
+        scale = min(1.0, scale * 2)
+    coarse = float(np.median(angles)) if angles.size else 0.0
+    if small.size == 0:
+        return coarse
+    return _refine_skew(small, coarse)
 
-    # Hough変換で直線を検出（テストケースをパスできるようパラメータを調整）
-    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=30, minLineLength=30, maxLineGap=10)
 
-    if lines is None:
-        return image # 直線が見つからなければ元の画像を返す
+def correct_skew(
+    image: np.ndarray, angle: Optional[float] = None, tolerance: Optional[float] = None
+) -> np.ndarray:
+    """
+    Hough変換を用いて画像の傾きを検出し、水平に補正します。
+
+    ``angle`` に :func:`estimate_skew` の結果を渡すと推定を省略します。
+    傾きが ``tolerance`` 度 (既定は ``settings.SKEW_TOLERANCE``) 未満の場合は
+    回転せずに元の画像を返します。
+    """
+    return deskew(image, angle, tolerance)[0]
+
 
-    # 各直線の角度を計算
-    angles = []
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        angle = np.degrees(np.arctan2(y2 - y1, x2 - x1))
-        angles.append(angle)
+def deskew(
+    image: np.ndarray,
+    angle: Optional[float] = None,
+    tolerance: Optional[float] = None,
+    interpolation: int = cv2.INTER_LINEAR,
+) -> Tuple[np.ndarray, float]:
+    """Return the deskewed image and the skew angle that was estimated.
 
-    # 角度の中央値を計算
-    median_angle = np.median(angles)
+    See :func:`correct_skew`; the angle is returned even when it is below
+    ``tolerance`` and the image was left untouched.  The page is rotated
+    with bilinear interpolation by default: bicubic takes several times as
+    long on a full page and makes no visible difference for a rotation of
+    a few degrees.
+    """
+    if angle is None:
+        angle = estimate_skew(image)
+    if tolerance is None:
+        tolerance = settings.SKEW_TOLERANCE
+    if abs(angle) < tolerance:
+        return image, angle
 
     # 画像を回転して傾きを補正
     (h, w) = image.shape[:2]
     center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-    rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-
-    return rotated
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    rotated = cv2.warpAffine(image, M, (w, h), flags=interpolation, borderMode=cv2.BORDER_REPLICATE)
+    return rotated, angle
 
 def binarize(image: np.ndarray) -> np.ndarray:
     """
     画像をグレースケールに変換し、大津の二値化を適用します。
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = _gray(image)
     _, binarized = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     return binarized
 
@@ -50,8 +138,346 @@ def crop_roi(image: np.ndarray, roi_box: list[int]) -> np.ndarray:
     return image[y:y+h, x:x+w]
 
 
+@dataclass(frozen=True)
+class ReferenceFeatures:
+    """ORB keypoints of a template reference image.
+
+    ``points`` holds the keypoint coordinates as an ``(N, 2)`` float32 array
+    and ``descriptors`` the matching ``(N, 32)`` uint8 ORB descriptors.
+    ``gray`` is the grayscale reference image itself and ``preview`` a copy
+    reduced to ``settings.ALIGN_FAST_DIM`` for the fast alignment tier (see
+    :func:`reference_preview`).
+    """
+
+    points: np.ndarray
+    descriptors: Optional[np.ndarray]
+    shape: Tuple[int, int]
+    gray: Optional[np.ndarray] = None
+    preview: Optional[np.ndarray] = None
+
+
+@dataclass(frozen=True)
+class Alignment:
+    """How a page was mapped onto its template.
+
+    ``transform`` is the 2x3 affine from template to page coordinates
+    (``None`` for the identity).  ``method`` names the tier that produced it:
+    ``"phase"`` (phase correlation shift), ``"ecc"`` (the shift refined to a
+    rotation by ECC), ``"features"`` (ORB matching), ``"deskew"`` (skew
+    rotation only) or ``"identity"``.
+    ``score`` is the ECC correlation or the RANSAC inlier ratio.
+    """
+
+    transform: Optional[np.ndarray]
+    method: str
+    score: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "score": None if self.score is None else round(self.score, 4),
+            "transform": None if self.transform is None else np.round(self.transform, 4).tolist(),
+        }
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _shrink(gray: np.ndarray, scale: float) -> np.ndarray:
+    """Resize ``gray`` by ``scale`` (< 1) using a Gaussian pyramid for the bulk of the reduction."""
+    # 半分より小さくしない縮小は INTER_LINEAR で十分で、INTER_AREA の数倍速い
+    if scale >= 0.5:
+        return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    # 大きく縮める場合は pyrDown で 2 倍程度まで落としてから INTER_AREA で仕上げる
+    h, w = gray.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    small = gray
+    while small.shape[1] // 2 >= 2 * size[0] and small.shape[0] // 2 >= 2 * size[1]:
+        small = cv2.pyrDown(small)
+    return cv2.resize(small, size, interpolation=cv2.INTER_AREA)
+
+
+def _reduced(gray: np.ndarray, max_dim: Optional[int]) -> Tuple[np.ndarray, float]:
+    """Return ``gray`` shrunk so its longer side is at most ``max_dim``, and the scale used."""
+    longest = max(gray.shape[:2]) if gray.size else 0
+    if not max_dim or longest <= max_dim:
+        return gray, 1.0
+    scale = max_dim / longest
+    return _shrink(gray, scale), scale
+
+
+def _orb_features(gray: np.ndarray, max_dim: Optional[int]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """ORB keypoints of ``gray`` found on a reduced copy, in full-resolution coordinates."""
+    small, scale = _reduced(gray, max_dim)
+    orb = cv2.ORB_create()
+    keypoints, descriptors = orb.detectAndCompute(small, None)
+    points = np.float32([kp.pt for kp in keypoints]).reshape(-1, 2) / np.float32(scale)
+    return points, descriptors
+
+
+def reference_features(template: np.ndarray, max_dim: Optional[int] = None) -> ReferenceFeatures:
+    """テンプレート画像のORB特徴量を計算します。
+
+    長辺が ``max_dim`` (既定は ``settings.ALIGN_MAX_DIM``) を超える画像は縮小して
+    特徴点を検出し、座標は元の解像度に戻します。
+    """
+    gray = _gray(template)
+    max_dim = settings.ALIGN_MAX_DIM if max_dim is None else max_dim
+    points, descriptors = _orb_features(gray, max_dim)
+    return ReferenceFeatures(points, descriptors, template.shape[:2], gray, reference_preview(gray))
+
+
+def reference_preview(gray: np.ndarray) -> np.ndarray:
+    """Float32 copy of a template reduced to ``settings.ALIGN_FAST_DIM``."""
+    return _reduced(gray, settings.ALIGN_FAST_DIM)[0].astype(np.float32)
+
+
+def _ecc_score(preview: np.ndarray, page: np.ndarray, warp: np.ndarray) -> float:
+    """ECC correlation of ``preview`` with ``page`` mapped through ``warp`` (overlap only)."""
+    h, w = preview.shape
+    flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+    warped = cv2.warpAffine(page, warp, (w, h), flags=flags)
+    mask = cv2.warpAffine(np.ones(page.shape, dtype=np.uint8), warp, (w, h), flags=flags)
+    return float(cv2.computeECC(preview, warped, mask))
+
+
+# ECC の相関が平行移動のみの結果からこの差以内なら ECC (回転を含む) を採用する
+ECC_PREFERENCE_MARGIN = 0.02
+# 位相限定相関の応答がこれ未満なら平行移動では合わない (大きな回転や拡大縮小) ので ECC を省く
+PHASE_MIN_RESPONSE = 0.3
+
+
+def fast_alignment(reference: ReferenceFeatures, image: np.ndarray) -> Optional[Alignment]:
+    """Cheap translation + small rotation estimate on reduced images.
+
+    The page is reduced by the same factor as ``reference.preview``.  Phase
+    correlation gives the shift, which also seeds an ECC refinement of a
+    Euclidean (rotation + translation) transform.  The ECC result is returned
+    unless the plain shift correlates better with the template by more than
+    ``ECC_PREFERENCE_MARGIN``; the correlation is the score.
+    When the phase correlation response is below ``PHASE_MIN_RESPONSE`` the
+    page is too far from a pure shift for ECC to converge, so the shift is
+    returned as is and the caller can fall through to feature matching.
+    Returns ``None`` when there is no preview or ECC does not converge.
+    """
+    preview = reference.preview
+    if preview is None or preview.size == 0 or not reference.shape[1]:
+        return None
+    scale = preview.shape[1] / reference.shape[1]
+    gray = _gray(image)
+    if scale < 1.0:
+        gray = _shrink(gray, scale)
+    # 位相限定相関には同じ大きさが必要なので、ページ側を白で埋めるか切り詰める
+    h, w = preview.shape
+    page = np.full((h, w), 255, dtype=np.float32)
+    ph, pw = min(h, gray.shape[0]), min(w, gray.shape[1])
+    page[:ph, :pw] = gray[:ph, :pw]
+    window = cv2.createHanningWindow((w, h), cv2.CV_32F)
+    # phaseCorrelate と findTransformECC は float32 の入力をその場で書き換えるのでコピーを渡す
+    (dx, dy), response = cv2.phaseCorrelate(preview.copy(), page.copy(), window)
+    shift = np.float32([[1, 0, dx], [0, 1, dy]])
+    if response < PHASE_MIN_RESPONSE:
+        M = shift.astype(np.float64)
+        M[:, 2] /= scale
+        return Alignment(M, "phase", _ecc_score(preview, page, shift))
+    # 収束する場合は 15 回以内に収まり、収束しない場合の無駄を半分にする
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 15, 1e-4)
+    try:
+        _, rigid = cv2.findTransformECC(
+            preview.copy(), page.copy(), shift.copy(), cv2.MOTION_EUCLIDEAN, criteria, None, 3
+        )
+    except cv2.error:
+        return None
+    # ECC は疎な画像で回転に流れやすいので、平行移動のみの方が明らかに良い場合だけそちらを使う。
+    # 縮小画像では小さな回転による相関の差が僅かなので、同程度なら回転を残す ECC を選ぶ
+    phase_score, ecc_score = _ecc_score(preview, page, shift), _ecc_score(preview, page, rigid)
+    if phase_score > ecc_score + ECC_PREFERENCE_MARGIN:
+        score, method, warp = phase_score, "phase", shift
+    else:
+        score, method, warp = ecc_score, "ecc", rigid
+    M = warp.astype(np.float64)
+    M[:, 2] /= scale
+    return Alignment(M, method, score)
+
+
+def roi_boxes(rois: dict[str, dict]) -> np.ndarray:
+    """Return the ``box`` of every ROI as an ``(N, 4)`` integer array."""
+    boxes = [info["box"] for info in rois.values()]
+    return np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+
+
+def transform_boxes(boxes: np.ndarray, M: np.ndarray) -> np.ndarray:
+    """Map ``(N, 4)`` ``[x, y, w, h]`` boxes through the 2x3 affine ``M``.
+
+    Each result is the axis-aligned bounding box of the transformed corners.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x, y, w, h = boxes.T
+    # (N, 4, 2) の四隅をまとめて変換する
+    xs = np.stack([x, x + w, x + w, x], axis=1)
+    ys = np.stack([y, y, y + h, y + h], axis=1)
+    corners = np.stack([xs, ys], axis=-1).astype(np.float32)
+    transformed = corners @ np.float32(M[:, :2]).T + np.float32(M[:, 2])
+    mins = transformed.min(axis=1)
+    maxs = transformed.max(axis=1)
+    return np.rint(np.concatenate([mins, maxs - mins], axis=1)).astype(np.int64)
+
+
+def estimate_alignment(
+    reference: ReferenceFeatures, image: np.ndarray, max_dim: Optional[int] = None
+) -> Optional[np.ndarray]:
+    """Estimate the partial affine transform from the template to ``image``.
+
+    Pages larger than ``max_dim`` (``settings.ALIGN_MAX_DIM`` by default) are
+    matched on a reduced copy; the transform still maps full-resolution
+    template coordinates to full-resolution page coordinates.  Returns
+    ``None`` when not enough features match.
+    """
+    alignment = feature_alignment(reference, image, max_dim)
+    return None if alignment is None else alignment.transform
+
+
+# LSH インデックス (ORB のバイナリ記述子向け) の FLANN パラメータ
+_FLANN_LSH = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1)
+# Lowe の比率テスト: 2番目の候補よりこの比率以上近いマッチだけを使う
+RATIO_TEST = 0.75
+
+
+def feature_alignment(
+    reference: ReferenceFeatures, image: np.ndarray, max_dim: Optional[int] = None
+) -> Optional[Alignment]:
+    """ORB matching with an LSH knn ratio test and a RANSAC partial affine fit.
+
+    The score is the fraction of ratio-test matches that RANSAC keeps.
+    """
+    if reference.descriptors is None or len(reference.points) < 3:
+        return None
+    max_dim = settings.ALIGN_MAX_DIM if max_dim is None else max_dim
+    gray = _gray(image)
+    points2, des2 = _orb_features(gray, max_dim)
+    if des2 is None or len(points2) < 3:
+        return None
+
+    # マッチング
+    matcher = cv2.FlannBasedMatcher(_FLANN_LSH, dict(checks=50))
+    pairs = matcher.knnMatch(reference.descriptors, des2, k=2)
+    good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < RATIO_TEST * p[1].distance]
+    if len(good) < 3:
+        return None
+
+    src_pts = reference.points[[m.queryIdx for m in good]].reshape(-1, 1, 2)
+    dst_pts = points2[[m.trainIdx for m in good]].reshape(-1, 1, 2)
+    # 縮小して検出した特徴点は元の解像度で誤差が大きくなるので閾値も広げる
+    threshold = 3.0 * max(1.0, max(gray.shape[:2]) / max_dim) if max_dim else 3.0
+    M, inliers = cv2.estimateAffinePartial2D(src_pts, dst_pts, method=cv2.RANSAC, ransacReprojThreshold=threshold)
+    if M is None or inliers is None or int(inliers.sum()) < 3:
+        return None
+    return Alignment(M, "features", float(inliers.mean()))
+
+
+def align_page(reference: ReferenceFeatures, image: np.ndarray, min_score: Optional[float] = None) -> Optional[Alignment]:
+    """Tiered alignment of ``image`` to a template.
+
+    :func:`fast_alignment` is tried first and kept when its score reaches
+    ``min_score`` (``settings.ALIGN_MIN_SCORE``), or
+    ``settings.ALIGN_PHASE_MIN_SCORE`` for a translation-only result;
+    otherwise :func:`feature_alignment` is used.  Returns ``None`` when both
+    fail.
+    """
+    min_score = settings.ALIGN_MIN_SCORE if min_score is None else min_score
+    # グレースケール変換は両方の段で共有する
+    gray = _gray(image)
+    fast = fast_alignment(reference, gray)
+    if fast is not None and fast.score is not None:
+        threshold = max(min_score, settings.ALIGN_PHASE_MIN_SCORE) if fast.method == "phase" else min_score
+        if fast.score >= threshold:
+            return fast
+    return feature_alignment(reference, gray)
+
+
+def align_boxes(reference: ReferenceFeatures, image: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Align an ``(N, 4)`` box array from the template to ``image``.
+
+    The boxes are returned unchanged when no transform can be estimated.
+    """
+    alignment = align_page(reference, image)
+    if alignment is None:
+        return boxes
+    return transform_boxes(boxes, alignment.transform)
+
+
+def page_alignment(
+    image: np.ndarray,
+    reference: Optional[ReferenceFeatures] = None,
+    angle: Optional[float] = None,
+    tolerance: Optional[float] = None,
+) -> Alignment:
+    """Return the :class:`Alignment` from template coordinates to ``image``.
+
+    With a ``reference`` the transform is estimated directly on the (still
+    skewed) page with :func:`align_page`, so skew and alignment end up in one
+    transform.  Without a reference, or when alignment fails, the inverse of
+    the deskew rotation is used (``angle`` is estimated with
+    :func:`estimate_skew` when omitted).
+    """
+    if reference is not None:
+        alignment = align_page(reference, image)
+        if alignment is not None:
+            return alignment
+    if angle is None:
+        angle = estimate_skew(image)
+    if tolerance is None:
+        tolerance = settings.SKEW_TOLERANCE
+    if abs(angle) < tolerance:
+        return Alignment(None, "identity")
+    (h, w) = image.shape[:2]
+    R = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return Alignment(cv2.invertAffineTransform(R), "deskew")
+
+
+def page_transform(
+    image: np.ndarray,
+    reference: Optional[ReferenceFeatures] = None,
+    angle: Optional[float] = None,
+    tolerance: Optional[float] = None,
+) -> Optional[np.ndarray]:
+    """Return the 2x3 affine transform of :func:`page_alignment`, ``None`` for the identity."""
+    return page_alignment(image, reference, angle, tolerance).transform
+
+
+def warp_roi(image: np.ndarray, box: Sequence[int], M: Optional[np.ndarray]) -> np.ndarray:
+    """Sample ROI ``box`` (template coordinates) from ``image`` through ``M``.
+
+    Only the pixels of the crop are resampled.  When ``M`` moves the box by
+    less than half a pixel beyond a translation the crop is a plain slice.
+    """
+    x, y, w, h = (int(v) for v in box)
+    if M is None:
+        return crop_roi(image, [x, y, w, h])
+    linear = M[:, :2]
+    drift = (linear - np.eye(2)) @ np.array([[w, 0, w], [0, h, h]], dtype=np.float64)
+    if np.abs(drift).max() < 0.5:
+        # 実質的に平行移動のみ: 再標本化せずにスライスする
+        x0, y0 = np.rint(linear @ [x, y] + M[:, 2]).astype(int)
+        return crop_roi(image, [max(0, x0), max(0, y0), w + min(0, x0), h + min(0, y0)])
+    M_roi = np.hstack([linear, (linear @ [x, y] + M[:, 2])[:, None]])
+    return cv2.warpAffine(
+        image,
+        M_roi,
+        (w, h),
+        flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+
+
+def warp_rois(image: np.ndarray, boxes: np.ndarray, M: Optional[np.ndarray]) -> List[np.ndarray]:
+    """Crop every ``(N, 4)`` template box from ``image`` with :func:`warp_roi`."""
+    return [warp_roi(image, box, M) for box in np.asarray(boxes).reshape(-1, 4).tolist()]
+
+
 def align_rois(
-    template: np.ndarray,
+    template: Union[np.ndarray, ReferenceFeatures],
     image: np.ndarray,
     rois: dict[str, dict],
 ) -> dict[str, dict]:
@@ -63,7 +489,8 @@ def align_rois(
     Parameters
     ----------
     template:
-        Reference template image.
+        Reference template image, or its precomputed
+        :class:`ReferenceFeatures`.
     image:
         Target image to be aligned.
     rois:
@@ -74,44 +501,106 @@ def align_rois(
     dict[str, dict]
         補正後のROI辞書。
     """
-
-    # ORBで特徴量を抽出
-    orb = cv2.ORB_create()
-    gray_t = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-    gray_i = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    kp1, des1 = orb.detectAndCompute(gray_t, None)
-    kp2, des2 = orb.detectAndCompute(gray_i, None)
-
-    if des1 is None or des2 is None or len(kp1) < 3 or len(kp2) < 3:
-        return rois
-
-    # マッチング
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-    matches = bf.match(des1, des2)
-    if len(matches) < 3:
-        return rois
-
-    matches = sorted(matches, key=lambda x: x.distance)[:50]
-    src_pts = np.float32([kp1[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp2[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
-
-    M, _ = cv2.estimateAffinePartial2D(src_pts, dst_pts)
-    if M is None:
+    reference = template if isinstance(template, ReferenceFeatures) else reference_features(template)
+    alignment = align_page(reference, image)
+    if alignment is None:
         return rois
 
+    boxes = transform_boxes(roi_boxes(rois), alignment.transform)
     aligned = {}
-    for key, info in rois.items():
-        x, y, w, h = info["box"]
-        corners = np.array(
-            [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float32
-        ).reshape(-1, 1, 2)
-        transformed = cv2.transform(corners, M)
-        xs = transformed[:, 0, 0]
-        ys = transformed[:, 0, 1]
-        new_x, new_y = xs.min(), ys.min()
-        new_w, new_h = xs.max() - new_x, ys.max() - new_y
+    for (key, info), box in zip(rois.items(), boxes.tolist()):
         updated = info.copy()
-        updated["box"] = [int(round(new_x)), int(round(new_y)), int(round(new_w)), int(round(new_h))]
+        updated["box"] = box
         aligned[key] = updated
 
     return aligned
+
+
+# 濃淡差がこれ未満の領域は大津の二値化を行わず、用紙の濃さとの差で判定する
+BLANK_MIN_CONTRAST = 48
+# 低コントラスト領域の平均輝度がこれ以上なら用紙とみなす
+BLANK_PAPER_LEVEL = 160
+# 低コントラスト領域で、用紙の濃さよりこれ以上暗い画素をインク (薄い鉛筆・淡い印影) とする
+BLANK_FAINT_DELTA = 12
+
+
+@dataclass(frozen=True)
+class BlankCheck:
+    """Result of :func:`detect_blank`.
+
+    ``confidence`` is the confidence that the field is empty, ``ink_ratio``
+    the share of ink pixels and ``components`` the number of connected ink
+    components large enough to be a written mark.
+    """
+
+    blank: bool
+    confidence: float
+    ink_ratio: float
+    components: int
+
+
+def ink_mask(image: np.ndarray) -> np.ndarray:
+    """Return a boolean mask of the dark (ink) pixels of ``image``.
+
+    :func:`binarize` separates ink from paper.  Otsu's threshold is not
+    reliable without enough contrast, so a dark low-contrast region is
+    treated as all ink, and on a light one the pixels at least
+    ``BLANK_FAINT_DELTA`` levels darker than the paper (its median) are ink.
+    Faint pencil or a light stamp is therefore still found, while scanner
+    noise only leaves small speckles.
+    """
+    gray = _gray(image)
+    if gray.size == 0:
+        return np.zeros(gray.shape, dtype=bool)
+    if int(gray.max()) - int(gray.min()) < BLANK_MIN_CONTRAST:
+        if gray.mean() < BLANK_PAPER_LEVEL:
+            return np.ones(gray.shape, dtype=bool)
+        return gray < float(np.median(gray)) - BLANK_FAINT_DELTA
+    return binarize(gray) == 0
+
+
+def detect_blank(
+    image: np.ndarray,
+    reference_mask: Optional[np.ndarray] = None,
+    min_component_area: int = 12,
+    max_ink_ratio: float = 0.002,
+    min_confidence: float = 0.5,
+) -> BlankCheck:
+    """空欄かどうかをインク量と連結成分数から判定します。
+
+    Parameters
+    ----------
+    image:
+        Cropped field.
+    reference_mask:
+        :func:`ink_mask` of the same region of the blank template.  Printed
+        lines and labels found there (slightly dilated to absorb alignment
+        error) are not counted as ink.
+    min_component_area:
+        Connected components with at least this many pixels count as a
+        written mark; a single mark makes the field non-blank.
+    max_ink_ratio:
+        Share of speckle pixels at which the blank confidence drops to zero.
+    min_confidence:
+        Confidence required to report the field as blank.
+    """
+    mask = ink_mask(image)
+    if reference_mask is not None and reference_mask.size and mask.size:
+        reference = reference_mask.astype(np.uint8)
+        if reference.shape != mask.shape:
+            reference = cv2.resize(reference, mask.shape[::-1], interpolation=cv2.INTER_NEAREST)
+        reference = cv2.dilate(reference, np.ones((3, 3), np.uint8))
+        mask &= reference == 0
+    if not mask.any():
+        return BlankCheck(True, 1.0, 0.0, 0)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    components = int((areas >= min_component_area).sum())
+    ink_ratio = float(mask.mean())
+    if components:
+        return BlankCheck(False, 0.0, ink_ratio, components)
+    # 小さなノイズのみ: ノイズが多い・大きいほど空欄の確信度を下げる
+    confidence = 1.0 - max(ink_ratio / max_ink_ratio, float(areas.max()) / min_component_area)
+    confidence = min(1.0, max(0.0, confidence))
+    return BlankCheck(confidence >= min_confidence, confidence, ink_ratio, 0)
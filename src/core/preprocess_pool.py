@@ -0,0 +1,314 @@
+"""Process pool for the CPU bound preprocessing stage.
+
+Decoding, skew estimation, template alignment and ROI cropping are pure
+NumPy/OpenCV work.  :class:`PreprocessPool` runs them in worker processes so
+that several documents are preprocessed in parallel while the event loop keeps
+the OCR calls of other documents going.
+
+Images never travel through pickling: the page is copied once into a
+:mod:`multiprocessing.shared_memory` block which the worker maps, and the
+worker writes the crops into a second block provided by the caller.  Both
+blocks are owned by the calling process and reused by later calls, so a
+page costs one copy instead of allocating (and zero-filling) fresh memory.
+A template's ORB features are sent to each worker once and then referred to
+by a small key; only the block names, shapes and boxes are pickled per call.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+import itertools
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from . import preprocess
+from .config import settings
+from .template_manager import CompiledTemplate
+
+Source = Union[np.ndarray, str, "os.PathLike[str]"]
+Layout = List[Tuple[int, Tuple[int, ...], str]]
+
+# ワーカーが保持するテンプレート特徴量の数と、呼び出し側で再利用する共有メモリの単位
+REFERENCE_CACHE_SIZE = 32
+BLOCK_GRANULARITY = 1 << 20
+
+# ワーカーが開いたままにする共有メモリブロックの数 (毎回開き直すとページフォールトで遅い)
+ATTACHED_BLOCKS = 16
+
+# ワーカープロセス内: キー -> テンプレートの特徴量、ブロック名 -> 開いているブロック
+_references: "OrderedDict[int, preprocess.ReferenceFeatures]" = OrderedDict()
+_attached: "OrderedDict[str, SharedMemory]" = OrderedDict()
+# 呼び出し側で作るブロックの通し番号。名前を再利用しないので、ワーカーが開いたままのブロックと取り違えない
+_block_serial = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable handle of an array stored in shared memory."""
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def allocate(cls, shape: Sequence[int], dtype: Union[str, np.dtype]) -> Tuple["SharedArray", SharedMemory]:
+        """Create a shared block for an array of ``shape`` and ``dtype``."""
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        shm = SharedMemory(create=True, size=max(1, size))
+        return cls(shm.name, tuple(int(n) for n in shape), dtype.str), shm
+
+    @classmethod
+    def copy_of(cls, array: np.ndarray) -> Tuple["SharedArray", SharedMemory]:
+        """Create a shared block holding a copy of ``array``."""
+        handle, shm = cls.allocate(array.shape, array.dtype)
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        return handle, shm
+
+    def attach(self) -> Tuple[np.ndarray, SharedMemory]:
+        """Map the block; the array is valid until the returned block is closed."""
+        shm = SharedMemory(name=self.name)
+        return np.ndarray(self.shape, np.dtype(self.dtype), buffer=shm.buf), shm
+
+
+def prepare_crops(
+    image: np.ndarray,
+    boxes: np.ndarray,
+    reference: Optional[preprocess.ReferenceFeatures] = None,
+) -> Tuple[np.ndarray, List[np.ndarray], preprocess.Alignment]:
+    """Align ``boxes`` to ``image`` and crop them.
+
+    Returns the boxes in page coordinates, the crops in box order and the
+    :class:`~core.preprocess.Alignment` used.
+    """
+    alignment = preprocess.page_alignment(image, reference)
+    M = alignment.transform
+    aligned = boxes if M is None else preprocess.transform_boxes(boxes, M)
+    return aligned, preprocess.warp_rois(image, boxes, M), alignment
+
+
+def _attach(handle: SharedArray) -> np.ndarray:
+    """Map ``handle`` in a worker, keeping recently used blocks open."""
+    shm = _attached.get(handle.name)
+    if shm is None:
+        shm = SharedMemory(name=handle.name)
+        _attached[handle.name] = shm
+        while len(_attached) > ATTACHED_BLOCKS:
+            _attached.popitem(last=False)[1].close()
+    else:
+        _attached.move_to_end(handle.name)
+    return np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=shm.buf)
+
+
+def _crop_worker(
+    source: Union[SharedArray, str],
+    boxes: np.ndarray,
+    reference_key: Optional[int],
+    reference: Optional[preprocess.ReferenceFeatures],
+    out: SharedArray,
+) -> Optional[Tuple[np.ndarray, Layout, preprocess.Alignment]]:
+    """Worker side of :meth:`PreprocessPool.crop`.
+
+    ``reference`` is stored under ``reference_key`` when given; otherwise the
+    features cached under that key are used, and ``None`` is returned when
+    this worker has not seen them yet so the caller resends them.
+
+    The crops are packed one after another into the byte buffer ``out``; the
+    returned layout gives the offset, shape and dtype of each one.
+    """
+    if reference_key is not None:
+        if reference is not None:
+            _references[reference_key] = reference
+            while len(_references) > REFERENCE_CACHE_SIZE:
+                _references.popitem(last=False)
+        elif reference_key in _references:
+            reference = _references[reference_key]
+            _references.move_to_end(reference_key)
+        else:
+            return None
+    if isinstance(source, SharedArray):
+        image = _attach(source)
+    else:
+        image = cv2.imread(source)
+        if image is None:
+            raise ValueError(f"cannot decode image {source}")
+    buffer = _attach(out)
+    aligned, crops, alignment = prepare_crops(image, boxes, reference)
+    layout: Layout = []
+    offset = 0
+    for crop in crops:
+        crop = np.ascontiguousarray(crop)
+        buffer[offset:offset + crop.nbytes] = crop.reshape(-1).view(np.uint8)
+        layout.append((offset, crop.shape, crop.dtype.str))
+        offset += crop.nbytes
+    return aligned, layout, alignment
+
+
+class PreprocessPool:
+    """Run :func:`prepare_crops` for many documents in worker processes.
+
+    Parameters
+    ----------
+    workers:
+        Number of worker processes.  Defaults to
+        ``settings.PREPROCESS_WORKERS`` and, when that is ``0``, to the number
+        of CPUs.
+    start_method:
+        :mod:`multiprocessing` start method, ``settings.PREPROCESS_START_METHOD``
+        by default.  ``spawn`` is safe to use from threaded hosts such as
+        Streamlit.
+    """
+
+    def __init__(self, workers: Optional[int] = None, start_method: Optional[str] = None) -> None:
+        self.workers = workers or settings.PREPROCESS_WORKERS or os.cpu_count() or 1
+        context = multiprocessing.get_context(start_method or settings.PREPROCESS_START_METHOD)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self._lock = threading.Lock()
+        # 再利用を待つ共有メモリブロック (ページ入力と切り出し結果で共用)
+        self._free: List[SharedMemory] = []
+        # id(テンプレートの特徴量) -> (特徴量, キー, 送信用の縮小版)。キー付けした特徴量は保持して id の再利用を防ぐ
+        self._references: "OrderedDict[int, Tuple[preprocess.ReferenceFeatures, int, preprocess.ReferenceFeatures]]" = (
+            OrderedDict()
+        )
+        self._next_key = 0
+        # 同時に共有メモリを占有する呼び出しの上限 (ワーカーを遊ばせない程度に先読みする)
+        self._max_calls = 2 * self.workers
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __enter__(self) -> "PreprocessPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the worker processes and release the shared memory blocks."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            free, self._free = self._free, []
+        for shm in free:
+            shm.close()
+            shm.unlink()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # asyncio の同期プリミティブはループに紐付くため、ループが変わったら作り直す
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self._max_calls)
+            self._slots_loop = loop
+        return self._slots
+
+    def _take(self, size: int) -> SharedMemory:
+        """A free block of at least ``size`` bytes, allocating one if needed."""
+        with self._lock:
+            fitting = [shm for shm in self._free if shm.size >= size]
+            if fitting:
+                shm = min(fitting, key=lambda block: block.size)
+                self._free.remove(shm)
+                return shm
+        rounded = -(-max(1, size) // BLOCK_GRANULARITY) * BLOCK_GRANULARITY
+        return SharedMemory(name=f"aiocr_{os.getpid()}_{next(_block_serial)}", create=True, size=rounded)
+
+    def _give(self, shm: SharedMemory) -> None:
+        """Return ``shm`` for reuse; beyond two blocks per concurrent call the smallest is freed."""
+        with self._lock:
+            self._free.append(shm)
+            excess = len(self._free) - 2 * self._max_calls
+            self._free.sort(key=lambda block: block.size)
+            released, self._free = self._free[:max(0, excess)], self._free[max(0, excess):]
+        for block in released:
+            block.close()
+            block.unlink()
+
+    def _reference(
+        self, reference: Optional[preprocess.ReferenceFeatures]
+    ) -> Tuple[Optional[int], Optional[preprocess.ReferenceFeatures], bool]:
+        """Key of ``reference``, the copy sent to workers and whether it is new."""
+        if reference is None:
+            return None, None, False
+        with self._lock:
+            entry = self._references.get(id(reference))
+            if entry is not None and entry[0] is reference:
+                self._references.move_to_end(id(reference))
+                return entry[1], entry[2], False
+            # 位置合わせに必要なのは特徴点と縮小画像だけなので参照画像は送らない
+            stripped = replace(reference, gray=None) if reference.gray is not None else reference
+            self._next_key += 1
+            self._references[id(reference)] = (reference, self._next_key, stripped)
+            while len(self._references) > REFERENCE_CACHE_SIZE:
+                self._references.popitem(last=False)
+            return self._next_key, stripped, True
+
+    async def crop(
+        self, source: Source, template: CompiledTemplate
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray], preprocess.Alignment]:
+        """Align and crop ``source`` (an image or an image file) for ``template``.
+
+        Returns the aligned ``(N, 4)`` boxes, the crops keyed by ROI name and
+        the alignment used, like the in-process path of
+        :class:`~core.ocr_agent.OcrAgent`.  At most two calls per worker
+        hold shared memory at a time; further calls wait for a slot.
+        """
+        async with self._semaphore():
+            return await self._crop(source, template)
+
+    async def _crop(
+        self, source: Source, template: CompiledTemplate
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray], preprocess.Alignment]:
+        boxes = np.asarray(template.boxes)
+        key, reference, new = self._reference(template.reference)
+        blocks: List[SharedMemory] = []
+        finished = False
+        try:
+            if isinstance(source, np.ndarray):
+                shm = self._take(source.nbytes)
+                blocks.append(shm)
+                np.ndarray(source.shape, source.dtype, buffer=shm.buf)[...] = source
+                pixel_bytes = source.itemsize * int(np.prod(source.shape[2:], dtype=np.int64))
+                source_arg: Union[SharedArray, str] = SharedArray(shm.name, source.shape, source.dtype.str)
+            else:
+                pixel_bytes = 3
+                source_arg = os.fspath(source)
+            # 切り出し結果の最大サイズ (ROI はテンプレートの枠の大きさで切り出される)
+            pixels = int((boxes[:, 2].clip(min=0) * boxes[:, 3].clip(min=0)).sum()) if len(boxes) else 0
+            shm = self._take(pixels * pixel_bytes)
+            blocks.append(shm)
+            out = SharedArray(shm.name, (pixels * pixel_bytes,), np.dtype(np.uint8).str)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor, _crop_worker, source_arg, boxes, key, reference if new else None, out
+            )
+            if result is None:
+                # このワーカーは特徴量をまだ持っていない
+                result = await loop.run_in_executor(
+                    self._executor, _crop_worker, source_arg, boxes, key, reference, out
+                )
+            finished = True
+            aligned, layout, alignment = result  # type: ignore[misc]
+            crops = {
+                name: np.ndarray(shape, np.dtype(dtype), buffer=shm.buf, offset=offset).copy()
+                for name, (offset, shape, dtype) in zip(template.roi_names, layout)
+            }
+            return aligned, crops, alignment
+        except Exception:
+            # ワーカー側で失敗した呼び出しはブロックに書き込み終えている
+            finished = True
+            raise
+        finally:
+            for shm in blocks:
+                if finished:
+                    self._give(shm)
+                else:
+                    # 取り消された呼び出しのワーカーはまだ書き込み中かもしれないので再利用しない
+                    shm.close()
+                    shm.unlink()
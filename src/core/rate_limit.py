@@ -0,0 +1,209 @@
+"""Adaptive client side rate limiting for the API based OCR engines."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+
+
+class RetryableError(Exception):
+    """A transient failure (5xx, connection reset, timeout) worth retrying."""
+
+
+class RateLimitError(RetryableError):
+    """The API answered ``429 Too Many Requests``.
+
+    Parameters
+    ----------
+    retry_after:
+        Seconds the server asked us to wait, parsed from ``Retry-After``.
+    """
+
+    def __init__(self, message: str = "rate limited", retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Return the wait time in seconds advertised by a 429 response."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+class TokenBucket:
+    """Continuously refilling token bucket expressed as a per-minute budget.
+
+    A budget of ``0`` (or less) means no limit: :meth:`acquire` returns
+    immediately.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Wait until ``amount`` tokens are available and consume them."""
+        if self.rate <= 0:
+            return
+        amount = min(float(amount), self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AdaptiveRateLimiter:
+    """Token-bucket limiter with AIMD concurrency control and retries.
+
+    Every engine call goes through :meth:`call`, which
+
+    * waits for a request slot and enough tokens in the per-minute buckets,
+    * caps the number of in-flight requests with a limit that grows by one
+      after each success window and halves whenever the API throttles us
+      (additive increase / multiplicative decrease),
+    * retries :class:`RetryableError` with jittered exponential backoff and
+      honours ``Retry-After`` by pausing *all* callers sharing the limiter.
+
+    Parameters
+    ----------
+    requests_per_minute, tokens_per_minute:
+        Account quota to stay under; ``0`` disables the limit.
+    max_concurrency, min_concurrency:
+        Bounds for the adaptive in-flight limit.
+    max_retries:
+        Attempts after the first one before the last error is re-raised.
+    base_delay, max_delay:
+        Backoff parameters in seconds.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        min_concurrency: int = 1,
+        max_retries: Optional[int] = None,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ) -> None:
+        rpm = settings.RATE_LIMIT_RPM if requests_per_minute is None else requests_per_minute
+        tpm = settings.RATE_LIMIT_TPM if tokens_per_minute is None else tokens_per_minute
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = (
+            settings.RATE_LIMIT_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        )
+        self.min_concurrency = min_concurrency
+        self.max_retries = settings.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._pause_until = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _condition(self) -> asyncio.Condition:
+        # asyncio の同期プリミティブはループに紐付くため、ループが変わったら作り直す
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+        return self._cond
+
+    async def _acquire_slot(self) -> None:
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < max(int(self.limit), self.min_concurrency))
+            self.in_flight += 1
+
+    async def _release_slot(self) -> None:
+        cond = self._condition()
+        async with cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            cond.notify_all()
+
+    async def _wait_pause(self) -> None:
+        delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _on_success(self) -> None:
+        if self.limit < self.max_concurrency:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def _on_throttle(self, retry_after: Optional[float]) -> None:
+        self.throttled += 1
+        self.limit = max(float(self.min_concurrency), self.limit / 2.0)
+        if retry_after:
+            self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for ``attempt``."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(self, func: Callable[[], Awaitable[T]], tokens: float = 0.0) -> T:
+        """Run ``func`` under the limiter, retrying transient failures."""
+        attempt = 0
+        while True:
+            await self._wait_pause()
+            await self.requests.acquire(1)
+            if tokens:
+                await self.tokens.acquire(tokens)
+            await self._acquire_slot()
+            try:
+                result = await func()
+            except RateLimitError as exc:
+                self._on_throttle(exc.retry_after)
+                error: RetryableError = exc
+                delay = exc.retry_after if exc.retry_after is not None else self.backoff(attempt)
+            except RetryableError as exc:
+                error = exc
+                delay = self.backoff(attempt)
+            else:
+                self._on_success()
+                return result
+            finally:
+                await self._release_slot()
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+
+# 全エンジンで共有するデフォルトのレートリミッタ
+default_limiter = AdaptiveRateLimiter()
@@ -1,8 +1,228 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+import copy
+from dataclasses import dataclass, field
 import json
+import os
 from pathlib import Path
-from typing import Any, Dict, List
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from . import postprocess, preprocess
+from .config import settings
+from .corrections import CorrectionSet, compile_corrections
+from .fingerprint import Fingerprint, FingerprintIndex, image_fingerprint
+from .keyword_index import KeywordIndex
+
+# メモリ上に保持するコンパイル済みテンプレート数の上限
+COMPILED_CACHE_SIZE = 64
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """Immutable, ready-to-use form of a template.
+
+    Everything the per-document hot path needs is derived once: validation
+    rules are compiled, ROI boxes are stacked into an ``(N, 4)`` array,
+    corrections are compiled into a :class:`~core.corrections.CorrectionSet`
+    and the ORB features of the reference image are loaded (see
+    :func:`load_reference_features`).  When the template names a scan of the
+    empty form (``blank_template_image_path``) the ink mask of every ROI on
+    it is kept to ignore printed guides when detecting empty fields.
+    Instances are produced and cached by :class:`TemplateManager`.
+    """
+
+    name: str
+    roi_names: Tuple[str, ...]
+    boxes: np.ndarray
+    rois: Mapping[str, Mapping[str, Any]]
+    validators: Mapping[str, postprocess.Validator]
+    corrections: CorrectionSet
+    batch_size: int
+    keywords: Tuple[str, ...]
+    template_image_path: Optional[str]
+    reference: Optional[preprocess.ReferenceFeatures]
+    blank_template_image_path: Optional[str]
+    blank_masks: Mapping[str, np.ndarray]
+    _data: Dict[str, Any] = field(repr=False, compare=False)
+
+    @property
+    def image_paths(self) -> Tuple[Optional[str], ...]:
+        """Image files the compiled form depends on."""
+        return (self.template_image_path, self.blank_template_image_path)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Read a raw template field, like ``dict.get``."""
+        return copy.deepcopy(self._data.get(key, default))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a copy of the raw template data."""
+        return copy.deepcopy(self._data)
+
+    def aligned_rois(self, boxes: Optional[np.ndarray] = None) -> Dict[str, Dict[str, Any]]:
+        """Return the ROI definitions as plain dicts with ``boxes`` applied."""
+        boxes = self.boxes if boxes is None else boxes
+        return {
+            key: dict(self.rois[key], box=box)
+            for key, box in zip(self.roi_names, boxes.tolist())
+        }
+
+
+def compile_template(data: Dict[str, Any]) -> CompiledTemplate:
+    """Compile normalised template ``data`` into a :class:`CompiledTemplate`."""
+    data = copy.deepcopy(data)
+    rois = data.get("rois") or {}
+    boxes = preprocess.roi_boxes(rois)
+    boxes.setflags(write=False)
+    template_path = data.get("template_image_path")
+    reference = load_reference_features(template_path)
+    blank_masks: Dict[str, np.ndarray] = {}
+    blank_path = data.get("blank_template_image_path")
+    blank_img = _read_image(blank_path)
+    if blank_img is not None:
+        for key, box in zip(rois, boxes):
+            mask = preprocess.ink_mask(preprocess.crop_roi(blank_img, box))
+            mask.setflags(write=False)
+            blank_masks[key] = mask
+    return CompiledTemplate(
+        name=data.get("name", ""),
+        roi_names=tuple(rois),
+        boxes=boxes,
+        rois=MappingProxyType({key: MappingProxyType(dict(info)) for key, info in rois.items()}),
+        validators=MappingProxyType(
+            {key: postprocess.compile_validation(info.get("validation_rule")) for key, info in rois.items()}
+        ),
+        corrections=compile_corrections(data.get("corrections", [])),
+        batch_size=int(data.get("batch_size", 1) or 1),
+        keywords=tuple(data.get("keywords", [])),
+        template_image_path=template_path,
+        reference=reference,
+        blank_template_image_path=blank_path,
+        blank_masks=MappingProxyType(blank_masks),
+        _data=data,
+    )
+
+
+def features_path(image_path: str) -> Path:
+    """Path of the ``.npz`` file holding the features of a reference image."""
+    return Path(image_path).with_suffix(".npz")
+
+
+def save_reference_features(image_path: Optional[str]) -> Optional[preprocess.ReferenceFeatures]:
+    """Compute the ORB features of a reference image and store them next to it.
+
+    The ``.npz`` file records the image's modification time and size so a
+    replaced image is detected, and ``settings.ALIGN_MAX_DIM`` so features
+    found at another resolution are recomputed.  The image's
+    :class:`~core.fingerprint.Fingerprint` is stored in the same file.
+    Returns ``None`` if the image is missing.
+    """
+    saved = _save_features(image_path)
+    return saved[0] if saved else None
+
+
+def _save_features(image_path: Optional[str]) -> Optional[Tuple[preprocess.ReferenceFeatures, Fingerprint]]:
+    image = _read_image(image_path)
+    if image is None:
+        return None
+    reference = preprocess.reference_features(image)
+    fingerprint = image_fingerprint(reference.gray)
+    stat = os.stat(image_path)
+    path = features_path(image_path)
+    descriptors = reference.descriptors
+    if descriptors is None:
+        descriptors = np.empty((0, 32), dtype=np.uint8)
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with tmp.open("wb") as f:
+            np.savez_compressed(
+                f,
+                points=reference.points,
+                descriptors=descriptors,
+                gray=reference.gray,
+                layout_hash=fingerprint.layout_hash,
+                pooled=fingerprint.pooled,
+                source=np.array(_feature_source(stat), dtype=np.int64),
+            )
+        os.replace(tmp, path)
+    except OSError:
+        # 書き込めない場所でも特徴量自体は利用できる
+        tmp.unlink(missing_ok=True)
+    return reference, fingerprint
+
+
+def load_reference_features(image_path: Optional[str]) -> Optional[preprocess.ReferenceFeatures]:
+    """Return the features of a reference image, preferring its ``.npz`` file.
+
+    The features are recomputed (and the file rewritten) when the file is
+    missing, unreadable or older than the image.
+    """
+    if not image_path:
+        return None
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    try:
+        with np.load(features_path(image_path)) as f:
+            if tuple(f["source"].tolist()) == _feature_source(stat):
+                gray = f["gray"]
+                descriptors = f["descriptors"]
+                return preprocess.ReferenceFeatures(
+                    f["points"],
+                    descriptors if len(descriptors) else None,
+                    gray.shape[:2],
+                    gray,
+                    preprocess.reference_preview(gray),
+                )
+    except (OSError, KeyError, ValueError):
+        pass
+    return save_reference_features(image_path)
+
+
+def load_fingerprint(image_path: Optional[str]) -> Optional[Fingerprint]:
+    """Return the fingerprint of a reference image from its ``.npz`` file.
+
+    Only the two small fingerprint arrays are read from the file.  Like
+    :func:`load_reference_features` the file is rewritten when it is
+    missing, stale or predates fingerprints.
+    """
+    if not image_path:
+        return None
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    try:
+        with np.load(features_path(image_path)) as f:
+            if tuple(f["source"].tolist()) == _feature_source(stat):
+                return Fingerprint(f["layout_hash"], f["pooled"])
+    except (OSError, KeyError, ValueError):
+        pass
+    saved = _save_features(image_path)
+    return saved[1] if saved else None
+
+
+def _feature_source(stat: os.stat_result) -> Tuple[int, int, int]:
+    return (stat.st_mtime_ns, stat.st_size, settings.ALIGN_MAX_DIM)
+
+
+def _read_image(path: Optional[str]) -> Optional[np.ndarray]:
+    if not path or not Path(path).exists():
+        return None
+    return cv2.imread(str(path))
+
+
+def _mtime(path: Optional[str]) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
 
 
 class TemplateManager:
@@ -15,6 +235,18 @@ class TemplateManager:
     def __init__(self, template_dir: str = "templates") -> None:
         self.template_dir = Path(template_dir)
         self.template_dir.mkdir(parents=True, exist_ok=True)
+        # キー -> (参照画像のmtime, コンパイル済みテンプレート)
+        self._compiled: "OrderedDict[Tuple[Any, ...], Tuple[Tuple[Optional[int], ...], CompiledTemplate]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        # テンプレート検出用のキーワード索引と、索引に反映済みのファイルの (mtime, サイズ)
+        self._keywords = KeywordIndex()
+        self._keyword_sources: Dict[str, Tuple[int, int]] = {}
+        # 見た目によるテンプレート検出の索引と、反映済みの (ファイルの (mtime, サイズ), 参照画像, 参照画像のmtime)
+        self._fingerprints = FingerprintIndex()
+        self._fingerprint_sources: Dict[str, Tuple[Tuple[int, int], Optional[str], Optional[int]]] = {}
+        self._index_lock = threading.Lock()
 
     def list_templates(self) -> List[str]:
         """Return a list of available template names."""
@@ -53,11 +285,64 @@ class TemplateManager:
         extensions such as ``template_image_path``.  The ``keywords`` field is
         normalised to always be present as a list to simplify downstream
         consumption.
+
+        When the template has a ``template_image_path`` its ORB features are
+        computed now (unless already up to date) and stored next to the image,
+        so document processing never has to analyse the reference image.
         """
         path = self.template_dir / f"{name}.json"
         data_to_save = self._normalise(dict(data))
         with path.open("w", encoding="utf-8") as f:
             json.dump(data_to_save, f, ensure_ascii=False, indent=2)
+        load_reference_features(data_to_save.get("template_image_path"))
+
+    def _lookup(self, key: Tuple[Any, ...]) -> Optional[CompiledTemplate]:
+        """Return a cached template whose reference image is unchanged."""
+        with self._lock:
+            entry = self._compiled.get(key)
+            if entry is None:
+                return None
+            image_mtimes, compiled = entry
+            if image_mtimes != tuple(_mtime(p) for p in compiled.image_paths):
+                del self._compiled[key]
+                return None
+            self._compiled.move_to_end(key)
+            return compiled
+
+    def _store(self, key: Tuple[Any, ...], data: Dict[str, Any]) -> CompiledTemplate:
+        compiled = compile_template(data)
+        image_mtimes = tuple(_mtime(p) for p in compiled.image_paths)
+        with self._lock:
+            self._compiled[key] = (image_mtimes, compiled)
+            while len(self._compiled) > COMPILED_CACHE_SIZE:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def load_compiled(self, name: str) -> CompiledTemplate:
+        """Return the compiled template ``name``.
+
+        The result is cached in memory keyed by the template file path and
+        modification time (and those of the images it references), so an
+        edited template is recompiled on next use.
+        """
+        path = self.template_dir / f"{name}.json"
+        mtime = _mtime(str(path))
+        if mtime is None:
+            raise FileNotFoundError(path)
+        key = ("file", str(path.resolve()), mtime)
+        return self._lookup(key) or self._store(key, self.load(name))
+
+    def compile(self, data: Union[Dict[str, Any], CompiledTemplate]) -> CompiledTemplate:
+        """Return the compiled form of in-memory template ``data``.
+
+        Identical data share one cached instance.  A :class:`CompiledTemplate`
+        is returned as is.
+        """
+        if isinstance(data, CompiledTemplate):
+            return data
+        data = self._normalise(dict(data))
+        key = ("data", json.dumps(data, ensure_ascii=False, sort_keys=True, default=str))
+        return self._lookup(key) or self._store(key, data)
 
     def get_keywords(self, name: str) -> List[str]:
         """Return the list of detection keywords for a template.
@@ -69,6 +354,54 @@ class TemplateManager:
         return keywords if isinstance(keywords, list) else []
 
 
+    def _scan_templates(self) -> Dict[str, Tuple[int, int]]:
+        """Return ``{name: (mtime_ns, size)}`` of the template files."""
+        current: Dict[str, Tuple[int, int]] = {}
+        with os.scandir(self.template_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    stat = entry.stat()
+                    current[entry.name[: -len(".json")]] = (stat.st_mtime_ns, stat.st_size)
+        return current
+
+    def _refresh_keywords(self) -> None:
+        """Bring the keyword index up to date with the template files.
+
+        Only the directory listing is read; a template file is parsed again
+        only when its modification time or size changed.
+        """
+        current = self._scan_templates()
+        for name in set(self._keyword_sources) - set(current):
+            del self._keyword_sources[name]
+            self._keywords.remove(name)
+        for name, source in current.items():
+            if self._keyword_sources.get(name) == source:
+                continue
+            try:
+                keywords = self.load(name).get("keywords", [])
+            except (OSError, ValueError):
+                # 壊れたファイルは次に更新されるまで検出対象から外す
+                keywords = []
+            self._keywords.update(name, keywords)
+            self._keyword_sources[name] = source
+
+    def rank_templates(self, text: str, k: int | None = 5) -> List[Tuple[str, float]]:
+        """Rank templates by the keywords found in ``text``.
+
+        Keywords of all templates are matched in a single pass over ``text``
+        (see :class:`~core.keyword_index.KeywordIndex`).  A template scores
+        the sum of the weights of its distinct keywords present in the text.
+
+        Returns
+        -------
+        list
+            Up to ``k`` ``(template_name, score)`` pairs, best first.  Templates
+            without any matching keyword are omitted.
+        """
+        with self._index_lock:
+            self._refresh_keywords()
+            return self._keywords.rank(text, k)
+
     def detect_template(self, text: str) -> tuple[str, Dict[str, Any]] | None:
         """Select the best template for ``text`` based on keyword matches.
 
@@ -80,38 +413,101 @@ class TemplateManager:
         Returns
         -------
         tuple or ``None``
-            A tuple of ``(template_name, template_data)`` for the best match.
-            ``None`` is returned when no template contains any of the
-            configured keywords.
+            A tuple of ``(template_name, template_data)`` for the best match
+            of :meth:`rank_templates`.  ``None`` is returned when no template
+            contains any of the configured keywords.
         """
-        best_score = 0
-        best_name: str | None = None
-        best_data: Dict[str, Any] | None = None
-        for name in self.list_templates():
-            data = self.load(name)
-            keywords = data.get("keywords", [])
-            if isinstance(keywords, list):
-                score = sum(kw in text for kw in keywords)
+        ranked = self.rank_templates(text, 1)
+        if not ranked:
+            return None
+        name = ranked[0][0]
+        return name, self.load_compiled(name).to_dict()
+
+    def _refresh_fingerprints(self) -> None:
+        """Bring the fingerprint index up to date with the template files.
+
+        A template is re-indexed when its file or its reference image
+        changed; templates without a reference image are not indexed.
+        """
+        current = self._scan_templates()
+        for name in set(self._fingerprint_sources) - set(current):
+            del self._fingerprint_sources[name]
+            self._fingerprints.remove(name)
+        for name, source in current.items():
+            known = self._fingerprint_sources.get(name)
+            if known is not None and known[0] == source and known[2] == _mtime(known[1]):
+                continue
+            try:
+                image_path = self.load(name).get("template_image_path")
+            except (OSError, ValueError):
+                image_path = None
+            fingerprint = load_fingerprint(image_path)
+            if fingerprint is None:
+                self._fingerprints.remove(name)
             else:
-                score = 0
-            if score > best_score:
-                best_score = score
-                best_name = name
-                best_data = data
-        if best_name is None:
+                self._fingerprints.update(name, fingerprint)
+            self._fingerprint_sources[name] = (source, image_path, _mtime(image_path))
+
+    def rank_images(self, image: np.ndarray, k: int | None = 5) -> List[Tuple[str, float]]:
+        """Rank templates by how much their reference image looks like ``image``.
+
+        The page's :class:`~core.fingerprint.Fingerprint` is compared with
+        those of all templates' reference images, which are computed when a
+        template is saved and kept in memory.
+
+        Returns
+        -------
+        list
+            Up to ``k`` ``(template_name, similarity)`` pairs, best first.
+            Similarities lie between 0 and 1.
+        """
+        fingerprint = image_fingerprint(image)
+        with self._index_lock:
+            self._refresh_fingerprints()
+            return self._fingerprints.rank(fingerprint, k)
+
+    def detect_template_image(self, image: np.ndarray) -> tuple[str, Dict[str, Any]] | None:
+        """Select the template whose reference image matches ``image``.
+
+        No OCR is involved.  The best match of :meth:`rank_images` is only
+        accepted when its similarity reaches ``settings.FINGERPRINT_MIN_SCORE``
+        and beats the runner-up by ``settings.FINGERPRINT_MIN_MARGIN``;
+        otherwise the match is ambiguous and ``None`` is returned so the
+        caller can fall back to :meth:`detect_template` on the OCR text.
+        """
+        if not settings.FINGERPRINT_DETECTION:
+            return None
+        ranked = self.rank_images(image, 2)
+        if not ranked:
             return None
-        return best_name, best_data
+        name, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best < settings.FINGERPRINT_MIN_SCORE or best - runner_up < settings.FINGERPRINT_MIN_MARGIN:
+            return None
+        return name, self.load_compiled(name).to_dict()
 
-    def append_correction(self, name: str, wrong: str, correct: str) -> None:
-        """Append a correction pair to template's correction list.
+    def append_correction(
+        self, name: str, wrong: str, correct: str, roi: str | None = None
+    ) -> None:
+        """Record a correction pair in the template's correction list.
 
-        The previous implementation stored corrections in a mapping which
-        overwrote existing entries when the same ``wrong`` text appeared
-        multiple times.  To preserve the full history of human feedback,
-        corrections are now recorded as a list of ``{"wrong": ..., "correct": ...}``
-        dictionaries.
+        Corrections are stored as a list of ``{"wrong": ..., "correct": ...}``
+        dictionaries, optionally scoped to a single ROI with ``"roi"``.  A pair
+        already present for the same ``wrong`` text and scope is replaced
+        rather than appended again, so repeated review saves do not grow the
+        list.  The latest correction is moved to the end of the list.
         """
+        if not wrong or wrong == correct:
+            return
         data = self.load(name)
-        data.setdefault("corrections", [])
-        data["corrections"].append({"wrong": wrong, "correct": correct})
+        entry = {"wrong": wrong, "correct": correct}
+        if roi:
+            entry["roi"] = roi
+        corrections = [
+            item
+            for item in data.get("corrections", [])
+            if not (item.get("wrong") == wrong and (item.get("roi") or None) == (roi or None))
+        ]
+        corrections.append(entry)
+        data["corrections"] = corrections
         self.save(name, data)
@@ -0,0 +1,117 @@
+"""Token, latency and cost accounting for engine calls.
+
+Engines report every API call with :func:`record`.  The records go to the
+:class:`UsageCollector` active in the current context, which
+:class:`~core.ocr_agent.OcrAgent` installs per document and persists through
+:class:`~core.db_manager.DBManager`.  The ROI being processed is tracked in a
+context variable set by :class:`~core.ocr_processor.OCRProcessor`, so
+concurrent ROI tasks are attributed correctly.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+# USD per 1M tokens (input, output)
+MODEL_PRICES: Dict[str, tuple[float, float]] = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised when the daily token budget has been used up."""
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Return the list-price cost of a call in USD (``0`` for unknown models)."""
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+@dataclass
+class UsageRecord:
+    """One engine API call."""
+
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    image_tokens: int
+    latency: float
+    retries: int = 0
+    roi: Optional[str] = None
+    #: Price multiplier, e.g. ``0.5`` for Batch API calls.
+    discount: float = 1.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens) * self.discount
+
+
+@dataclass
+class UsageCollector:
+    """Thread-safe list of :class:`UsageRecord` for one unit of work."""
+
+    records: List[UsageRecord] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self.records)
+        return {
+            "calls": len(records),
+            "prompt_tokens": sum(r.prompt_tokens for r in records),
+            "completion_tokens": sum(r.completion_tokens for r in records),
+            "image_tokens": sum(r.image_tokens for r in records),
+            "retries": sum(r.retries for r in records),
+            "latency": sum(r.latency for r in records),
+            "cost": sum(r.cost for r in records),
+        }
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(asdict(r), cost=r.cost) for r in self.records]
+
+
+_collector: ContextVar[Optional[UsageCollector]] = ContextVar("usage_collector", default=None)
+_roi: ContextVar[Optional[str]] = ContextVar("usage_roi", default=None)
+
+
+@contextmanager
+def collect(collector: UsageCollector) -> Iterator[UsageCollector]:
+    """Send records made in this context (and tasks it starts) to ``collector``."""
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+
+
+def set_roi(roi: Optional[str]) -> None:
+    """Attribute subsequent records of the current task to ``roi``."""
+    _roi.set(roi)
+
+
+def record(entry: UsageRecord) -> None:
+    """Report a call to the active collector, if any."""
+    collector = _collector.get()
+    if collector is None:
+        return
+    if entry.roi is None:
+        entry.roi = _roi.get()
+    collector.add(entry)
@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core import preprocess
+from core.batch_api import BatchJob, LocalBatchClient
+from core.db_manager import DBManager
+from core.ocr_agent import OcrAgent
+from core.ocr_bridge import OpenAIVisionOCR
+from core.template_manager import TemplateManager
+
+
+def _agent(tmp_path):
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    templates = TemplateManager(template_dir=str(tmp_path / "templates"))
+    return OcrAgent(db=db, templates=templates), db
+
+
+TEMPLATE = {
+    "name": "batch",
+    "rois": {
+        "name": {"box": [0, 0, 40, 20]},
+        "zip": {"box": [0, 20, 40, 20]},
+    },
+}
+
+
+def test_batch_roundtrip(tmp_path, monkeypatch):
+    os.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "estimate_skew", lambda img, max_dim=None: 0.0)
+    agent, db = _agent(tmp_path)
+    job_id = db.create_job("batch", "now")
+
+    batch = BatchJob(str(tmp_path / "batches" / "job1"))
+    image = np.random.default_rng(0).integers(0, 255, (40, 40, 3), dtype=np.uint8)
+    workspaces = [
+        agent.add_to_batch(batch, image, f"img{i}.png", TEMPLATE, OpenAIVisionOCR(), OpenAIVisionOCR(), job_id)
+        for i in range(2)
+    ]
+    assert workspaces[0] != workspaces[1]
+
+    client = LocalBatchClient()
+    agent.submit_batch(batch, client)
+    lines = [json.loads(line) for line in batch.jsonl_path.read_text().splitlines()]
+    assert len(lines) == 8
+    assert {line["url"] for line in lines} == {"/v1/chat/completions"}
+
+    loaded = BatchJob.load(str(batch.manifest_path))
+    assert loaded.batch_id == batch.batch_id
+    results = agent.ingest_batch(loaded, client)
+
+    assert set(results) == {"img0.png", "img1.png"}
+    entry = results["img0.png"]["name"]
+    # 両エンジンが同じ応答を返すため高信頼度で確定する
+    assert entry["text"].startswith("MOCK")
+    assert entry["confidence_level"] == "high"
+    assert len(list(db.fetch_results(job_id))) == 4
+    with open(os.path.join(workspaces[0], "extract.json"), encoding="utf-8") as f:
+        assert "result_id" in json.load(f)["zip"]
+    db.close()
+
+
+def test_batch_missing_outputs_are_retryable(tmp_path, monkeypatch):
+    os.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "estimate_skew", lambda img, max_dim=None: 0.0)
+    agent, db = _agent(tmp_path)
+
+    class DroppingClient(LocalBatchClient):
+        async def results(self, status):
+            lines = await super().results(status)
+            return [line for line in lines if not line["custom_id"].endswith("|zip")]
+
+    batch = BatchJob(str(tmp_path / "job"))
+    image = np.full((40, 40, 3), 128, dtype=np.uint8)
+    agent.add_to_batch(batch, image, "img.png", TEMPLATE, OpenAIVisionOCR())
+    client = DroppingClient()
+    agent.submit_batch(batch, client)
+    results = agent.ingest_batch(batch, client)["img.png"]
+
+    assert results["name"]["text"].startswith("MOCK")
+    assert results["zip"]["retryable"] is True
+    assert "needs_human" not in results["zip"]
+    assert [r["status"] for r in db.fetch_retryable_results()] == ["retry"]
+    db.close()
+
+
+def test_large_batch_is_split_into_shards(tmp_path, monkeypatch):
+    os.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "estimate_skew", lambda img, max_dim=None: 0.0)
+    agent, db = _agent(tmp_path)
+
+    batch = BatchJob(str(tmp_path / "job"), max_requests=3)
+    image = np.random.default_rng(1).integers(0, 255, (40, 40, 3), dtype=np.uint8)
+    for i in range(4):
+        agent.add_to_batch(batch, image, f"img{i}.png", TEMPLATE, OpenAIVisionOCR())
+    client = LocalBatchClient()
+    agent.submit_batch(batch, client)
+
+    parts = sorted(tmp_path.glob("job.part*.jsonl"))
+    assert [len(p.read_text().splitlines()) for p in parts] == [3, 3, 2]
+    assert not batch.jsonl_path.exists()
+    loaded = BatchJob.load(str(batch.manifest_path))
+    assert loaded.batch_ids == ["batch_local_1", "batch_local_2", "batch_local_3"]
+
+    results = agent.ingest_batch(loaded, client)
+    assert set(results) == {f"img{i}.png" for i in range(4)}
+    assert all(not entry.get("retryable") for doc in results.values() for entry in doc.values())
+    db.close()
+
+
+def test_shards_respect_the_byte_limit(tmp_path):
+    batch = BatchJob(str(tmp_path / "job"), max_bytes=250)
+    for i in range(5):
+        batch.add_request("doc", f"roi{i}", "primary", {"model": "m", "messages": [{"role": "user", "content": "x" * 50}]})
+    shards = batch.shards()
+    assert sum(len(shard) for shard in shards) == 5
+    assert len(shards) > 1
+    assert all(sum(len(line.encode("utf-8")) + 1 for line in shard) <= 250 for shard in shards)
+
+
+def test_pending_shard_keeps_the_batch_running(tmp_path):
+    class SlowClient(LocalBatchClient):
+        async def status(self, batch_id):
+            status = await super().status(batch_id)
+            if batch_id.endswith("_2"):
+                status.status = "in_progress"
+            return status
+
+    batch = BatchJob(str(tmp_path / "job"))
+    batch.batch_ids = ["batch_local_1", "batch_local_2"]
+    agent, db = _agent(tmp_path)
+    assert agent.ingest_batch(batch, SlowClient()) is None
+    db.close()
+
+
+def test_legacy_manifest_with_single_batch_id(tmp_path):
+    manifest = tmp_path / "old.manifest.json"
+    manifest.write_text(json.dumps({"batch_id": "batch_abc", "has_validator": False, "documents": []}))
+    assert BatchJob.load(str(manifest)).batch_ids == ["batch_abc"]
+
+
+def test_reloaded_job_submits_the_remaining_shards(tmp_path, monkeypatch):
+    os.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "estimate_skew", lambda img, max_dim=None: 0.0)
+    agent, db = _agent(tmp_path)
+
+    class FlakyClient(LocalBatchClient):
+        fail = True
+
+        async def submit(self, jsonl_path):
+            if self.fail and self._batches:
+                raise RuntimeError("upload failed")
+            return await super().submit(jsonl_path)
+
+    batch = BatchJob(str(tmp_path / "job"), max_requests=3)
+    image = np.random.default_rng(2).integers(0, 255, (40, 40, 3), dtype=np.uint8)
+    for i in range(3):
+        agent.add_to_batch(batch, image, f"img{i}.png", TEMPLATE, OpenAIVisionOCR())
+    client = FlakyClient()
+    with pytest.raises(RuntimeError):
+        agent.submit_batch(batch, client)
+    parts = {p.name: p.read_text() for p in tmp_path.glob("job.part*.jsonl")}
+    assert len(parts) == 2
+
+    loaded = BatchJob.load(str(batch.manifest_path))
+    assert loaded.batch_ids == ["batch_local_1"]
+    client.fail = False
+    agent.submit_batch(loaded, client)
+
+    assert loaded.batch_ids == ["batch_local_1", "batch_local_2"]
+    assert {p.name: p.read_text() for p in tmp_path.glob("job.part*.jsonl")} == parts
+    assert not loaded.jsonl_path.exists()
+    results = agent.ingest_batch(BatchJob.load(str(batch.manifest_path)), client)
+    assert set(results) == {f"img{i}.png" for i in range(3)}
+    assert all(not entry.get("retryable") for doc in results.values() for entry in doc.values())
+    db.close()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerOCR, CircuitOpenError
+from core.ocr_bridge import BaseOCR, DummyOCR, OCRError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyOCR(BaseOCR):
+    def __init__(self):
+        self.healthy = False
+        self.calls = 0
+
+    async def run(self, image):
+        self.calls += 1
+        if not self.healthy:
+            raise OCRError("down")
+        return "ok", 0.99
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4, reset_timeout=10, clock=clock)
+    for ok in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # 試行は1件のみ
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker(failure_rate=1.0, window=2, min_calls=2, slow_call_seconds=1.0)
+    breaker.record(True, latency=2.0)
+    breaker.record(True, latency=3.0)
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_fast_and_fails_over():
+    image = np.zeros((10, 20, 3), dtype=np.uint8)
+    engine = FlakyOCR()
+    breaker = CircuitBreaker(failure_rate=0.5, window=2, min_calls=2, reset_timeout=60)
+
+    guarded = CircuitBreakerOCR(engine, breaker)
+    for _ in range(2):
+        with pytest.raises(OCRError):
+            asyncio.run(guarded.run(image))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(guarded.run(image))
+    assert engine.calls == 2
+    assert guarded.rejected == 1
+
+    failover = CircuitBreakerOCR(engine, breaker, fallback=DummyOCR())
+    assert asyncio.run(failover.run(image)) == ("ダミーテキスト(20x10)", 0.95)
+    assert engine.calls == 2
+    assert failover.failovers == 1
+
+
+def test_run_batch_fails_over_missing_keys():
+    images = {k: np.zeros((10, 10, 3), dtype=np.uint8) for k in "ab"}
+    guarded = CircuitBreakerOCR(FlakyOCR(), CircuitBreaker(min_calls=10), fallback=DummyOCR())
+    results = asyncio.run(guarded.run_batch(images))
+    assert set(results) == {"a", "b"}
+    assert guarded.failovers == 2
+
+
+class HangingOCR(BaseOCR):
+    async def run(self, image):
+        await asyncio.sleep(60)
+
+
+class BrokenOCR(BaseOCR):
+    async def run(self, image):
+        raise RuntimeError("bug")
+
+
+def _half_open_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_rate=0.5, window=2, min_calls=2, reset_timeout=10, clock=clock)
+    breaker.record(False)
+    breaker.record(False)
+    clock.now = 10
+    return breaker
+
+
+def test_cancelled_probe_releases_the_half_open_slot():
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    breaker = _half_open_breaker()
+    guarded = CircuitBreakerOCR(HangingOCR(), breaker)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(guarded.run(image))
+        await asyncio.sleep(0)
+        assert breaker.state == HALF_OPEN
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()  # 次の試行が通る
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_unexpected_exceptions_count_as_failures():
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    breaker = _half_open_breaker()
+    guarded = CircuitBreakerOCR(BrokenOCR(), breaker, fallback=DummyOCR())
+    with pytest.raises(RuntimeError):
+        asyncio.run(guarded.run(image))
+    assert breaker.state == OPEN
+    assert guarded.failovers == 0
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.corrections import AhoCorasick, CorrectionSet, compile_corrections
+
+
+def test_leftmost_longest_matches():
+    automaton = AhoCorasick(["he", "she", "hers", "his"])
+    assert automaton.leftmost_longest("ushers") == [(1, 1)]
+    assert automaton.leftmost_longest("hishe") == [(0, 3), (3, 0)]
+    assert sorted(automaton.iter_matches("ushers")) == [(1, 1), (2, 0), (2, 2)]
+
+
+def test_single_pass_rewrite():
+    corrections = CorrectionSet(
+        [
+            {"wrong": "O", "correct": "0"},
+            {"wrong": "0O", "correct": "00"},
+            {"wrong": "l", "correct": "1"},
+            {"wrong": "1", "correct": "I"},
+        ]
+    )
+    # 置換結果は再度照合されず、長いパターンが優先される
+    assert corrections.apply("0Ol") == "001"
+    assert corrections.apply("") == ""
+
+
+def test_deduplicated_and_scoped():
+    corrections = CorrectionSet(
+        [
+            {"wrong": "東京都", "correct": "東京"},
+            {"wrong": "東京都", "correct": "東京都"},
+            {"wrong": "ー", "correct": "-", "roi": "zip"},
+        ]
+    )
+    assert len(corrections) == 1
+    assert corrections.apply("東京都港区") == "東京都港区"
+    assert corrections.apply("100ー0001", "zip") == "100-0001"
+    assert corrections.apply("100ー0001", "name") == "100ー0001"
+
+
+def test_compiled_sets_are_cached_by_content():
+    items = [{"wrong": "A", "correct": "B"}]
+    first = compile_corrections(items)
+    assert compile_corrections(list(items)) is first
+    assert compile_corrections(first) is first
+    changed = compile_corrections(items + [{"wrong": "C", "correct": "D"}])
+    assert changed is not first
+    assert changed.apply("AC") == "BD"
@@ -28,3 +28,40 @@ def test_compute_metrics(tmp_path):
     assert isinstance(daily_df, pd.DataFrame)
     assert list(daily_df["date"]) == ["20250101", "20250102"]
     assert list(daily_df["count"]) == [1, 1]
+
+
+def test_compute_template_costs(tmp_path):
+    from core.db_manager import DBManager
+    from core.dashboard_utils import compute_template_costs
+
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    assert compute_template_costs(db).empty
+
+    job_a = db.create_job("invoice", "2025-01-01T00:00:00")
+    job_b = db.create_job("receipt", "2025-01-01T00:00:00")
+    record = {
+        "roi": "total",
+        "model": "gpt-4.1-mini",
+        "prompt_tokens": 1000,
+        "completion_tokens": 10,
+        "image_tokens": 85,
+        "latency": 0.2,
+        "retries": 0,
+        "cost": 0.001,
+    }
+    db.add_usage(job_a, "a.png", [record, dict(record, roi="date")], "2025-01-01T00:00:00")
+    db.add_usage(job_b, "b.png", [dict(record, cost=0.0005)], "2025-01-01T00:00:00")
+
+    # 自動検出のジョブは文書ごとに判定したテンプレートへ集計する
+    job_auto = db.create_job("自動検出", "2025-01-01T00:00:00")
+    db.add_usage(job_auto, "c.png", [dict(record, cost=0.0001)], "2025-01-01T00:00:00", "receipt")
+
+    df = compute_template_costs(db)
+    assert list(df["template_name"]) == ["invoice", "receipt"]
+    assert df.iloc[1]["documents"] == 2
+    assert df.iloc[0]["calls"] == 2
+    assert df.iloc[0]["documents"] == 1
+    assert abs(df.iloc[0]["cost_per_document"] - 0.002) < 1e-9
+    assert db.daily_tokens("2025-01-01") == 4040
+    db.close()
@@ -18,3 +18,33 @@ def test_db_manager(tmp_path):
     assert results[0]["status"] == "confirmed"
 
     db.close()
+
+
+def test_initialize_adds_usage_template_column(tmp_path):
+    import sqlite3
+
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        """
+        CREATE TABLE api_usage (
+            usage_id INTEGER PRIMARY KEY AUTOINCREMENT, job_id INTEGER NOT NULL,
+            image_name TEXT NOT NULL, roi_name TEXT, model TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL,
+            image_tokens INTEGER NOT NULL, latency_ms REAL NOT NULL, retries INTEGER NOT NULL,
+            cost_usd REAL NOT NULL, created_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.close()
+
+    db = DBManager(db_path=str(db_file))
+    db.initialize()
+    db.initialize()
+    job_id = db.create_job("自動検出", "2025-01-01T00:00:00")
+    record = {"roi": "a", "model": "m", "prompt_tokens": 1, "completion_tokens": 1,
+              "image_tokens": 0, "latency": 0.1, "retries": 0, "cost": 0.0}
+    db.add_usage(job_id, "a.png", [record], "2025-01-01T00:00:00", "invoice")
+    db.add_usage(job_id, "b.png", [record], "2025-01-01T00:00:00")
+    assert sorted(r["template_name"] for r in db.usage_summary("template")) == ["invoice", "自動検出"]
+    db.close()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.db_manager import DBManager
+from core.glyph_ocr import (
+    GlyphClassifier,
+    GlyphClassifierOCR,
+    collect_training_samples,
+    samples_from_crop,
+    segment_glyphs,
+    train_classifier,
+)
+from core.ocr_bridge import BaseOCR
+from core.ocr_processor import OCRProcessor
+
+
+def render(text, scale=1.0, thickness=2, offset=0):
+    img = np.full((50, 30 + 22 * len(text), 3), 255, dtype=np.uint8)
+    cv2.putText(img, text, (8 + offset, 36), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), thickness)
+    return img
+
+
+def trained_model():
+    samples = []
+    for text in ["0123456789", "9876543210", "1,234-5", "5,678-0"]:
+        for scale, thickness in [(1.0, 2), (0.9, 2), (1.1, 2)]:
+            samples.extend(samples_from_crop(render(text, scale, thickness), text))
+    return train_classifier(samples)
+
+
+def test_segment_glyphs_counts_characters():
+    assert len(segment_glyphs(render("1,234-5"))) == 7
+
+
+def test_glyph_engine_reads_digits(tmp_path):
+    model = trained_model()
+    path = tmp_path / "glyph.npz"
+    model.save(str(path))
+    engine = GlyphClassifierOCR(GlyphClassifier.load(str(path)))
+
+    text, confidence = asyncio.run(engine.run(render("4071", offset=3)))
+    assert text == "4071"
+    assert confidence > 0.9
+
+    empty = np.full((40, 100, 3), 255, dtype=np.uint8)
+    assert asyncio.run(engine.run(empty)) == ("", 0.0)
+
+
+class CountingOCR(BaseOCR):
+    def __init__(self):
+        self.calls = 0
+
+    async def run(self, image):
+        self.calls += 1
+        return "API", 0.99
+
+
+def test_processor_skips_api_for_confident_numeric_rois(tmp_path):
+    crops = tmp_path / "ws" / "crops"
+    crops.mkdir(parents=True)
+    cv2.imwrite(str(crops / "P1_zip_code.png"), render("1234567"))
+    cv2.imwrite(str(crops / "P2_name.png"), render("1234567"))
+    rois = {
+        "zip_code": {"validation_rule": "regex:^\\d{7}$"},
+        "name": {"validation_rule": ""},
+    }
+    primary, validator = CountingOCR(), CountingOCR()
+    processor = OCRProcessor(
+        primary,
+        str(tmp_path / "ws"),
+        validator_engine=validator,
+        rois=rois,
+        local_engine=GlyphClassifierOCR(trained_model()),
+    )
+    results = asyncio.run(processor.process_all())
+
+    assert results["zip_code"]["text"] == "1234567"
+    assert results["zip_code"]["source_engine"] == "local"
+    assert "needs_human" not in results["zip_code"]
+    assert results["name"]["text"] == "API"
+    assert primary.calls == 1 and validator.calls == 1
+
+
+class FixedOCR(BaseOCR):
+    def __init__(self, result):
+        self.result = result
+
+    async def run(self, image):
+        return self.result
+
+
+def test_invalid_local_result_goes_to_the_api(tmp_path):
+    """検証ルールに合わないローカル結果はレビューではなく API エンジンで読み直す"""
+    rois = {"zip_code": {"validation_rule": "regex:^\\d{7}$"}}
+    primary = CountingOCR()
+    (tmp_path / "ws").mkdir()
+    processor = OCRProcessor(
+        primary,
+        str(tmp_path / "ws"),
+        rois=rois,
+        local_engine=FixedOCR(("123456", 0.99)),
+        crops={"zip_code": render("123456")},
+    )
+    results = asyncio.run(processor.process_all())
+
+    assert primary.calls == 1
+    assert results["zip_code"]["text"] == "API"
+    assert "source_engine" not in results["zip_code"]
+    assert processor.local_hits == 0
+
+
+def test_glyph_engine_classifies_off_the_event_loop():
+    engine = GlyphClassifierOCR(trained_model())
+    threads = []
+    recognize = engine.recognize
+    engine.recognize = lambda image: threads.append(threading.get_ident()) or recognize(image)
+
+    async def read():
+        return await engine.run(render("42")), threading.get_ident()
+
+    (text, _), loop_thread = asyncio.run(read())
+    assert text == "42"
+    assert threads and threads[0] != loop_thread
+
+
+def test_collect_training_samples_uses_corrections(tmp_path):
+    doc = tmp_path / "workspace" / "DOC_1"
+    (doc / "crops").mkdir(parents=True)
+    cv2.imwrite(str(doc / "crops" / "P1_price.png"), render("120"))
+    cv2.imwrite(str(doc / "crops" / "P2_zip.png"), render("987"))
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    job = db.create_job("invoice", "2025-01-01T00:00:00")
+    corrected = db.add_result(job, "img.png", "price", final_text="12O")
+    db.update_result(corrected, "120")
+    unconfirmed = db.add_result(job, "img.png", "zip", final_text="987")
+    extract = {
+        "price": {"text": "120", "source_image": "P1_price.png", "result_id": corrected},
+        "zip": {
+            "text": "987",
+            "source_image": "P2_zip.png",
+            "result_id": unconfirmed,
+            "needs_human": True,
+            "confidence_level": "medium",
+        },
+    }
+    (doc / "extract.json").write_text(json.dumps(extract), encoding="utf-8")
+
+    samples = collect_training_samples(str(tmp_path / "workspace"), db)
+    assert [label for _, label in samples] == ["1", "2", "0"]
+    db.close()
+
+
+def test_collect_training_samples_requires_two_engines(tmp_path):
+    doc = tmp_path / "workspace" / "DOC_1"
+    (doc / "crops").mkdir(parents=True)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    high = {"confidence_level": "high", "confidence": 1.0}
+    extract = {
+        "agreed": dict(high, text="45", text_mini="45", text_nano="45"),
+        "local": dict(high, text="67", text_mini="67", source_engine="local"),
+        "single": dict(high, text="89", text_mini="89"),
+        "fallback": dict(high, text="10", text_mini="10", text_nano="10", source_engine="fallback"),
+        "blank": {"text": "", "confidence_level": "blank", "source_engine": "blank"},
+    }
+    for i, (key, info) in enumerate(extract.items(), start=1):
+        info["source_image"] = f"P{i}_{key}.png"
+        cv2.imwrite(str(doc / "crops" / info["source_image"]), render(info["text"] or "0"))
+    (doc / "extract.json").write_text(json.dumps(extract), encoding="utf-8")
+
+    samples = collect_training_samples(str(tmp_path / "workspace"), db)
+    assert [label for _, label in samples] == ["4", "5"]
+    db.close()
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.http_client import HTTPClientPool
+
+
+def test_session_reused_within_loop():
+    pool = HTTPClientPool(limit=5, limit_per_host=2, dns_cache_ttl=60)
+
+    async def scenario():
+        first = await pool.get_session()
+        second = await pool.get_session()
+        assert first is second
+        assert first.connector.limit == 5
+        assert first.connector.limit_per_host == 2
+        await pool.close()
+        assert first.closed
+        assert not pool.is_open
+
+    asyncio.run(scenario())
+
+
+def test_new_session_for_new_loop():
+    pool = HTTPClientPool()
+
+    async def get():
+        return await pool.get_session()
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+    assert first is not second
+    assert first.closed
+    asyncio.run(pool.close())
+
+
+def test_agent_keeps_loop_between_calls(tmp_path):
+    from core.db_manager import DBManager
+    from core.ocr_agent import OcrAgent
+    from core.ocr_bridge import BaseOCR
+    from core.template_manager import TemplateManager
+
+    class PoolOCR(BaseOCR):
+        def __init__(self):
+            self.pool = HTTPClientPool()
+            self.sessions = []
+
+        async def run(self, image):
+            self.sessions.append(await self.pool.get_session())
+            return "ok", 0.99
+
+        async def aclose(self):
+            await self.pool.close()
+
+    db = DBManager(str(tmp_path / "ocr.db"))
+    engine = PoolOCR()
+    with OcrAgent(db=db, templates=TemplateManager(str(tmp_path / "templates"))) as agent:
+        agent.recognize(engine, None)
+        agent.recognize(engine, None)
+        assert engine.sessions[0] is engine.sessions[1]
+        assert not engine.sessions[0].closed
+    assert engine.sessions[0].closed
+    db.close()
+
+
+def test_engines_leave_the_shared_pool_open(tmp_path):
+    from core.db_manager import DBManager
+    from core.http_client import default_pool
+    from core.ocr_agent import OcrAgent
+    from core.ocr_bridge import GPT4oMiniVisionOCR, GPT4oNanoVisionOCR
+    from core.template_manager import TemplateManager
+
+    class SessionOCR(GPT4oMiniVisionOCR):
+        async def run(self, image):
+            self.session = await self.client.get_session()
+            return "ok", 0.99
+
+    engine, other = SessionOCR(), GPT4oNanoVisionOCR()
+    assert engine.client is default_pool and other.client is default_pool
+    db = DBManager(str(tmp_path / "ocr.db"))
+    with OcrAgent(db=db, templates=TemplateManager(str(tmp_path / "templates"))) as agent:
+        agent.recognize(engine, None)
+        first = engine.session
+        # 別エンジンの後始末で共有セッションが閉じられない
+        agent._run(other.aclose(), [other])
+        agent.recognize(engine, None)
+        assert engine.session is first and not first.closed
+    assert first.closed
+
+    # 一時ループでは、そのループで開いたセッションだけを閉じる
+    agent = OcrAgent(db=db, templates=TemplateManager(str(tmp_path / "templates")))
+    agent.recognize(engine, None)
+    assert engine.session.closed and not default_pool.is_open
+    db.close()
@@ -0,0 +1,81 @@
+import io
+import os
+import sys
+import zipfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.image_source import FileListSource, FolderImageSource, ZipImageSource
+
+
+def _png(value: int) -> bytes:
+    ok, buf = cv2.imencode(".png", np.full((8, 6, 3), value, dtype=np.uint8))
+    assert ok
+    return buf.tobytes()
+
+
+def test_zip_source_decodes_members_lazily():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as zf:
+        zf.writestr("a.png", _png(10))
+        zf.writestr("sub/b.PNG", _png(20))
+        zf.writestr("notes.txt", "not an image")
+        zf.writestr("__MACOSX/._a.png", b"\x00")
+        zf.writestr("broken.jpg", b"garbage")
+    data.seek(0)
+
+    with ZipImageSource(data) as source:
+        assert len(source) == 3
+        images = iter(source)
+        name, image = next(images)
+        assert name == "a.png" and image.shape == (8, 6, 3) and image[0, 0, 0] == 10
+        rest = list(images)
+    assert [name for name, _ in rest] == ["sub/b.PNG"]
+    assert rest[0][1][0, 0, 0] == 20
+    assert source.skipped == ["broken.jpg"]
+
+
+def test_folder_and_file_list_sources(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "b.png").write_bytes(_png(30))
+    (tmp_path / "sub" / "a.jpg").write_bytes(_png(40))
+    (tmp_path / "readme.md").write_text("x")
+
+    source = FolderImageSource(tmp_path)
+    assert [name for name, _ in source] == ["b.png", "sub/a.jpg"]
+
+    class Upload(io.BytesIO):
+        name = "up.png"
+
+    [(name, image)] = list(FileListSource([Upload(_png(50))]))
+    assert name == "up.png" and image[0, 0, 0] == 50
+
+
+def test_file_list_keeps_uploads_with_the_same_name():
+    def upload(name, value):
+        f = io.BytesIO(_png(value))
+        f.name = name
+        return f
+
+    source = FileListSource([upload("scan.png", 10), upload("scan.png", 20), upload("scan (2).png", 30)])
+    assert len(source) == 3
+    docs = list(source)
+    assert [name for name, _ in docs] == ["scan.png", "scan (2).png", "scan (2) (2).png"]
+    assert [int(image[0, 0, 0]) for _, image in docs] == [10, 20, 30]
+
+
+def test_multi_page_tiff_yields_one_document_per_page(tmp_path):
+    pages = [np.full((8, 6, 3), value, dtype=np.uint8) for value in (10, 20, 30)]
+    assert cv2.imwritemulti(str(tmp_path / "scan.tif"), pages)
+    assert cv2.imwrite(str(tmp_path / "single.tiff"), pages[0])
+    (tmp_path / "empty.tif").write_bytes(b"")
+
+    source = FolderImageSource(tmp_path)
+    assert len(source) == 3
+    docs = list(source)
+    assert [name for name, _ in docs] == ["scan.tif#1", "scan.tif#2", "scan.tif#3", "single.tiff"]
+    assert [int(image[0, 0, 0]) for _, image in docs] == [10, 20, 30, 10]
+    assert source.skipped == ["empty.tif"]
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.http_client import HTTPClientPool
+from core.mock_openai import MockConfig, MockOpenAIServer
+from core.ocr_bridge import GPT4oMiniVisionOCR
+from core.rate_limit import AdaptiveRateLimiter
+
+
+def make_engine(server):
+    return GPT4oMiniVisionOCR(
+        client=HTTPClientPool(),
+        limiter=AdaptiveRateLimiter(max_retries=10, base_delay=0.01),
+        base_url=server.base_url,
+    )
+
+
+def test_engine_against_mock_server():
+    image = np.zeros((20, 40, 3), dtype=np.uint8)
+    with MockOpenAIServer(MockConfig(latency=0.01)) as server:
+        engine = make_engine(server)
+
+        async def scenario():
+            try:
+                first = await engine.run(image)
+                second = await engine.run(image)
+                batch = await engine.run_batch({"a": image, "b": image + 1})
+            finally:
+                await engine.client.close()
+            return first, second, batch
+
+        first, second, batch = asyncio.run(scenario())
+
+    assert first == second
+    assert first[0].startswith("MOCK")
+    assert set(batch) == {"a", "b"}
+    assert batch["a"][0] == first[0]
+    assert server.stats.requests == 3
+
+
+def test_mock_server_injects_rate_limits():
+    image = np.zeros((20, 40, 3), dtype=np.uint8)
+    config = MockConfig(rate_limit_rate=0.5, retry_after=0.01, seed=1)
+    with MockOpenAIServer(config) as server:
+        engine = make_engine(server)
+
+        async def scenario():
+            try:
+                return await asyncio.gather(*(engine.run(image) for _ in range(8)))
+            finally:
+                await engine.client.close()
+
+        results = asyncio.run(scenario())
+
+    assert server.stats.throttled > 0
+    assert all(text.startswith("MOCK") for text, _ in results)
+    assert engine.limiter.retries == server.stats.throttled
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import json
+import asyncio
 
 import cv2
 import numpy as np
@@ -8,7 +9,7 @@ import numpy as np
 from core.db_manager import DBManager
 from core.template_manager import TemplateManager
 from core.ocr_agent import OcrAgent
-from core.ocr_bridge import DummyOCR, BaseOCR
+from core.ocr_bridge import DummyOCR, BaseOCR, OCRError
 
 
 def test_ocr_agent_process_document(tmp_path):
@@ -103,3 +104,137 @@ def test_ocr_agent_multiple_images_single_job(tmp_path):
     assert {r["image_name"] for r in db_results} == {"a.png", "b.png"}
     assert {r["result_id"] for r in db_results} == {1, 2}
     db.close()
+
+
+class DownOCR(BaseOCR):
+    async def run(self, image: np.ndarray) -> tuple[str, float]:
+        raise OCRError("service unavailable")
+
+
+def test_ocr_agent_retry_failed(tmp_path):
+    os.chdir(tmp_path)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    agent = OcrAgent(db=db, templates=TemplateManager(template_dir=str(tmp_path / "templates")))
+    image = np.zeros((20, 20, 3), dtype=np.uint8)
+    template_data = {"name": "test", "rois": {"field": {"box": [0, 0, 10, 10]}}}
+
+    results, workspace = agent.process_document(image, "test.png", template_data, DownOCR())
+    assert results["field"]["retryable"] is True
+    row = db.fetch_results(1)[0]
+    assert row["status"] == "retry"
+    assert row["final_text"] is None
+
+    results = agent.retry_failed(workspace, DummyOCR())
+    assert results["field"]["text"] == "ダミーテキスト(10x10)"
+    assert results["field"]["result_id"] == 1
+    assert db.fetch_retryable_results() == []
+    assert db.fetch_results(1)[0]["final_text"] == "ダミーテキスト(10x10)"
+    db.close()
+
+
+class PeakOCR(BaseOCR):
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    async def run(self, image: np.ndarray) -> tuple[str, float]:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.02)
+        self.in_flight -= 1
+        return "123", 0.99
+
+
+def test_ocr_agent_process_documents_concurrently(tmp_path):
+    os.chdir(tmp_path)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    agent = OcrAgent(db=db, templates=TemplateManager(template_dir=str(tmp_path / "templates")))
+    template_data = {"name": "test", "rois": {"a": {"box": [0, 0, 10, 10]}, "b": {"box": [10, 10, 10, 10]}}}
+    documents = [(f"doc{i}.png", np.zeros((20, 20, 3), dtype=np.uint8), template_data) for i in range(6)]
+    engine = PeakOCR()
+
+    job_id = db.create_job("test", "now")
+    results = list(
+        agent.iter_documents(documents, engine, job_id=job_id, max_in_flight_rois=3, max_documents=4)
+    )
+
+    assert sorted(r.image_name for r in results) == [f"doc{i}.png" for i in range(6)]
+    assert all(r.error is None and r.results["a"]["text"] == "123" for r in results)
+    assert len({r.workspace_dir for r in results}) == 6
+    assert engine.peak == 3
+    assert len(db.fetch_results(job_id)) == 12
+    db.close()
+
+
+def test_ocr_agent_process_documents_detects_templates(tmp_path):
+    os.chdir(tmp_path)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    templates = TemplateManager(template_dir=str(tmp_path / "templates"))
+    templates.save("dummy", {"name": "dummy", "keywords": ["ダミー"], "rois": {"f": {"box": [0, 0, 5, 5]}}})
+    agent = OcrAgent(db=db, templates=templates)
+
+    async def collect():
+        documents = [("x.png", np.zeros((20, 20, 3), dtype=np.uint8), None)]
+        return [r async for r in agent.process_documents(documents, DummyOCR(), detect_engine=DummyOCR())]
+
+    (result,) = asyncio.run(collect())
+    assert result.error is None
+    assert result.template_name == "dummy"
+    assert result.results["f"]["text"] == "ダミーテキスト(5x5)"
+    db.close()
+
+
+def test_blank_fields_are_reported_per_job(tmp_path):
+    os.chdir(tmp_path)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    agent = OcrAgent(db=db, templates=TemplateManager(template_dir=str(tmp_path / "templates")))
+
+    image = np.full((40, 40, 3), 255, dtype=np.uint8)
+    image[20:, :] = 0
+    template_data = {
+        "name": "blank",
+        "rois": {"empty": {"box": [0, 0, 40, 20]}, "filled": {"box": [0, 20, 40, 20]}},
+    }
+    results, workspace = agent.process_document(image, "a.png", template_data, DummyOCR(), DummyOCR())
+
+    assert results["empty"]["confidence_level"] == "blank"
+    assert results["filled"]["text"] == "ダミーテキスト(40x20)"
+    with open(Path(workspace) / "stats.json", encoding="utf-8") as f:
+        assert json.load(f)["blank"] == {"fields": 1, "calls_saved": 2}
+    saved = db.calls_saved(1)
+    assert [(r["reason"], r["fields"], r["calls"]) for r in saved] == [("blank", 1, 2)]
+    db.close()
+
+
+def test_process_documents_detects_templates_from_the_image(tmp_path):
+    os.chdir(tmp_path)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    templates = TemplateManager(template_dir=str(tmp_path / "templates"))
+    form = np.full((200, 160, 3), 255, dtype=np.uint8)
+    cv2.rectangle(form, (10, 10), (150, 60), (0, 0, 0), 2)
+    cv2.putText(form, "ORDER", (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    cv2.imwrite(str(tmp_path / "order.png"), form)
+    templates.save(
+        "order",
+        {"name": "order", "rois": {"f": {"box": [0, 0, 5, 5]}}, "template_image_path": str(tmp_path / "order.png")},
+    )
+    agent = OcrAgent(db=db, templates=templates)
+
+    class NoDetection(DummyOCR):
+        async def run(self, image):
+            raise AssertionError("page sent to OCR for template detection")
+
+    async def collect():
+        documents = [("x.png", form.copy(), None)]
+        return [r async for r in agent.process_documents(documents, DummyOCR(), detect_engine=NoDetection())]
+
+    (result,) = asyncio.run(collect())
+    assert result.error is None
+    assert result.template_name == "order"
+    assert result.template_detected
+    db.close()
@@ -11,7 +11,7 @@ import pytest
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from core.ocr_bridge import DummyOCR, GPT4oMiniVisionOCR
+from core.ocr_bridge import DummyOCR, GPT4oMiniVisionOCR, OCRError
 from core.config import settings
 
 # OpenAI APIキーが設定されているかチェック
@@ -36,9 +36,9 @@ def test_dummy_ocr(sample_text_image):
 def test_gpt4o_mini_vision_ocr_integration(sample_text_image):
     """GPT4oMiniVisionOCRが実際にAPIと通信して結果を取得できるかテスト"""
     ocr = GPT4oMiniVisionOCR()
-    text, confidence = asyncio.run(ocr.run(sample_text_image))
-
-    if confidence == 0.0:
+    try:
+        text, confidence = asyncio.run(ocr.run(sample_text_image))
+    except OCRError:
         pytest.skip("OpenAI API call failed")
 
     assert isinstance(text, str)
@@ -71,3 +71,37 @@ def test_gpt4o_mini_vision_ocr_mocked(mock_post, sample_text_image):
     assert text == "モックされたOCR結果"
     assert confidence == 0.99
     mock_post.assert_called_once()
+
+
+class MockJSONResponse(MockResponse):
+    def __init__(self, content):
+        self.content = content
+
+    async def json(self):
+        return {"choices": [{"message": {"content": self.content}}]}
+
+
+def test_gpt4o_mini_vision_ocr_batch(sample_text_image):
+    """複数ROIを1リクエストにまとめ、JSONで結果を受け取れるかテスト"""
+    ocr = GPT4oMiniVisionOCR()
+    response = MockJSONResponse('{"zip_code": "1234567", "price": "1,000"}')
+    with patch("aiohttp.ClientSession.post", return_value=response) as mock_post:
+        results = asyncio.run(
+            ocr.run_batch({"zip_code": sample_text_image, "price": sample_text_image})
+        )
+
+    assert results == {"zip_code": ("1234567", 0.99), "price": ("1,000", 0.99)}
+    mock_post.assert_called_once()
+    content = mock_post.call_args.kwargs["json"]["messages"][0]["content"]
+    assert sum(part["type"] == "image_url" for part in content) == 2
+
+
+def test_gpt4o_mini_vision_ocr_batch_fallback(sample_text_image):
+    """JSONを解釈できない場合は個別リクエストに切り替わるかテスト"""
+    ocr = GPT4oMiniVisionOCR()
+    responses = [MockJSONResponse("not json"), MockJSONResponse("A"), MockJSONResponse("B")]
+    with patch("aiohttp.ClientSession.post", side_effect=responses) as mock_post:
+        results = asyncio.run(ocr.run_batch({"a": sample_text_image, "b": sample_text_image}))
+
+    assert mock_post.call_count == 3
+    assert sorted(text for text, _ in results.values()) == ["A", "B"]
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.ocr_bridge import BaseOCR
+from core.ocr_cache import CachedOCR, OCRCache
+
+
+class CountingOCR(BaseOCR):
+    def __init__(self, text="ABC", confidence=0.99, delay=0.0):
+        self.calls = 0
+        self.text = text
+        self.confidence = confidence
+        self.delay = delay
+
+    async def run(self, image):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.text, self.confidence
+
+
+def test_cache_hit_after_first_call(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.db"))
+    engine = CountingOCR()
+    cached = CachedOCR(engine, cache)
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+
+    assert asyncio.run(cached.run(image)) == ("ABC", 0.99)
+    assert asyncio.run(cached.run(image.copy())) == ("ABC", 0.99)
+    assert engine.calls == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # 画素が異なれば別キー
+    other = np.ones((10, 10, 3), dtype=np.uint8)
+    asyncio.run(cached.run(other))
+    assert engine.calls == 2
+    cache.close()
+
+
+def test_concurrent_identical_crops_are_coalesced(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.db"))
+    engine = CountingOCR(delay=0.05)
+    cached = CachedOCR(engine, cache)
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+
+    async def scenario():
+        return await asyncio.gather(*(cached.run(image) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert results == [("ABC", 0.99)] * 5
+    assert engine.calls == 1
+    cache.close()
+
+
+def test_failures_are_not_cached(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.db"))
+    engine = CountingOCR(text="エラー", confidence=0.0)
+    cached = CachedOCR(engine, cache)
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    asyncio.run(cached.run(image))
+    asyncio.run(cached.run(image))
+    assert engine.calls == 2
+    cache.close()
+
+
+def test_lru_and_age_eviction(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.db"), max_entries=2, max_age=3600, evict_every=1000)
+    cache.put("a", "A", 1.0)
+    time.sleep(0.01)
+    cache.put("b", "B", 1.0)
+    time.sleep(0.01)
+    cache.get("a")  # aを最近使用済みにする
+    cache.put("c", "C", 1.0)
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == ("A", 1.0)
+
+    cache.conn.execute("UPDATE ocr_cache SET last_access = 0")
+    cache.conn.commit()
+    assert cache.evict() == 2
+    assert len(cache) == 0
+    cache.close()
+
+
+class BatchPromptOCR(CountingOCR):
+    def batch_cache_identity(self):
+        return "batch-prompt"
+
+    async def run_batch(self, images):
+        self.batches = getattr(self, "batches", 0) + 1
+        await asyncio.sleep(self.delay)
+        return {name: ("BATCH", 0.9) for name in images}
+
+
+def test_batch_answers_are_cached_separately(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.db"))
+    engine = BatchPromptOCR()
+    cached = CachedOCR(engine, cache)
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+
+    assert asyncio.run(cached.run_batch({"a": image})) == {"a": ("BATCH", 0.9)}
+    # 単一画像のプロンプトに対してバッチの回答を返さない
+    assert asyncio.run(cached.run(image)) == ("ABC", 0.99)
+    assert engine.calls == 1
+    assert asyncio.run(cached.run_batch({"a": image.copy()})) == {"a": ("BATCH", 0.9)}
+    assert engine.batches == 1
+    cache.close()
+
+
+def test_concurrent_identical_batches_are_coalesced(tmp_path):
+    cache = OCRCache(str(tmp_path / "cache.db"))
+    engine = BatchPromptOCR(delay=0.05)
+    cached = CachedOCR(engine, cache)
+    images = {"a": np.zeros((10, 10, 3), dtype=np.uint8), "b": np.ones((10, 10, 3), dtype=np.uint8)}
+
+    async def scenario():
+        return await asyncio.gather(*(cached.run_batch(dict(images)) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert results == [{"a": ("BATCH", 0.9), "b": ("BATCH", 0.9)}] * 3
+    assert engine.batches == 1
+    cache.close()
@@ -13,7 +13,7 @@ import pytest
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from core.ocr_bridge import DummyOCR, BaseOCR
+from core.ocr_bridge import DummyOCR, BaseOCR, OCRError
 from core.ocr_processor import OCRProcessor
 
 @pytest.fixture
@@ -111,3 +111,194 @@ def test_process_all_parallel_execution(setup_workspace):
     assert elapsed < 0.18
     assert results["field_a"]["text"] == "ダミーテキスト(100x50)"
     assert results["field_b"]["text"] == "ダミーテキスト(120x60)"
+
+
+class BatchCountingOCR(BaseOCR):
+    def __init__(self):
+        self.batches = []
+
+    async def run(self, image: np.ndarray) -> tuple[str, float]:
+        return "1234", 0.99
+
+    async def run_batch(self, images):
+        self.batches.append(sorted(images))
+        return await super().run_batch(images)
+
+
+def test_process_all_batched(tmp_path):
+    """batch_sizeごとにROIがまとめてエンジンへ渡されることを確認"""
+    workspace_dir = tmp_path / "ws"
+    crops_dir = workspace_dir / "crops"
+    crops_dir.mkdir(parents=True, exist_ok=True)
+    img = np.zeros((20, 40, 3), dtype=np.uint8)
+    for i, name in enumerate(["a", "b", "c"], start=1):
+        cv2.imwrite(str(crops_dir / f"P{i}_{name}.png"), img)
+
+    primary = BatchCountingOCR()
+    validator = BatchCountingOCR()
+    processor = OCRProcessor(primary, str(workspace_dir), validator_engine=validator, batch_size=2)
+    results = asyncio.run(processor.process_all())
+
+    assert primary.batches == [["a", "b"], ["c"]]
+    assert validator.batches == [["a", "b"], ["c"]]
+    assert results["c"]["source_image"] == "P3_c.png"
+    assert results["a"]["confidence_level"] == "high"
+
+
+def test_primary_and_validator_run_concurrently(tmp_path):
+    """主エンジンと検証エンジンが同時に実行されることを確認"""
+    workspace_dir = tmp_path / "ws"
+    crops_dir = workspace_dir / "crops"
+    crops_dir.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(crops_dir / "P1_field_a.png"), np.zeros((20, 40, 3), dtype=np.uint8))
+
+    processor = OCRProcessor(SleepOCR(), str(workspace_dir), validator_engine=SleepOCR())
+
+    start = time.perf_counter()
+    results = asyncio.run(processor.process_all())
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.18
+    assert results["field_a"]["confidence_level"] == "high"
+
+
+class BrokenOCR(BaseOCR):
+    async def run(self, image: np.ndarray) -> tuple[str, float]:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("engine crashed")
+
+
+class CancellableOCR(BaseOCR):
+    def __init__(self):
+        self.cancelled = False
+
+    async def run(self, image: np.ndarray) -> tuple[str, float]:
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "never", 0.99
+
+
+def test_validator_cancelled_when_primary_fails(tmp_path):
+    workspace_dir = tmp_path / "ws"
+    crops_dir = workspace_dir / "crops"
+    crops_dir.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(crops_dir / "P1_field_a.png"), np.zeros((20, 40, 3), dtype=np.uint8))
+
+    validator = CancellableOCR()
+    processor = OCRProcessor(BrokenOCR(), str(workspace_dir), validator_engine=validator)
+    with pytest.raises(RuntimeError):
+        asyncio.run(processor.process_all())
+    assert validator.cancelled
+
+
+class FailingOCR(BaseOCR):
+    async def run(self, image: np.ndarray) -> tuple[str, float]:
+        raise OCRError("service unavailable")
+
+
+def test_failed_fields_are_retryable(tmp_path):
+    workspace_dir = tmp_path / "ws"
+    crops_dir = workspace_dir / "crops"
+    crops_dir.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(crops_dir / "P1_field_a.png"), np.zeros((20, 40, 3), dtype=np.uint8))
+
+    results = asyncio.run(OCRProcessor(FailingOCR(), str(workspace_dir)).process_all())
+    assert results["field_a"]["retryable"] is True
+    assert results["field_a"]["confidence_level"] == "retry"
+    assert "needs_human" not in results["field_a"]
+
+    # 検証エンジンの失敗は主エンジンのみの判定にフォールバックする
+    processor = OCRProcessor(DummyOCR(), str(workspace_dir), validator_engine=FailingOCR())
+    results = asyncio.run(processor.process_all())
+    assert results["field_a"]["text"] == "ダミーテキスト(40x20)"
+    assert "retryable" not in results["field_a"]
+
+
+def test_process_in_memory_crops(tmp_path):
+    """メモリ上の切り出し画像はディスクを経由せずに処理される"""
+    from core.payload import ImageEncoder
+
+    workspace_dir = tmp_path / "ws"
+    workspace_dir.mkdir()
+    crops = {
+        "field_a": np.zeros((20, 40, 3), dtype=np.uint8),
+        "field_b": ImageEncoder().encode(np.zeros((30, 50, 3), dtype=np.uint8)),
+    }
+    processor = OCRProcessor(DummyOCR(), str(workspace_dir), validator_engine=DummyOCR(), crops=crops)
+    results = asyncio.run(processor.process_all())
+
+    assert not (workspace_dir / "crops").exists()
+    assert results["field_a"]["text"] == "ダミーテキスト(40x20)"
+    assert results["field_a"]["source_image"] == "P1_field_a.png"
+    assert results["field_b"]["text"] == "ダミーテキスト(50x30)"
+    assert results["field_b"]["source_image"] == "P2_field_b.png"
+
+
+def test_blank_fields_skip_engines(tmp_path):
+    """空欄と判定された項目はエンジンを呼ばずに空文字として記録する"""
+
+    class CountingOCR(DummyOCR):
+        calls = 0
+
+        async def run(self, image):
+            CountingOCR.calls += 1
+            return await super().run(image)
+
+    written = np.full((20, 60, 3), 255, dtype=np.uint8)
+    cv2.putText(written, "7", (5, 17), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+    crops = {
+        "optional": np.full((20, 60, 3), 255, dtype=np.uint8),
+        "zip": np.full((20, 60, 3), 255, dtype=np.uint8),
+        "written": written,
+    }
+    rois = {"zip": {"box": [0, 0, 60, 20], "validation_rule": "regex:^\\d{7}$"}}
+    processor = OCRProcessor(
+        CountingOCR(), str(tmp_path), validator_engine=CountingOCR(), rois=rois, crops=crops
+    )
+    results = asyncio.run(processor.process_all())
+
+    assert CountingOCR.calls == 2
+    assert results["optional"]["text"] == ""
+    assert results["optional"]["confidence_level"] == "blank"
+    assert "needs_human" not in results["optional"]
+    # 必須の形式を持つ項目が空欄ならレビューに回す
+    assert results["zip"]["needs_human"] is True
+    assert results["written"]["text"] == "ダミーテキスト(60x20)"
+    assert processor.blank_stats() == {"fields": 2, "calls_saved": 4}
+
+    processor = OCRProcessor(DummyOCR(), str(tmp_path), crops=crops, blank_detection=False)
+    results = asyncio.run(processor.process_all())
+    assert results["optional"]["text"] == "ダミーテキスト(60x20)"
+
+
+def test_failover_results_are_sent_to_review(tmp_path):
+    """主エンジンが遮断され検証と同じモデルが答えた場合は一致しても確認対象にする"""
+    from core.circuit_breaker import CircuitBreaker, CircuitBreakerOCR
+
+    class DownOCR(BaseOCR):
+        async def run(self, image):
+            raise OCRError("down")
+
+    crops = {k: np.zeros((20, 40, 3), dtype=np.uint8) for k in "ab"}
+    for batch_size in (1, 2):
+        primary = CircuitBreakerOCR(DownOCR(), CircuitBreaker(min_calls=10), fallback=DummyOCR())
+        processor = OCRProcessor(
+            primary, str(tmp_path), validator_engine=DummyOCR(), crops=crops,
+            batch_size=batch_size, blank_detection=False,
+        )
+        results = asyncio.run(processor.process_all())
+        for entry in results.values():
+            assert entry["text_mini"] == entry["text_nano"]
+            assert entry["source_engine"] == "fallback"
+            assert entry["confidence_level"] == "medium"
+            assert entry["needs_human"] is True
+
+    healthy = OCRProcessor(
+        CircuitBreakerOCR(DummyOCR(), fallback=DummyOCR()), str(tmp_path),
+        validator_engine=DummyOCR(), crops=crops, blank_detection=False,
+    )
+    entry = asyncio.run(healthy.process_all())["a"]
+    assert entry["confidence_level"] == "high" and "source_engine" not in entry
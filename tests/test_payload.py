@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.ocr_bridge import BaseOCR
+from core.ocr_processor import OCRProcessor
+from core.payload import ImageEncoder, ImagePayload, PayloadStats, estimate_image_tokens
+
+
+def test_estimate_image_tokens():
+    assert estimate_image_tokens(100, 100, "low") == 85
+    assert estimate_image_tokens(512, 512) == 85 + 170
+    # 2048x4096 -> 1024x2048 -> 768x1536 -> 2x3 tiles
+    assert estimate_image_tokens(2048, 4096) == 85 + 170 * 6
+
+
+def test_encoder_shrinks_and_memoises():
+    encoder = ImageEncoder(max_dim=256, grayscale=True, formats=["png", "jpeg"])
+    image = np.full((600, 1200, 3), 255, dtype=np.uint8)
+    image[100:500, 100:1100] = (0, 0, 255)
+    stats = PayloadStats()
+
+    first = encoder.encode(image, stats=stats)
+    second = encoder.encode(image.copy(), stats=stats)
+
+    assert first is second
+    assert max(first.width, first.height) == 256
+    assert first.detail == "low"
+    assert first.data_url.startswith("data:image/")
+    report = stats.as_dict()
+    assert report["images"] == 1
+    assert report["reused"] == 1
+    assert report["bytes_saved"] > 0
+    assert report["tokens_saved"] > 0
+
+
+def test_roi_override_produces_distinct_payload():
+    encoder = ImageEncoder(max_dim=0, grayscale=False)
+    image = np.zeros((800, 800, 3), dtype=np.uint8)
+    full = encoder.encode(image)
+    small = encoder.encode(image, max_dim=100)
+    assert full.width == 800
+    assert small.width == 100
+    assert full.key != small.key
+
+
+class PayloadOCR(BaseOCR):
+    accepts_payload = True
+
+    def __init__(self):
+        self.inputs = []
+
+    async def run(self, image):
+        self.inputs.append(image)
+        return "1234", 0.99
+
+
+def test_processor_encodes_once_for_both_engines(tmp_path):
+    import cv2
+
+    crops = tmp_path / "ws" / "crops"
+    crops.mkdir(parents=True)
+    cv2.imwrite(str(crops / "P1_field.png"), np.zeros((40, 80, 3), dtype=np.uint8))
+
+    primary, validator = PayloadOCR(), PayloadOCR()
+    processor = OCRProcessor(
+        primary, str(tmp_path / "ws"), validator_engine=validator, encoder=ImageEncoder()
+    )
+    asyncio.run(processor.process_all())
+
+    assert isinstance(primary.inputs[0], ImagePayload)
+    assert primary.inputs[0] is validator.inputs[0]
+    assert processor.payload_stats.images == 1
+
+
+def test_stats_do_not_encode_the_crop_twice(monkeypatch):
+    encoder = ImageEncoder(max_dim=128, grayscale=True, formats=["png", "jpeg"])
+    calls = []
+    original = ImageEncoder._encode_bytes
+
+    def counting(self, image, fmt):
+        calls.append(fmt)
+        return original(self, image, fmt)
+
+    monkeypatch.setattr(ImageEncoder, "_encode_bytes", counting)
+    stats = PayloadStats()
+    payload = encoder.encode(np.full((400, 400, 3), 200, dtype=np.uint8), stats=stats)
+    assert calls == ["png", "jpeg"]
+    assert stats.baseline_bytes > stats.bytes_sent == len(payload.data)
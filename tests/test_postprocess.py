@@ -19,3 +19,13 @@ def test_low_confidence_flag():
     normalized, needs_human = postprocess.postprocess_result(text, 0.5, "regex:^\\d{7}$")
     assert normalized == "1234567"
     assert needs_human
+
+
+def test_compiled_validators_are_cached():
+    validator = postprocess.compile_validation("regex:^\\d{3}-\\d{4}$")
+    assert validator is postprocess.compile_validation("regex:^\\d{3}-\\d{4}$")
+    assert validator.numeric
+    assert validator("100-0001")
+    assert not validator("100-000l")
+    assert postprocess.check_validation("anything", postprocess.compile_validation(None))
+    assert postprocess.check_validation("100-0001", validator)
@@ -58,3 +58,160 @@ def test_crop_roi(sample_image):
     roi_box = [50, 75, 150, 50] # x, y, w, h
     cropped = preprocess.crop_roi(sample_image, roi_box)
     assert cropped.shape == (50, 150, 3) # (h, w, c)
+
+
+def test_detect_blank():
+    """空欄・記入済み・印刷済み罫線のある欄を判定する"""
+    empty = np.full((40, 120, 3), 250, dtype=np.uint8)
+    check = preprocess.detect_blank(empty)
+    assert check.blank and check.confidence == 1.0
+
+    filled = empty.copy()
+    cv2.putText(filled, "12", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+    check = preprocess.detect_blank(filled)
+    assert not check.blank and check.components >= 1
+
+    speckled = empty.copy()
+    speckled[5, 5] = 0
+    check = preprocess.detect_blank(speckled)
+    assert check.blank and 0.5 <= check.confidence < 1.0
+
+    # 薄い鉛筆の記入は低コントラストでも空欄としない
+    pencil = np.full((40, 120, 3), 235, dtype=np.uint8)
+    cv2.putText(pencil, "12", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (205, 205, 205), 2)
+    check = preprocess.detect_blank(pencil)
+    assert not check.blank and check.components >= 1
+
+    # スキャナのノイズだけの用紙は空欄
+    noisy = np.clip(empty + np.random.default_rng(0).normal(0, 2, empty.shape), 0, 255).astype(np.uint8)
+    assert preprocess.detect_blank(noisy).blank
+
+    # 一様に暗い領域は空欄とみなさない
+    assert not preprocess.detect_blank(np.zeros((20, 40, 3), dtype=np.uint8)).blank
+
+    # 空のテンプレートにある枠線は差し引く
+    guide = empty.copy()
+    cv2.rectangle(guide, (2, 2), (117, 37), (0, 0, 0), 1)
+    reference = preprocess.ink_mask(guide)
+    assert not preprocess.detect_blank(guide).blank
+    assert preprocess.detect_blank(guide, reference).blank
+
+
+def test_estimate_skew_on_downscaled_page():
+    """大きな画像も縮小して推定し、許容角度未満なら回転しない"""
+    page = np.full((1600, 1200, 3), 255, dtype=np.uint8)
+    for y in range(100, 1500, 60):
+        cv2.putText(page, "Invoice 2024 Total 12345", (60, y), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    M = cv2.getRotationMatrix2D((600, 800), 2.0, 1.0)
+    rotated = cv2.warpAffine(page, M, (1200, 1600), borderMode=cv2.BORDER_REPLICATE)
+
+    angle = preprocess.estimate_skew(rotated, max_dim=800)
+    assert abs(angle + 2.0) <= 0.2
+
+    corrected, used = preprocess.deskew(rotated, angle)
+    assert used == angle
+    assert abs(preprocess.estimate_skew(corrected, max_dim=800)) <= 0.2
+
+    # 許容角度未満なら同じ配列をそのまま返す
+    assert preprocess.correct_skew(page, angle=0.05, tolerance=0.1) is page
+
+
+def test_warp_roi_matches_full_page_deskew():
+    """ROIだけを再標本化しても、ページ全体を回転してから切り出すのと同じになる"""
+    page = np.full((600, 500, 3), 255, dtype=np.uint8)
+    for y in range(60, 560, 40):
+        cv2.putText(page, "Total 12345", (40, y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    M = cv2.getRotationMatrix2D((250, 300), 3.0, 1.0)
+    rotated = cv2.warpAffine(page, M, (500, 600), borderMode=cv2.BORDER_REPLICATE)
+
+    box = [120, 200, 160, 60]
+    transform = preprocess.page_transform(rotated, angle=-3.0)
+    crop = preprocess.warp_roi(rotated, box, transform)
+    # warp_roi は双三次補間で再標本化する
+    expected = preprocess.crop_roi(preprocess.deskew(rotated, -3.0, interpolation=cv2.INTER_CUBIC)[0], box)
+    assert crop.shape == expected.shape
+    assert np.abs(crop.astype(int) - expected.astype(int)).mean() < 2.0
+
+    # 許容角度未満なら変換なし、平行移動のみならスライスと一致する
+    assert preprocess.page_transform(rotated, angle=0.05) is None
+    shift = np.float64([[1, 0, 7], [0, 1, -3]])
+    assert np.array_equal(preprocess.warp_roi(page, box, shift), page[197:257, 127:287])
+
+
+def test_alignment_of_large_pages_on_reduced_copy():
+    """縮小画像で照合しても、変換は元の解像度の座標で返る"""
+    template = np.full((1600, 1200, 3), 255, dtype=np.uint8)
+    for i, y in enumerate(range(150, 1500, 150)):
+        cv2.putText(template, f"Form {i} No {i * 37}", (80 + 10 * i, y), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+        cv2.circle(template, (1000 - 40 * i, y - 20), 30, (0, 0, 0), -1)
+    shift = np.float32([[1, 0, 40], [0, 1, 24]])
+    page = cv2.warpAffine(template, shift, (1200, 1600), borderValue=(255, 255, 255))
+
+    reference = preprocess.reference_features(template, max_dim=600)
+    M = preprocess.estimate_alignment(reference, page, max_dim=600)
+    assert M is not None
+    assert np.allclose(M[:, 2], [40, 24], atol=2.0)
+    assert np.allclose(M[:, :2], np.eye(2), atol=0.01)
+
+
+def _form(h=800, w=600):
+    form = np.full((h, w, 3), 255, dtype=np.uint8)
+    for i, y in enumerate(range(80, h - 40, 70)):
+        cv2.putText(form, f"Item {i} Code {i * 41}", (30 + 7 * i, y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        cv2.rectangle(form, (25, y + 12), (w - 40, y + 40), (0, 0, 0), 2)
+    return form
+
+
+def test_align_page_uses_fast_tier_for_small_offsets():
+    form = _form()
+    reference = preprocess.reference_features(form)
+    R = cv2.getRotationMatrix2D((300, 400), 0.8, 1.0)
+    R[:, 2] += [12, -7]
+    page = cv2.warpAffine(form, R, (600, 800), borderValue=(255, 255, 255))
+
+    alignment = preprocess.align_page(reference, page)
+    assert alignment.method in ("phase", "ecc")
+    corners = np.array([[0, 600, 0, 600], [0, 0, 800, 800], [1, 1, 1, 1]])
+    assert np.abs(alignment.transform @ corners - R @ corners).max() < 2.0
+    assert preprocess.page_alignment(page, reference).method == alignment.method
+
+
+def test_align_page_falls_back_to_features():
+    """拡大・大きく回転したページは高速な推定では合わず、特徴点照合に切り替える"""
+    form = _form()
+    reference = preprocess.reference_features(form)
+    R = cv2.getRotationMatrix2D((300, 400), 25.0, 1.2)
+    page = cv2.warpAffine(form, R, (600, 800), borderValue=(255, 255, 255))
+
+    fast = preprocess.fast_alignment(reference, page)
+    assert fast is None or fast.score < 0.8
+    alignment = preprocess.align_page(reference, page)
+    assert alignment.method == "features"
+    assert np.allclose(alignment.transform[:, :2], R[:, :2], atol=0.05)
+
+
+def test_fast_alignment_keeps_a_small_residual_rotation():
+    """縮小画像では相関がほぼ同じでも、平行移動のみの結果で回転を落とさない"""
+    form = _form(2400, 1800)
+    reference = preprocess.reference_features(form)
+    R = cv2.getRotationMatrix2D((900, 1200), 0.1, 1.0)
+    R[:, 2] += [-25, 12]
+    page = cv2.warpAffine(form, R, (1800, 2400), borderValue=(255, 255, 255))
+
+    alignment = preprocess.align_page(reference, page)
+    assert alignment.method == "ecc"
+    corners = np.array([[0, 1800, 0, 1800], [0, 0, 2400, 2400], [1, 1, 1, 1]])
+    assert np.abs(alignment.transform @ corners - R @ corners).max() < 1.5
+
+
+def test_align_page_needs_a_higher_score_for_translation_only(monkeypatch):
+    form = _form()
+    reference = preprocess.reference_features(form)
+    page = cv2.warpAffine(form, np.float32([[1, 0, 12], [0, 1, -7]]), (600, 800), borderValue=(255, 255, 255))
+    phase = preprocess.Alignment(np.float64([[1, 0, 12], [0, 1, -7]]), "phase", 0.9)
+    monkeypatch.setattr(preprocess, "fast_alignment", lambda ref, image: phase)
+
+    assert preprocess.align_page(reference, page).method == "features"
+    assert preprocess.align_page(reference, page, min_score=0.85).method == "features"
+    monkeypatch.setattr(preprocess.settings, "ALIGN_PHASE_MIN_SCORE", 0.85)
+    assert preprocess.align_page(reference, page) is phase
@@ -0,0 +1,112 @@
+import asyncio
+import os
+from pathlib import Path
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.db_manager import DBManager
+from core.ocr_agent import OcrAgent
+from core.ocr_bridge import DummyOCR
+from core.preprocess_pool import PreprocessPool, SharedArray, _crop_worker, prepare_crops
+from core.template_manager import TemplateManager
+
+
+def _page() -> np.ndarray:
+    page = np.full((300, 240, 3), 255, dtype=np.uint8)
+    for y in range(40, 280, 40):
+        cv2.putText(page, "No 123", (20, y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    return page
+
+
+def test_shared_array_round_trip():
+    image = _page()
+    handle, shm = SharedArray.copy_of(image)
+    try:
+        view, other = handle.attach()
+        assert np.array_equal(view, image)
+        del view
+        other.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_pool_crops_match_in_process(tmp_path):
+    page = _page()
+    path = tmp_path / "page.png"
+    cv2.imwrite(str(path), page)
+    templates = TemplateManager(template_dir=str(tmp_path / "templates"))
+    template = templates.compile(
+        {"name": "t", "rois": {"a": {"box": [10, 10, 100, 40]}, "b": {"box": [200, 250, 80, 80]}}}
+    )
+    boxes, expected, alignment = prepare_crops(page, template.boxes, template.reference)
+
+    async def run():
+        with PreprocessPool(2) as pool:
+            return await asyncio.gather(pool.crop(page, template), pool.crop(path, template))
+
+    for aligned, crops, used in asyncio.run(run()):
+        assert np.array_equal(aligned, boxes)
+        assert used.method == alignment.method
+        assert list(crops) == ["a", "b"]
+        for crop, want in zip(crops.values(), expected):
+            assert np.array_equal(crop, want)
+    # 画像の右下にはみ出す ROI は切り詰められる
+    assert expected[1].shape == (50, 40, 3)
+
+
+def test_agent_uses_process_pool(tmp_path):
+    os.chdir(tmp_path)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    templates = TemplateManager(template_dir=str(tmp_path / "templates"))
+    agent = OcrAgent(db=db, templates=templates, preprocess_workers=1)
+    template_data = {"name": "test", "rois": {"field": {"box": [20, 15, 60, 30]}}}
+    page = _page()
+    try:
+        results, workspace = agent.process_document(page, "p.png", template_data, DummyOCR(), DummyOCR())
+        assert agent.preprocess_pool() is not None
+    finally:
+        agent.close()
+        db.close()
+    assert agent._pool is None
+    assert results["field"]["text"] == "ダミーテキスト(60x30)"
+    crop = cv2.imread(str(Path(workspace) / "crops" / "P1_field.png"))
+    assert np.array_equal(crop, page[15:45, 20:80])
+
+
+def test_pool_reuses_blocks_and_sends_the_reference_once(tmp_path):
+    page = _page()
+    cv2.imwrite(str(tmp_path / "reference.png"), page)
+    templates = TemplateManager(template_dir=str(tmp_path / "templates"))
+    template = templates.compile(
+        {"name": "t", "rois": {"a": {"box": [10, 10, 100, 40]}}, "template_image_path": str(tmp_path / "reference.png")}
+    )
+    assert template.reference is not None
+    boxes, expected, _ = prepare_crops(page, template.boxes, template.reference)
+
+    # 特徴量を受け取っていないワーカーは再送を求める
+    out = SharedArray("unused", (0,), "|u1")
+    assert _crop_worker("unused.png", template.boxes, 10_000, None, out) is None
+
+    async def run():
+        results = []
+        for _ in range(4):
+            results.append(await pool.crop(page, template))
+        return results
+
+    with PreprocessPool(2) as pool:
+        results = asyncio.run(run())
+        names = {shm.name for shm in pool._free}
+        assert len(names) == 2
+        assert len(pool._references) == 1
+        asyncio.run(pool.crop(page, template))
+        assert {shm.name for shm in pool._free} == names
+    assert pool._free == []
+    for aligned, crops, _ in results:
+        assert np.array_equal(aligned, boxes)
+        assert np.array_equal(crops["a"], expected[0])
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core.rate_limit import (
+    AdaptiveRateLimiter,
+    RateLimitError,
+    RetryableError,
+    TokenBucket,
+    parse_retry_after,
+)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after": "2"}) == 2.0
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({}) is None
+
+
+def test_retry_after_is_honoured_and_limit_halves():
+    limiter = AdaptiveRateLimiter(
+        requests_per_minute=6000, tokens_per_minute=10**6, max_concurrency=8, max_retries=3
+    )
+    calls = []
+
+    async def flaky():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RateLimitError(retry_after=0.1)
+        return "ok"
+
+    assert asyncio.run(limiter.call(flaky)) == "ok"
+    assert calls[1] - calls[0] >= 0.09
+    assert limiter.throttled == 1
+    assert limiter.retries == 1
+    assert limiter.limit < 8
+
+
+def test_gives_up_after_max_retries():
+    limiter = AdaptiveRateLimiter(max_retries=2, base_delay=0.001)
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise RetryableError("boom")
+
+    with pytest.raises(RetryableError):
+        asyncio.run(limiter.call(failing))
+    assert len(attempts) == 3
+
+
+def test_in_flight_limit():
+    limiter = AdaptiveRateLimiter(max_concurrency=2)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.01)
+        return 1
+
+    async def scenario():
+        return await asyncio.gather(*(limiter.call(work) for _ in range(6)))
+
+    assert sum(asyncio.run(scenario())) == 6
+    assert peak <= 2
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=600)  # 10 tokens/sec
+    bucket.tokens = 0
+
+    start = time.perf_counter()
+    asyncio.run(bucket.acquire(1))
+    assert time.perf_counter() - start >= 0.09
+
+
+def test_zero_quota_means_unlimited():
+    limiter = AdaptiveRateLimiter(requests_per_minute=0, tokens_per_minute=0)
+
+    async def ok():
+        return "ok"
+
+    async def scenario():
+        return await asyncio.gather(*(limiter.call(ok, tokens=1000) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["ok"] * 5
+    asyncio.run(TokenBucket(per_minute=-1).acquire(10))
@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -15,7 +16,7 @@ def test_roi_alignment_with_shift(tmp_path, monkeypatch):
     os.chdir(tmp_path)
 
     # avoid skew correction for this test
-    monkeypatch.setattr(preprocess, "correct_skew", lambda img: img)
+    monkeypatch.setattr(preprocess, "estimate_skew", lambda img, max_dim=None: 0.0)
 
     # create template image with distinctive features
     template_img = np.full((200, 200, 3), 255, dtype=np.uint8)
@@ -50,4 +51,7 @@ def test_roi_alignment_with_shift(tmp_path, monkeypatch):
     expected = shifted_img[70:110, 60:140]
     assert np.array_equal(cropped, expected)
     assert results["field"]["text"] == "ダミーテキスト(80x40)"
+    with open(Path(workspace) / "stats.json", encoding="utf-8") as f:
+        assert json.load(f)["alignment"]["method"] in ("phase", "ecc")
+    assert sum(agent.alignment_stats.values()) == 1
     db.close()
@@ -44,3 +44,196 @@ def test_load_normalises_legacy_structures(tmp_path):
     data = manager.load("legacy")
     assert data["keywords"] == []
     assert data["corrections"] == [{"wrong": "OLD", "correct": "NEW"}]
+
+
+def test_append_correction_deduplicates(tmp_path):
+    manager = TemplateManager(template_dir=str(tmp_path))
+    manager.save("tmp", {"name": "tmp", "rois": {}})
+    for _ in range(3):
+        manager.append_correction("tmp", "OLD", "NEW")
+    manager.append_correction("tmp", "ー", "-", roi="zip")
+    manager.append_correction("tmp", "OLD", "NEWER")
+
+    assert manager.load("tmp")["corrections"] == [
+        {"wrong": "ー", "correct": "-", "roi": "zip"},
+        {"wrong": "OLD", "correct": "NEWER"},
+    ]
+
+
+def test_load_compiled_is_cached_until_the_file_changes(tmp_path):
+    import os
+
+    import numpy as np
+
+    manager = TemplateManager(template_dir=str(tmp_path))
+    manager.save(
+        "form",
+        {
+            "name": "form",
+            "rois": {
+                "zip": {"box": [0, 0, 40, 20], "validation_rule": "regex:^\\d{3}-\\d{4}$"},
+                "name": {"box": [0, 20, 80, 20]},
+            },
+            "corrections": [{"wrong": "ー", "correct": "-", "roi": "zip"}],
+            "batch_size": 2,
+        },
+    )
+    compiled = manager.load_compiled("form")
+    assert manager.load_compiled("form") is compiled
+    assert compiled.roi_names == ("zip", "name")
+    assert np.array_equal(compiled.boxes, [[0, 0, 40, 20], [0, 20, 80, 20]])
+    assert not compiled.boxes.flags.writeable
+    assert compiled.validators["zip"].numeric
+    assert compiled.validators["zip"]("100-0001")
+    assert compiled.corrections.apply("100ー0001", "zip") == "100-0001"
+    assert compiled.batch_size == 2
+    assert compiled.reference is None
+    assert manager.compile(manager.load("form")) is manager.compile(manager.load("form"))
+
+    manager.append_correction("form", "O", "0")
+    path = tmp_path / "form.json"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    recompiled = manager.load_compiled("form")
+    assert recompiled is not compiled
+    assert recompiled.corrections.apply("1O") == "10"
+
+
+def test_reference_features_are_saved_with_the_template(tmp_path, monkeypatch):
+    import os
+
+    import cv2
+    import numpy as np
+
+    from core import preprocess
+
+    image = np.full((120, 160, 3), 255, dtype=np.uint8)
+    cv2.putText(image, "FORM", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    cv2.circle(image, (120, 90), 15, (0, 0, 0), -1)
+    image_path = tmp_path / "form.png"
+    cv2.imwrite(str(image_path), image)
+
+    manager = TemplateManager(template_dir=str(tmp_path))
+    manager.save("form", {"name": "form", "rois": {}, "template_image_path": str(image_path)})
+    assert (tmp_path / "form.npz").exists()
+
+    # 保存済みの特徴量を読み込み、参照画像の解析は行わない
+    def fail(_):
+        raise AssertionError("reference image analysed again")
+
+    monkeypatch.setattr(preprocess, "reference_features", fail)
+    reference = manager.load_compiled("form").reference
+    assert reference is not None and len(reference.points) > 0
+    assert reference.gray.shape == (120, 160)
+    monkeypatch.undo()
+
+    # 参照画像が差し替えられたら再計算する
+    cv2.imwrite(str(image_path), image[:, ::-1])
+    stat = image_path.stat()
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    updated = manager.load_compiled("form").reference
+    assert not np.array_equal(updated.gray, reference.gray)
+
+
+def test_rank_templates_weights_and_refresh(tmp_path, monkeypatch):
+    import os
+
+    manager = TemplateManager(template_dir=str(tmp_path))
+    manager.save("invoice", {"name": "invoice", "keywords": ["請求書", {"keyword": "御中", "weight": 0.5}], "rois": {}})
+    manager.save("receipt", {"name": "receipt", "keywords": [{"keyword": "領収書", "weight": 3}, "御中"], "rois": {}})
+    manager.save("other", {"name": "other", "keywords": ["見積書"], "rois": {}})
+
+    text = "株式会社A 御中 請求書 (領収書在中)"
+    assert manager.rank_templates(text) == [("receipt", 4.0), ("invoice", 1.5)]
+    assert manager.rank_templates(text, k=1) == [("receipt", 4.0)]
+    assert manager.detect_template("請求書")[0] == "invoice"
+
+    # 変更のないテンプレートは読み直さない
+    loads = []
+    original = TemplateManager.load
+
+    def counting_load(self, name):
+        loads.append(name)
+        return original(self, name)
+
+    monkeypatch.setattr(TemplateManager, "load", counting_load)
+    manager.rank_templates(text)
+    assert loads == []
+    path = tmp_path / "other.json"
+    manager.save("other", {"name": "other", "keywords": ["領収書", "請求書"], "rois": {}})
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    loads.clear()
+    assert manager.rank_templates(text)[1] == ("other", 2.0)
+    assert loads == ["other"]
+
+    (tmp_path / "receipt.json").unlink()
+    assert [name for name, _ in manager.rank_templates(text)] == ["other", "invoice"]
+
+
+def test_keyword_editor_syntax():
+    from core.keyword_index import format_keywords, parse_keywords
+
+    keywords = parse_keywords("請求書^2, 御中, a^b, ")
+    assert keywords == [{"keyword": "請求書", "weight": 2.0}, "御中", "a^b"]
+    assert format_keywords(keywords) == "請求書^2, 御中, a^b"
+
+
+def _form(seed):
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    page = np.full((800, 600, 3), 255, dtype=np.uint8)
+    y = 40
+    while y < 740:
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.putText(page, f"Label {rng.integers(0, 999)}", (int(rng.integers(20, 200)), y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+        elif kind == 1:
+            cv2.rectangle(page, (int(rng.integers(15, 100)), y - 15), (int(rng.integers(350, 575)), y + 40), (0, 0, 0), 2)
+        else:
+            cv2.line(page, (20, y), (575, y), (0, 0, 0), 1)
+        y += int(rng.integers(30, 80))
+    return page
+
+
+def test_detect_template_image_without_ocr(tmp_path, monkeypatch):
+    import cv2
+    import numpy as np
+
+    from core import template_manager as tm
+
+    manager = TemplateManager(template_dir=str(tmp_path))
+    forms = {}
+    for seed, name in enumerate(["invoice", "receipt", "order"]):
+        forms[name] = _form(seed)
+        cv2.imwrite(str(tmp_path / f"{name}.png"), forms[name])
+        manager.save(name, {"name": name, "rois": {}, "template_image_path": str(tmp_path / f"{name}.png")})
+    manager.save("no_image", {"name": "no_image", "keywords": ["x"], "rois": {}})
+    with np.load(tmp_path / "invoice.npz") as f:
+        assert {"layout_hash", "pooled"} <= set(f.files)
+
+    # 記入済みで少しずれたページ
+    page = forms["receipt"].copy()
+    cv2.putText(page, "12,345", (300, 200), cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, 1, (40, 40, 40), 2)
+    page = cv2.warpAffine(page, np.float32([[1, 0, 6], [0, 1, -4]]), (600, 800), borderValue=(255, 255, 255))
+
+    ranked = manager.rank_images(page)
+    assert [name for name, _ in ranked][0] == "receipt"
+    assert len(ranked) == 3
+    assert manager.detect_template_image(page)[0] == "receipt"
+
+    # 指紋は索引に保持され、参照画像を読み直さない
+    monkeypatch.setattr(tm, "_read_image", lambda path: (_ for _ in ()).throw(AssertionError(path)))
+    assert manager.detect_template_image(page)[0] == "receipt"
+    monkeypatch.undo()
+
+    # 白紙のように判別できないページはOCRによる判定に回す
+    blank = np.full((800, 600, 3), 255, dtype=np.uint8)
+    assert manager.detect_template_image(blank) is None
+    monkeypatch.setattr(tm.settings, "FINGERPRINT_MIN_MARGIN", 1.0)
+    assert manager.detect_template_image(page) is None
+    monkeypatch.setattr(tm.settings, "FINGERPRINT_DETECTION", False)
+    assert manager.detect_template_image(page) is None
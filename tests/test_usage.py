@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from core import preprocess
+from core.db_manager import DBManager
+from core.mock_openai import MockConfig, MockOpenAIServer
+from core.ocr_agent import OcrAgent
+from core.ocr_bridge import GPT4oMiniVisionOCR, GPT4oNanoVisionOCR, OpenAIVisionOCR
+from core.rate_limit import AdaptiveRateLimiter
+from core.template_manager import TemplateManager
+from core.usage import BudgetExceededError, UsageRecord, estimate_cost
+
+
+def test_cost_estimate():
+    assert estimate_cost("gpt-4.1-mini", 1_000_000, 0) == pytest.approx(0.40)
+    assert estimate_cost("unknown", 1000, 1000) == 0.0
+    record = UsageRecord("gpt-4.1-nano", 1_000_000, 1_000_000, 85, 0.1, discount=0.5)
+    assert record.cost == pytest.approx(0.25)
+
+
+def test_usage_recorded_per_roi_and_budget(tmp_path, monkeypatch):
+    os.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "estimate_skew", lambda img, max_dim=None: 0.0)
+    db = DBManager(str(tmp_path / "ocr.db"))
+    db.initialize()
+    agent = OcrAgent(db=db, templates=TemplateManager(template_dir=str(tmp_path / "templates")))
+    image = np.random.default_rng(0).integers(0, 255, (40, 40, 3), dtype=np.uint8)
+    template = {"name": "invoice", "rois": {"a": {"box": [0, 0, 20, 20]}, "b": {"box": [20, 20, 20, 20]}}}
+
+    with MockOpenAIServer(MockConfig(latency=0.01)) as server:
+        def engine(cls):
+            return cls(limiter=AdaptiveRateLimiter(), base_url=server.base_url)
+
+        _, workspace = agent.process_document(
+            image, "doc.png", template, engine(GPT4oMiniVisionOCR), engine(GPT4oNanoVisionOCR)
+        )
+
+    rows = db.usage_summary("roi")
+    assert sorted(r["roi_name"] for r in rows) == ["a", "b"]
+    assert all(r["calls"] == 2 and r["prompt_tokens"] > 0 for r in rows)
+    (job,) = db.usage_summary("job")
+    assert job["template_name"] == "invoice"
+    assert job["cost_usd"] > 0
+    with open(Path(workspace) / "stats.json", encoding="utf-8") as f:
+        assert json.load(f)["usage"]["calls"] == 4
+
+    agent.daily_token_budget = 1
+    with pytest.raises(BudgetExceededError):
+        agent.process_document(image, "doc2.png", template, GPT4oMiniVisionOCR())
+    db.close()
+
+
+def test_prompt_estimate_uses_the_prompt_sent():
+    from core.ocr_bridge import BATCH_OCR_PROMPT, OCR_PROMPT, _prompt_chars
+
+    body = {
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": BATCH_OCR_PROMPT},
+                    {"type": "text", "text": "field: a"},
+                    {"type": "image_url", "image_url": {"url": "data:"}},
+                ],
+            }
+        ]
+    }
+    assert _prompt_chars(body) == len(BATCH_OCR_PROMPT) + len("field: a")
+    assert _prompt_chars(body) > len(OCR_PROMPT)